@@ -81,6 +81,20 @@ def get_trans_rot_projector(cart_coords, masses):
     return P
 
 
+def project_trans_rot(matrix, cart_coords, masses):
+    """Project translation and rotation out of a mass-weighted matrix.
+
+    Equivalent to P^T.matrix.P with P from get_trans_rot_projector, but
+    P = 1 - V^T.V is never formed. Only products with the (at most six)
+    translation/rotation vectors V are required, so the cost is O(N²)
+    instead of O(N³).
+    """
+    V = get_trans_rot_vectors(cart_coords, masses=masses)
+    VM = V.dot(matrix)
+    MVt = matrix.dot(V.T)
+    return matrix - V.T.dot(VM) - MVt.dot(V) + V.T.dot(VM.dot(V.T)).dot(V)
+
+
 class Geometry:
 
     coord_types = {
@@ -148,10 +162,6 @@ class Geometry:
         self.calculator = None
 
         self.masses = np.array([MASS_DICT[atom.lower()] for atom in self.atoms])
-        self.total_mass = sum(self.masses)
-        # Some of the analytical potentials are only 2D
-        repeat_masses = 2 if (self._coords.size == 2) else 3
-        self.masses_rep = np.repeat(self.masses, repeat_masses)
 
     @property
     def sum_formula(self):
@@ -311,19 +321,39 @@ class Geometry:
             self.clear()
         self.calculator = calculator
 
+    @property
+    def masses(self):
+        return self._masses
+
+    @masses.setter
+    def masses(self, masses):
+        """Set atomic masses and the derived per-coordinate quantities.
+
+        masses_rep holds every mass once per Cartesian component. Mass-weighting
+        of vectors and matrices is done by broadcasting with these vectors, so
+        no diagonal mass matrices have to be built."""
+        self._masses = np.array(masses, dtype=float)
+        self.total_mass = sum(self._masses)
+        # Some of the analytical potentials are only 2D
+        repeat_masses = 2 if (self._coords.size == 2) else 3
+        self.masses_rep = np.repeat(self._masses, repeat_masses)
+        self.masses_rep_sqrt = np.sqrt(self.masses_rep)
+        self.masses_rep_sqrt_inv = 1 / self.masses_rep_sqrt
+
     @property
     def mm_inv(self):
         """Inverted mass matrix.
 
         Returns a diagonal matrix containing the inverted atomic
-        masses.
+        masses. Prefer broadcasting with 1/masses_rep for mass-weighting.
         """
         return np.diag(1/self.masses_rep)
 
     @property
     def mm_sqrt_inv(self):
-        """Inverted square root of the mass matrix."""
-        return np.diag(1/(self.masses_rep**0.5))
+        """Inverted square root of the mass matrix. Prefer broadcasting
+        with masses_rep_sqrt_inv for mass-weighting."""
+        return np.diag(self.masses_rep_sqrt_inv)
 
     @property
     def coords(self):
@@ -708,7 +738,9 @@ class Geometry:
         # self._hessian = hessian
 
     def mass_weigh_hessian(self, hessian):
-        return self.mm_sqrt_inv.dot(hessian).dot(self.mm_sqrt_inv)
+        # M^(-1/2) H M^(-1/2), with M^(-1/2) applied to rows and columns
+        m_sqrt_inv = self.masses_rep_sqrt_inv
+        return m_sqrt_inv[:, None] * hessian * m_sqrt_inv[None, :]
 
     @property
     def mw_hessian(self):
@@ -739,8 +771,8 @@ class Geometry:
         hessian : np.array
             2d array containing the hessian.
         """
-        mm_sqrt = np.diag(self.masses_rep**0.5)
-        return mm_sqrt.dot(mw_hessian).dot(mm_sqrt)
+        m_sqrt = self.masses_rep_sqrt
+        return m_sqrt[:, None] * mw_hessian * m_sqrt[None, :]
 
     def set_h5_hessian(self, fn):
         with h5py.File(fn, "r") as handle:
@@ -770,8 +802,7 @@ class Geometry:
         return get_trans_rot_vectors(self.cart_coords, masses=self.masses)
 
     def eckart_projection(self, mw_hessian):
-        P = get_trans_rot_projector(self.cart_coords, masses=self.masses)
-        return P.T.dot(mw_hessian).dot(P)
+        return project_trans_rot(mw_hessian, self.cart_coords, masses=self.masses)
 
     def calc_energy_and_forces(self):
         """Force a calculation of the current energy and forces."""
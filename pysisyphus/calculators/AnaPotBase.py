@@ -21,11 +21,30 @@ class AnaPotBase(Calculator):
             minima = list()
         self.minima = np.array(minima, dtype=float)
 
+        self.V_str = V_str
+        self.use_sympify = use_sympify
+        self.lambdify()
+
+        self.fake_atoms = ("X", ) # X, dummy atom
+
+        self.analytical_2d = True
+        self.energy_calcs = 0
+        self.forces_calcs = 0
+        self.hessian_calcs = 0
+
+        # Dummies
+        self.mult = 1
+        self.charge = 0
+
+    # Names of the attributes holding lambdified functions
+    lambdified = "V dVdx dVdy dVdxdx dVdxdy dVdydy".split()
+
+    def lambdify(self):
         x, y = symbols("x y")
-        if use_sympify:
-            V = sympify(V_str)
+        if self.use_sympify:
+            V = sympify(self.V_str)
         else:
-            V = V_str
+            V = self.V_str
         dVdx = diff(V, x)
         dVdy = diff(V, y)
         self.V = lambdify((x, y), V, "numpy")
@@ -40,16 +59,17 @@ class AnaPotBase(Calculator):
         self.dVdxdy = lambdify((x, y), dVdxdy, "numpy")
         self.dVdydy = lambdify((x, y), dVdydy, "numpy")
 
-        self.fake_atoms = ("X", ) # X, dummy atom
-
-        self.analytical_2d = True
-        self.energy_calcs = 0
-        self.forces_calcs = 0
-        self.hessian_calcs = 0
-
-        # Dummies
-        self.mult = 1
-        self.charge = 0
+    def __getstate__(self):
+        # Lambdified functions can't be pickled. They are recreated from
+        # the potential in __setstate__, e.g., in worker processes.
+        state = self.__dict__.copy()
+        for key in self.lambdified:
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lambdify()
 
     def get_energy(self, atoms, coords):
         self.energy_calcs += 1
@@ -1,3 +1,5 @@
+import asyncio
+import contextlib
 import logging
 import os
 from pathlib import Path
@@ -11,6 +13,7 @@ from natsort import natsorted
 
 from pysisyphus.config import Config
 from pysisyphus.constants import BOHR2ANG
+from pysisyphus.numhess import numerical_hessian
 
 
 class Calculator:
@@ -117,8 +120,11 @@ class Calculator:
         raise Exception("Not implemented!")
 
     def get_hessian(self, atoms, coords):
-        """Meant to be extended."""
-        raise Exception("Not implemented!")
+        """Meant to be extended.
+
+        Falls back to a numerical Hessian from finite differences of forces.
+        """
+        return numerical_hessian(self, atoms, coords)
 
     def make_fn(self, name, counter=None, return_str=False):
         """Make a full filename.
@@ -325,8 +331,75 @@ class Calculator:
             from TDDFT.
         """
 
+        path, args, env = self.prepare_run(inp, add_args=add_args, env=env,
+                                           cmd=cmd, symlink=symlink)
+        with open(path / self.out_fn, "w") as handle:
+            result = subprocess.Popen(args, cwd=path,
+                                      stdout=handle, stderr=subprocess.PIPE,
+                                      env=env, shell=shell)
+            result.wait()
+        return self.finish_run(path, inp, calc, hold=hold, keep=keep,
+                               inc_counter=inc_counter, run_after=run_after,
+                               parser_kwargs=parser_kwargs)
+
+    async def run_async(self, inp, calc, add_args=None, env=None, shell=False,
+                        hold=False, keep=True, cmd=None, inc_counter=True,
+                        run_after=True, parser_kwargs=None, symlink=True,
+                        budget=None):
+        """Run a calculation without blocking the event loop.
+
+        Coroutine version of ``self.run()`` with the same arguments. The
+        external program is started with asyncio and its stdout is streamed
+        into the output file, so several calculations can run concurrently,
+        e.g., via ``pysisyphus.executors.run_batch()``.
+
+        Parameters
+        ----------
+        budget : pysisyphus.executors.CoreBudget, optional
+            When given, the program is only started after ``self.pal`` cores
+            could be reserved from the budget.
+
+        Returns
+        -------
+        results : dict
+            Same as ``self.run()``.
+        """
+
+        path, args, env = self.prepare_run(inp, add_args=add_args, env=env,
+                                           cmd=cmd, symlink=symlink)
+        reserve = budget.reserve(self.pal) if budget else contextlib.nullcontext()
+        async with reserve:
+            with open(path / self.out_fn, "w") as handle:
+                # Same program call as subprocess.Popen(args, shell=shell)
+                if shell:
+                    args = ["/bin/sh", "-c", *args]
+                proc = await asyncio.create_subprocess_exec(
+                    *args, cwd=path, stdout=handle, stderr=subprocess.PIPE,
+                    env=env,
+                )
+                await proc.communicate()
+        # Nothing is awaited from here on, so calculations finishing on the
+        # same calculator are kept and counted one after another.
+        return self.finish_run(path, inp, calc, hold=hold, keep=keep,
+                               inc_counter=inc_counter, run_after=run_after,
+                               parser_kwargs=parser_kwargs)
+
+    def prepare_run(self, inp, add_args=None, env=None, cmd=None, symlink=True):
+        """Prepare the temporary directory and program call for a calculation.
+
+        Returns
+        -------
+        path : Path
+            Temporary directory of the calculation.
+        args : list
+            Program call.
+        env : Environment
+            Environment for the program call.
+        """
         self.backup_dir = None
         path = self.prepare(inp)
+        # The prepared path is only used once.
+        self.path_already_prepared = None
         self.log(f"Running in {path} on {platform.node()}")
         if cmd:
             args = [cmd, self.inp_fn]
@@ -336,28 +409,28 @@ class Calculator:
             args.extend(add_args)
         if not env:
             env = os.environ.copy()
-        with open(path / self.out_fn, "w") as handle:
-            if symlink:
-                # We can't use resolve here as a previous symlink may already
-                # exist. Calling resolve would translate this to the original
-                # out file in some tempdir (that is already deleted ...).
-                # sym_fn = Path("cur_out").resolve()
-                sym_fn = self.out_dir / "cur_out"
-                try:
-                    os.remove(sym_fn)
-                except FileNotFoundError:
-                    pass
-
-                try:
-                    os.symlink(path / self.out_fn, sym_fn)
-                    self.log(f"Created symlink in '{sym_fn}'")
-                # This may happen if we use a dask scheduler
-                except FileExistsError:
-                    self.log("Symlink already exists. Skipping generation.")
-            result = subprocess.Popen(args, cwd=path,
-                                      stdout=handle, stderr=subprocess.PIPE,
-                                      env=env, shell=shell)
-            result.wait()
+        if symlink:
+            # We can't use resolve here as a previous symlink may already
+            # exist. Calling resolve would translate this to the original
+            # out file in some tempdir (that is already deleted ...).
+            # sym_fn = Path("cur_out").resolve()
+            sym_fn = self.out_dir / "cur_out"
+            try:
+                os.remove(sym_fn)
+            except FileNotFoundError:
+                pass
+
+            try:
+                os.symlink(path / self.out_fn, sym_fn)
+                self.log(f"Created symlink in '{sym_fn}'")
+            # This may happen if we use a dask scheduler
+            except FileExistsError:
+                self.log("Symlink already exists. Skipping generation.")
+        return path, args, env
+
+    def finish_run(self, path, inp, calc, hold=False, keep=True,
+                   inc_counter=True, run_after=True, parser_kwargs=None):
+        """Parse the results of a finished calculation and clean up."""
         try:
             if run_after:
                 self.run_after(path)
@@ -383,7 +456,6 @@ class Calculator:
                 if inc_counter:
                     self.calc_counter += 1
 
-        self.path_already_prepared = None
         self.last_run_path = path
         return results
 
@@ -86,6 +86,3 @@ class ExternalPotential(Calculator):
         results["energy"] += potential_energy
         results["forces"] += potential_forces
         return results
-
-    def get_hessian(self, atoms, coords):
-        raise Exception("Hessian is not implemented for ExternalPotential!")
@@ -1,49 +1,115 @@
 import numpy as np
-from scipy.spatial.distance import pdist, squareform
+from scipy.spatial import cKDTree
 
 from pysisyphus.calculators.Calculator import Calculator
+from pysisyphus.calculators.LennardJones import scatter_pair_gradient
 
 
-class IDPPCalculator(Calculator):
+def get_idpp_pairs(coords3d_list, cutoff=None):
+    """Index arrays (a, b) with a < b of the atom pairs in the IDPP objective.
 
-    def __init__(self, target): 
-        self.target = squareform(target)
+    Without a cutoff all pairs are returned, in the order of a condensed
+    distance matrix as returned by scipy's pdist. With a cutoff only pairs
+    that are closer than the cutoff in any of the given geometries are kept.
+    """
+    atom_num = len(coords3d_list[0])
+    if cutoff is None:
+        return np.triu_indices(atom_num, k=1)
 
-        super().__init__(base_name="idpp")
+    pairs = np.concatenate(
+        [
+            cKDTree(coords3d).query_pairs(cutoff, output_type="ndarray")
+            for coords3d in coords3d_list
+        ]
+    )
+    # Unique pairs, sorted like a condensed distance matrix
+    pairs = np.unique(pairs.reshape(-1, 2), axis=0)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def get_pair_distances(coords3d, pairs):
+    """Distances of the given pairs. Also works for a batch of geometries
+    with shape (n_images, n_atoms, 3)."""
+    a, b = pairs
+    return np.linalg.norm(coords3d[..., a, :] - coords3d[..., b, :], axis=-1)
 
-    def get_forces(self, atoms, coords):
-        coords_reshaped = coords.reshape((-1, 3))
 
-        D = []
-        for c in coords_reshaped:
-            Di = coords_reshaped - c
-            D.append(Di)
-        D = np.array(D)
+def idpp_energies_forces(coords3d, targets, pairs):
+    """IDPP objective for a batch of images.
 
-        curr_pdist = pdist(coords_reshaped)
-        curr_square = squareform(curr_pdist)
-        curr_diff = curr_square - self.target
+    Parameters
+    ----------
+    coords3d : np.array, shape (n_images, n_atoms, 3)
+        Cartesian coordinates of all images.
+    targets : np.array, shape (n_images, n_pairs)
+        Target distances of the pairs for every image.
+    pairs : tuple of np.array
+        Index arrays (a, b) of the considered atom pairs.
 
-        curr_square = curr_square + np.eye(curr_square.shape[0])
+    Returns
+    -------
+    energies : np.array, shape (n_images, )
+        IDPP energies Σ (r - r_target)² / r⁴ of all images.
+    forces : np.array, shape (n_images, n_atoms, 3)
+        Negative gradients of the energies.
+    """
+    image_num, atom_num, _ = coords3d.shape
+    a, b = pairs
+    diffs = coords3d[:, a] - coords3d[:, b]  # Shape: (n_images, n_pairs, 3)
+    rs = np.linalg.norm(diffs, axis=2)
+    devs = rs - targets
 
-        # The bigger the differences 'curr_diff', the bigger the energy.
-        # The smaller the current distances 'current_pdist', the bigger
-        # the energy.
-        energy = 0.5 * (curr_diff**2 / curr_square**4).sum()
+    # The bigger the deviations 'devs', the bigger the energy.
+    # The smaller the current distances 'rs', the bigger the energy.
+    energies = (devs**2 / rs**4).sum(axis=1)
+
+    # dE/dr = 2 * dev * (1 - 2 * dev / r) / r**4 and dr/dx_a = (x_a - x_b) / r
+    prefactors = 2 * devs * (1 - 2 * devs / rs) / rs**5
+    products = (prefactors[..., None] * diffs).reshape(-1, 3)
+    # Atom indices in the flattened batch of images
+    offsets = (atom_num * np.arange(image_num))[:, None]
+    batch_a = (a + offsets).flatten()
+    batch_b = (b + offsets).flatten()
+    gradient = scatter_pair_gradient(
+        products, batch_a, batch_b, image_num * atom_num
+    )
+    forces = -gradient.reshape(image_num, atom_num, 3)
+    return energies, forces
+
+
+class IDPPCalculator(Calculator):
 
-        # Adapted from ASE IDPP calculator
-        # https://gitlab.com/ase/ase/blob/master/ase/neb.py, GPL2
-        forces = -2 * ((curr_diff *
-                       (1 - 2 * curr_diff / curr_square) /
-                        curr_square**5)[...,np.newaxis] * D).sum(0)
+    def __init__(self, target, pairs=None):
+        """Image dependent pair potential.
+
+        Parameters
+        ----------
+        target : np.array
+            Target distances. Without 'pairs' a condensed distance matrix
+            as returned by scipy's pdist.
+        pairs : tuple of np.array, optional
+            Index arrays (a, b) of the atom pairs belonging to 'target'.
+        """
+        self.target = np.asarray(target)
+        self.pairs = pairs
+
+        super().__init__(base_name="idpp")
+
+    def get_pairs(self, atom_num):
+        if self.pairs is None:
+            self.pairs = np.triu_indices(atom_num, k=1)
+        return self.pairs
+
+    def get_forces(self, atoms, coords):
+        coords3d = coords.reshape(1, -1, 3)
+        pairs = self.get_pairs(coords3d.shape[1])
+        energies, forces = idpp_energies_forces(coords3d, self.target[None, :], pairs)
 
         results = {
-            "energy" : energy,
+            "energy" : energies[0],
             "forces": forces.flatten()
         }
         return results
 
     def __str__(self):
         return "IDPP calculator"
-
-
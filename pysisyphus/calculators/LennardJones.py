@@ -1,13 +1,60 @@
 import numpy as np
+from scipy.spatial import cKDTree
 
 from pysisyphus.calculators.Calculator import Calculator
 
 
+def scatter_pair_gradient(products, a, b, num):
+    """Sum pair contributions into a gradient of shape (num, 3).
+
+    Every pair (a[i], b[i]) adds products[i] to the gradient of particle
+    a[i] and subtracts it from the gradient of particle b[i]."""
+    gradient = np.zeros((num, 3))
+    for i in range(3):
+        gradient[:, i] = np.bincount(a, products[:, i], minlength=num) - np.bincount(
+            b, products[:, i], minlength=num
+        )
+    return gradient
+
+
+class VerletList:
+    """Verlet neighbour list with a skin distance.
+
+    Holds all particle pairs closer than rc + skin, found by a neighbour
+    search in a KD-tree. As long as no particle moved by more than skin/2
+    since the list was built, it still contains all pairs closer than rc,
+    so it can be reused over many optimization or MD steps.
+    """
+
+    def __init__(self, rc, skin=1.0):
+        self.rc = rc
+        self.skin = skin
+
+        self.ref_coords3d = None
+        self.pairs = None
+        self.builds = 0
+
+    def needs_rebuild(self, coords3d):
+        if (self.ref_coords3d is None) or (self.ref_coords3d.shape != coords3d.shape):
+            return True
+        max_displ = np.linalg.norm(coords3d - self.ref_coords3d, axis=1).max()
+        return max_displ > self.skin / 2
+
+    def get_pairs(self, coords3d):
+        """Index arrays (a, b) with a < b of all pairs in the list."""
+        if self.needs_rebuild(coords3d):
+            tree = cKDTree(coords3d)
+            self.pairs = tree.query_pairs(self.rc + self.skin, output_type="ndarray")
+            self.ref_coords3d = coords3d.copy()
+            self.builds += 1
+        return self.pairs[:, 0], self.pairs[:, 1]
+
+
 class LennardJones(Calculator):
 
     # Corresponds to σ = 1 Å, as the default value in ASE, but
     # pysisyphus uses au/Bohr.
-    def __init__(self, sigma=1.8897261251, epsilon=1, rc=None):
+    def __init__(self, sigma=1.8897261251, epsilon=1, rc=None, skin=1.0):
         super().__init__()
 
         self.sigma = sigma
@@ -16,20 +63,28 @@ class LennardJones(Calculator):
         if rc is None:
             rc = 3 * self.sigma
         self.rc = rc
+        # Pairs within the cutoff are taken from a Verlet list
+        self.neighbours = VerletList(self.rc, skin=skin)
         # Shift energy
         self.e0 = (4 * self.epsilon *
                    ((self.sigma/self.rc)**12 - (self.sigma/self.rc)**6)
         )
 
     def calculate(self, coords3d):
-        # Index pairs
-        a, b = np.triu_indices(len(coords3d), 1)
+        # Index pairs from the neighbour list
+        a, b = self.neighbours.get_pairs(coords3d)
 
         # Distances
-        diffs = coords3d[a] - coords3d[b]  # Shape: (N_atoms, 3)
+        diffs = coords3d[a] - coords3d[b]  # Shape: (N_pairs, 3)
         rs = np.linalg.norm(diffs, axis=1)
-        c6 = np.where(rs <= self.rc, (self.sigma/rs)**6, np.zeros_like(rs))
-        energy = -self.e0 * (c6 != 0.0).sum()
+        # Only keep pairs within the cutoff
+        within = rs <= self.rc
+        a = a[within]
+        b = b[within]
+        diffs = diffs[within]
+        rs = rs[within]
+        c6 = (self.sigma/rs)**6
+        energy = -self.e0 * rs.size
         c12 = c6**2
         energy += np.sum(4*self.epsilon * (c12 - c6))
 
@@ -61,11 +116,8 @@ class LennardJones(Calculator):
         prefactors = 24*self.epsilon * (c6 - 2*c12) / rs**2
         products = prefactors[:,None] * diffs
 
-        gradient = np.zeros_like(coords3d)
         # Every pair (a, b) contributes to the total gradient of atoms a and b.
-        for i, prod in enumerate(products):
-            gradient[a[i]] += prod
-            gradient[b[i]] -= prod
+        gradient = scatter_pair_gradient(products, a, b, len(coords3d))
 
         return energy, -gradient
 
@@ -2,7 +2,7 @@ import numpy as np
 
 from pysisyphus.constants import ANG2BOHR, AU2KJPERMOL
 from pysisyphus.calculators.Calculator import Calculator
-from pysisyphus.calculators.LennardJones import LennardJones
+from pysisyphus.calculators.LennardJones import LennardJones, scatter_pair_gradient
 
 # [1] https://aip.scitation.org/doi/abs/10.1063/1.445869
 #     Jorgensen, 1983
@@ -75,11 +75,8 @@ class TIP3P(Calculator):
         # derivative of 1/r**n.
         products = (pair_energies / rs**2)[:, None] * diffs
 
-        gradient = np.zeros_like(coords3d)
         # Every pair (a, b) contributes to the total gradient of atoms a and b.
-        for i, prod in enumerate(products):
-            gradient[a[i]] -= prod
-            gradient[b[i]] += prod
+        gradient = scatter_pair_gradient(products, b, a, len(coords3d))
 
         return energy, -gradient
 
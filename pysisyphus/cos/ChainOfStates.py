@@ -1,10 +1,10 @@
 from copy import copy
 import logging
 
-from distributed import Client
 import numpy as np
 from scipy.interpolate import interp1d, splprep, splev
 
+from pysisyphus.executors import get_executor
 from pysisyphus.helpers import align_coords, get_coords_diffs
 from pysisyphus.helpers_pure import hash_arr
 from pysisyphus.modefollow import geom_lanczos
@@ -28,6 +28,8 @@ class ChainOfStates:
         climb_lanczos=False,
         climb_lanczos_rms=5e-3,
         scheduler=None,
+        executor=None,
+        max_workers=None,
     ):
 
         assert len(images) >= 2, "Need at least 2 images!"
@@ -41,6 +43,11 @@ class ChainOfStates:
         # Must not be lower than climb_rms
         self.climb_lanczos_rms = min(self.climb_rms, climb_lanczos_rms)
         self.scheduler = scheduler
+        # Kind of the executor used for the image calculations. It is created
+        # lazily and kept alive until shutdown_executor() is called.
+        self.executor_kind = executor
+        self.max_workers = max_workers
+        self.executor = None
 
         self._coords = None
         self._forces = None
@@ -195,9 +202,25 @@ class ChainOfStates:
 
         self._energy = energies
 
-    def par_image_calc(self, image):
-        image.calc_energy_and_forces()
-        return image
+    def get_executor(self):
+        if self.executor is None:
+            self.executor = get_executor(
+                self.executor_kind,
+                scheduler=self.scheduler,
+                max_workers=self.max_workers,
+            )
+            self.log(f"Created {self.executor}")
+        return self.executor
+
+    def shutdown_executor(self):
+        """Retrieve the resident calculators from the executor and shut
+        it down."""
+        if self.executor is None:
+            return
+        self.executor.fetch_calculators(self.images)
+        self.executor.shutdown()
+        self.log(f"Shut down {self.executor}")
+        self.executor = None
 
     def set_images(self, indices, images):
         for ind, image in zip(indices, images):
@@ -208,24 +231,15 @@ class ChainOfStates:
         # There may also be calculations for fixed images, as they need an
         # energy value. But every fixed image only needs a calculation once.
         images_to_calculate = self.moving_images
-        image_indices = self.moving_indices
         if self.fix_first and (self.images[0]._energy is None):
             images_to_calculate = [self.images[0]] + images_to_calculate
-            image_indices = [0] + list(image_indices)
         if self.fix_last and (self.images[-1]._energy is None):
             images_to_calculate = images_to_calculate + [self.images[-1]]
-            image_indices = list(image_indices) + [-1]
         assert len(images_to_calculate) <= len(self.images)
 
-        # Parallel calculation with dask
-        if self.scheduler:
-            client = self.get_dask_client()
-            self.log(client)
-            image_futures = client.map(self.par_image_calc, images_to_calculate)
-            self.set_images(image_indices, client.gather(image_futures))
-        # Serial calculation
-        else:
-            [image.calc_energy_and_forces() for image in images_to_calculate]
+        all_results = self.calc_images(images_to_calculate)
+        for image, results in zip(images_to_calculate, all_results):
+            image.set_results(results)
         self.set_zero_forces_for_fixed_images()
         self.counter += 1
 
@@ -234,6 +248,15 @@ class ChainOfStates:
         self.all_energies.append(energies)
         self.all_true_forces.append(forces)
 
+    def calc_images(self, images):
+        """Results of force calculations for the given images."""
+        # The calculators stay resident on the executor's workers, so only
+        # coordinates and results (plus the calculator state) are transferred.
+        executor = self.get_executor()
+        # Drop calculators of images that were removed or replaced.
+        executor.retain([image.calculator for image in self.images])
+        return executor.calc_geoms(images)
+
     @property
     def forces(self):
         self.set_zero_forces_for_fixed_images()
@@ -398,9 +421,6 @@ class ChainOfStates:
     def as_xyz(self, comments=None):
         return "\n".join([image.as_xyz() for image in self.images])
 
-    def get_dask_client(self):
-        return Client(self.scheduler)
-
     def get_hei_index(self, energies=None):
         """Return index of highest energy image."""
         if energies is None:
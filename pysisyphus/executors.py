@@ -0,0 +1,514 @@
+"""Executors to run calculations for several geometries concurrently.
+
+All executors share the same interface. Calculators are registered once
+and stay resident on the workers for the lifetime of an executor, so
+per call only atoms and coordinates are shipped to the workers and only
+the results dictionaries are shipped back. Remote executors also return
+the calculator state (calc_counter and chkfiles) with every result, so the
+local calculators stay in sync and can still be used directly, e.g., for
+Lanczos iterations or to pass chkfiles on to new images. The complete
+calculators can be retrieved from the workers with 'fetch_calculators()'.
+Executors are shut down at interpreter exit at the latest; they can also
+be used as context managers.
+
+Supported kinds are
+
+    serial:  Plain loop in the calling process.
+    thread:  concurrent.futures.ThreadPoolExecutor. Useful for calculators
+             that spend most of their time in external programs.
+    process: Pool of single-process concurrent.futures.ProcessPoolExecutors.
+             Each calculator is pinned to one process.
+    dask:    Every calculator lives in its own dask Actor on a worker of
+             the given scheduler.
+    async:   Calculations are run concurrently in threads driven by an
+             asyncio event loop, without a scheduler. A calculation is only
+             started when as many cores as its calculator's 'pal' are
+             available from a budget of max_workers cores.
+"""
+
+import asyncio
+import atexit
+import concurrent.futures
+import contextlib
+import functools
+import logging
+import os
+
+from distributed import Client, as_completed as dask_as_completed
+
+
+logger = logging.getLogger("executors")
+
+
+# Calculators registered in a worker process of a ProcessExecutor.
+_RESIDENT_CALCS = dict()
+
+
+class CoreBudget:
+    """Number of cores available to concurrently running calculations.
+
+    Every calculation reserves as many cores as its calculator's 'pal'
+    before it is started and returns them when it is finished. Calculations
+    requiring more cores than the whole budget get all of them.
+    """
+
+    def __init__(self, cores=None):
+        if cores is None:
+            cores = os.cpu_count()
+        self.cores = int(cores)
+        assert self.cores > 0, "The core budget must be positive!"
+        self.available = self.cores
+        self._condition = None
+
+    @property
+    def condition(self):
+        # Created lazily, so it belongs to the running event loop.
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    @contextlib.asynccontextmanager
+    async def reserve(self, cores):
+        cores = min(cores, self.cores)
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.available >= cores)
+            self.available -= cores
+        try:
+            yield cores
+        finally:
+            async with self.condition:
+                self.available += cores
+                self.condition.notify_all()
+
+
+async def as_finished(jobs, cores=None):
+    """Run jobs concurrently and yield their results as they finish.
+
+    Parameters
+    ----------
+    jobs : iterable of callables
+        Every job is called with a CoreBudget and must return an awaitable,
+        e.g., ``lambda budget: calc.run_async(inp, "grad", budget=budget)``.
+    cores : int, optional
+        Size of the core budget shared by all jobs. Defaults to the number of
+        CPUs.
+
+    Yields
+    ------
+    index : int
+        Position of the finished job in 'jobs'.
+    results
+        Results of the job.
+    """
+    budget = CoreBudget(cores)
+
+    async def indexed(index, job):
+        return index, await job(budget)
+
+    tasks = [asyncio.ensure_future(indexed(i, job)) for i, job in enumerate(jobs)]
+    try:
+        for next_finished in asyncio.as_completed(tasks):
+            yield await next_finished
+    finally:
+        # Don't leave jobs behind when a job failed.
+        for task in tasks:
+            task.cancel()
+
+
+def run_batch(jobs, cores=None, callback=None):
+    """Blocking wrapper around as_finished().
+
+    Results are returned in the order of 'jobs'. When given, 'callback' is
+    called with the index and the results of every job as soon as it finished.
+    """
+
+    async def collect():
+        all_results = [None for _ in jobs]
+        async for index, results in as_finished(jobs, cores=cores):
+            all_results[index] = results
+            if callback is not None:
+                callback(index, results)
+        return all_results
+
+    jobs = list(jobs)
+    return asyncio.run(collect())
+
+
+def map_jobs(func, args_list, kind=None, scheduler=None, max_workers=None):
+    """Run independent function calls and yield their results as they finish.
+
+    Unlike the executor classes no calculators are kept on the workers, every
+    job is a plain call func(*args). With the "process" and "dask" kinds
+    'func' and the arguments must be picklable.
+
+    Parameters
+    ----------
+    func : callable
+        Function that is called for every item of 'args_list'.
+    args_list : iterable of tuples
+        Positional arguments of the jobs.
+    kind : str, optional
+        One of "serial", "thread", "process" or "dask". Defaults to "dask" when
+        a scheduler address is given and to "serial" otherwise.
+    scheduler : str, optional
+        Address of a dask scheduler.
+    max_workers : int, optional
+        Number of workers of the thread and process pools.
+
+    Yields
+    ------
+    index : int
+        Position of the finished job in 'args_list'.
+    result
+        Return value of the job.
+    """
+    if kind is None:
+        kind = "dask" if scheduler else "serial"
+    args_list = list(args_list)
+
+    if kind == "serial":
+        for index, args in enumerate(args_list):
+            yield index, func(*args)
+    elif kind in ("thread", "process"):
+        pool_cls = {
+            "thread": concurrent.futures.ThreadPoolExecutor,
+            "process": concurrent.futures.ProcessPoolExecutor,
+        }[kind]
+        with pool_cls(max_workers=max_workers) as pool:
+            futures = {
+                pool.submit(func, *args): index
+                for index, args in enumerate(args_list)
+            }
+            for future in concurrent.futures.as_completed(futures):
+                yield futures[future], future.result()
+    elif kind == "dask":
+        assert scheduler, "Dask jobs require a scheduler address!"
+        with Client(scheduler) as client:
+            futures = {
+                client.submit(func, *args, pure=False): index
+                for index, args in enumerate(args_list)
+            }
+            for future in dask_as_completed(futures):
+                yield futures[future], future.result()
+    else:
+        raise Exception(f"Invalid job kind '{kind}'! Valid kinds are: "
+                        "serial, thread, process, dask")
+
+
+def get_calc_state(calc):
+    """State of a calculator that changes from calculation to calculation."""
+    state = {
+        "calc_counter": getattr(calc, "calc_counter", None),
+    }
+    try:
+        state["chkfiles"] = calc.get_chkfiles()
+    except AttributeError:
+        pass
+    return state
+
+
+def set_calc_state(calc, state):
+    if state["calc_counter"] is not None:
+        calc.calc_counter = state["calc_counter"]
+    if "chkfiles" in state:
+        calc.set_chkfiles(state["chkfiles"])
+
+
+def _register_calc(key, calc):
+    _RESIDENT_CALCS[key] = calc
+
+
+def _run_resident_calc(key, func_name, atoms, coords, state):
+    calc = _RESIDENT_CALCS[key]
+    set_calc_state(calc, state)
+    results = getattr(calc, func_name)(atoms, coords)
+    return results, get_calc_state(calc)
+
+
+def _fetch_calc(key):
+    return _RESIDENT_CALCS.pop(key)
+
+
+class CalculatorActor:
+    """Wraps a calculator that lives on a dask worker."""
+
+    def __init__(self, calc):
+        self.calc = calc
+
+    def run(self, func_name, atoms, coords, state):
+        set_calc_state(self.calc, state)
+        results = getattr(self.calc, func_name)(atoms, coords)
+        return results, get_calc_state(self.calc)
+
+    def get_calc(self):
+        return self.calc
+
+
+class Executor:
+    kind = None
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+
+        # Keep references to the registered calculators, so their ids
+        # can't be reused while the executor is alive.
+        self.calcs = dict()
+        self.is_shut_down = False
+        atexit.register(self.shutdown)
+
+    def log(self, message):
+        logger.debug(f"{self.__class__.__name__}, {message}")
+
+    def _register(self, key, calc):
+        """Make a calculator resident on a worker."""
+        pass
+
+    def _submit(self, key, func_name, atoms, coords):
+        """Submit one calculation and return a future-like object."""
+        raise NotImplementedError
+
+    def _result(self, key, future):
+        return future.result()
+
+    def _fetch(self, key):
+        """Return a resident calculator and remove it from its worker."""
+        return self.calcs[key]
+
+    def _unregister(self, key):
+        """Remove a calculator from its worker."""
+        pass
+
+    def register(self, calc):
+        key = id(calc)
+        if key not in self.calcs:
+            self._register(key, calc)
+            self.calcs[key] = calc
+            self.log(f"registered calculator '{calc}' with key {key}")
+        return key
+
+    def map(self, calcs, atoms_list, coords_list, func_name="get_forces"):
+        """Run 'func_name' of every calculator with the respective atoms and
+        coordinates. Returns a list of results dictionaries in input order."""
+        keys_futures = list()
+        for calc, atoms, coords in zip(calcs, atoms_list, coords_list):
+            key = self.register(calc)
+            keys_futures.append((key, self._submit(key, func_name, atoms, coords)))
+        return [self._result(key, future) for key, future in keys_futures]
+
+    def calc_geoms(self, geoms, func_name="get_forces"):
+        """Run calculations for a list of geometries at their current
+        Cartesian coordinates. The results are returned, not set."""
+        return self.map(
+            [geom.calculator for geom in geoms],
+            [geom.atoms for geom in geoms],
+            [geom.cart_coords for geom in geoms],
+            func_name=func_name,
+        )
+
+    def retain(self, calcs):
+        """Unregister all calculators that are not in 'calcs', e.g., the ones
+        of images that were removed from a ChainOfStates."""
+        keep_keys = set([id(calc) for calc in calcs])
+        for key in set(self.calcs) - keep_keys:
+            self._unregister(key)
+            calc = self.calcs.pop(key)
+            self.log(f"unregistered calculator '{calc}' with key {key}")
+
+    def fetch_calculators(self, geoms):
+        """Replace the calculators of the given geometries by their
+        resident counterparts from the workers."""
+        for geom in geoms:
+            key = id(geom.calculator)
+            if key not in self.calcs:
+                continue
+            calc = self._fetch(key)
+            del self.calcs[key]
+            if calc is not geom.calculator:
+                geom.set_calculator(calc, clear=False)
+
+    def shutdown(self):
+        if self.is_shut_down:
+            return
+        self._shutdown()
+        self.calcs = dict()
+        self.is_shut_down = True
+        atexit.unregister(self.shutdown)
+
+    def _shutdown(self):
+        """Release the workers."""
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def __str__(self):
+        return f"{self.__class__.__name__}(max_workers={self.max_workers})"
+
+
+class RemoteExecutor(Executor):
+    """Base class for executors whose calculators live in other processes.
+    The local calculator state is sent along with every calculation and the
+    updated state returned with the results is set on the local calculators,
+    so both copies agree on calc_counter and chkfiles."""
+
+    def _result(self, key, future):
+        results, state = future.result()
+        set_calc_state(self.calcs[key], state)
+        return results
+
+
+class SerialExecutor(Executor):
+    kind = "serial"
+
+    def _submit(self, key, func_name, atoms, coords):
+        return getattr(self.calcs[key], func_name)(atoms, coords)
+
+    def _result(self, key, future):
+        return future
+
+
+class ThreadExecutor(Executor):
+    kind = "thread"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_workers
+        )
+
+    def _submit(self, key, func_name, atoms, coords):
+        func = getattr(self.calcs[key], func_name)
+        return self.pool.submit(func, atoms, coords)
+
+    def _shutdown(self):
+        self.pool.shutdown()
+
+
+class ProcessExecutor(RemoteExecutor):
+    """Every worker is a ProcessPoolExecutor with exactly one process, so
+    a registered calculator always stays in the same process."""
+
+    kind = "process"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        if self.max_workers is None:
+            self.max_workers = os.cpu_count()
+        self.pools = [
+            concurrent.futures.ProcessPoolExecutor(max_workers=1)
+            for _ in range(self.max_workers)
+        ]
+        # Map calculator keys to pools
+        self.pool_for_key = dict()
+
+    def _register(self, key, calc):
+        pool = self.pools[len(self.pool_for_key) % len(self.pools)]
+        pool.submit(_register_calc, key, calc).result()
+        self.pool_for_key[key] = pool
+
+    def _submit(self, key, func_name, atoms, coords):
+        pool = self.pool_for_key[key]
+        state = get_calc_state(self.calcs[key])
+        return pool.submit(_run_resident_calc, key, func_name, atoms, coords, state)
+
+    def _fetch(self, key):
+        pool = self.pool_for_key.pop(key)
+        return pool.submit(_fetch_calc, key).result()
+
+    def _unregister(self, key):
+        self._fetch(key)
+
+    def _shutdown(self):
+        for pool in self.pools:
+            pool.shutdown()
+        self.pool_for_key = dict()
+
+
+class DaskExecutor(RemoteExecutor):
+    kind = "dask"
+
+    def __init__(self, scheduler, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.scheduler = scheduler
+        self.client = Client(self.scheduler)
+        self.actors = dict()
+
+    def _register(self, key, calc):
+        self.actors[key] = self.client.submit(
+            CalculatorActor, calc, actor=True, pure=False
+        ).result()
+
+    def _submit(self, key, func_name, atoms, coords):
+        state = get_calc_state(self.calcs[key])
+        return self.actors[key].run(func_name, atoms, coords, state)
+
+    def _fetch(self, key):
+        actor = self.actors.pop(key)
+        return actor.get_calc().result()
+
+    def _unregister(self, key):
+        # Dropping the last reference releases the actor on the worker.
+        del self.actors[key]
+
+    def _shutdown(self):
+        self.actors = dict()
+        self.client.close()
+
+    def __str__(self):
+        return f"{self.__class__.__name__}(scheduler={self.scheduler})"
+
+
+class AsyncExecutor(Executor):
+    """Every call of map() runs one batch of calculations, using the blocking
+    calculator methods in worker threads. The core budget defaults to the
+    number of CPUs."""
+
+    kind = "async"
+
+    @staticmethod
+    async def _run_job(calc, func_name, atoms, coords, budget):
+        async with budget.reserve(getattr(calc, "pal", 1)):
+            return await asyncio.to_thread(getattr(calc, func_name), atoms, coords)
+
+    def map(self, calcs, atoms_list, coords_list, func_name="get_forces"):
+        jobs = list()
+        for calc, atoms, coords in zip(calcs, atoms_list, coords_list):
+            key = self.register(calc)
+            jobs.append(
+                functools.partial(
+                    self._run_job, self.calcs[key], func_name, atoms, coords
+                )
+            )
+        return run_batch(jobs, cores=self.max_workers)
+
+
+EXECUTORS = {
+    "serial": SerialExecutor,
+    "thread": ThreadExecutor,
+    "process": ProcessExecutor,
+    "dask": DaskExecutor,
+    "async": AsyncExecutor,
+}
+
+
+def get_executor(kind=None, scheduler=None, max_workers=None):
+    """Create an executor. Defaults to a DaskExecutor when a scheduler
+    address is given and to a SerialExecutor otherwise."""
+    if kind is None:
+        kind = "dask" if scheduler else "serial"
+    try:
+        executor_cls = EXECUTORS[kind]
+    except KeyError:
+        raise Exception(
+            f"Invalid executor '{kind}'! Valid executors are: {list(EXECUTORS)}"
+        )
+    if kind == "dask":
+        assert scheduler, "DaskExecutor requires a scheduler address!"
+        return executor_cls(scheduler, max_workers=max_workers)
+    return executor_cls(max_workers=max_workers)
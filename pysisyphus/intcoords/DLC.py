@@ -4,6 +4,8 @@
 #     Baker, 1996
 
 import numpy as np
+from scipy.sparse import diags, issparse
+from scipy.sparse.linalg import aslinearoperator
 
 from pysisyphus.intcoords import RedundantCoords
 from pysisyphus.linalg import gram_schmidt
@@ -23,6 +25,8 @@ class DLC(RedundantCoords):
     @U.setter
     def U(self, U):
         self._U = U
+        # B, its inverse and P depend on the active set.
+        self.reset_inversions()
 
     @property
     def constraints(self):
@@ -57,8 +61,15 @@ class DLC(RedundantCoords):
     @property
     def B(self):
         """Wilson B-Matrix in the non-redundant subspace."""
+        if self.sparse:
+            return self.B_prim_sparse.T.dot(self.U).T
         return self.U.T.dot(self.B_prim)
 
+    @property
+    def B_sparse(self):
+        """Wilson B-Matrix in the non-redundant subspace as LinearOperator."""
+        return aslinearoperator(self.U.T) * aslinearoperator(self.B_prim_sparse)
+
     def project_hessian(self, H):
         """As we already work in the non-redundant subspace we don't have
         to project/shift the hessian as we do it for simple redundant
@@ -94,9 +105,11 @@ class DLC(RedundantCoords):
                 f"\tmax(weights)={weights.max():.4f}, "
                 f"min(weights)={weights.min():.4f}, ({len(weights)} primitives)"
             )
-            B = np.diag(weights).dot(B)
+            B = diags(weights).dot(B) if issparse(B) else np.diag(weights).dot(B)
 
         G = B.dot(B.T)
+        if issparse(G):
+            G = G.toarray()
         eigvals, eigvectors = np.linalg.eigh(G)
 
         if inv_thresh is None:
@@ -123,7 +136,8 @@ class DLC(RedundantCoords):
         return eigvectors[:, use_inds]
 
     def set_active_set(self):
-        self.U = self.get_active_set(self.B_prim)
+        B_prim = self.B_prim_sparse if self.sparse else self.B_prim
+        self.U = self.get_active_set(B_prim)
         # Keep a copy of the original active set, in case self.U gets
         # modified by constraint application.
         self.U_unconstrained = self.U.copy()
@@ -35,8 +35,10 @@ class Primitive(metaclass=abc.ABCMeta):
         min_ind = np.argmin([np.dot(cv, x) ** 2 for cv in cross_vecs])
         return cross_vecs[min_ind]
 
-    def set_cross_vec(self, coords3d, indices):
-        self.cross_vec = self._get_cross_vec(coords3d, self.indices)
+    def set_cross_vec(self, coords3d, indices=None):
+        if indices is None:
+            indices = self.indices
+        self.cross_vec = self._get_cross_vec(coords3d, indices)
         self.log(f"Cross vector for {self} set to {self.cross_vec}")
 
     @abc.abstractmethod
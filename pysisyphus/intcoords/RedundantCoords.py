@@ -8,15 +8,20 @@
 import math
 import itertools as it
 import logging
+import time
 
 import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.linalg import norm as sparse_norm
 
-from pysisyphus.linalg import svd_inv
-from pysisyphus.intcoords import Stretch, Torsion
+from pysisyphus.linalg import lsqr_pinv, svd_inv
+from pysisyphus.intcoords import Stretch
 from pysisyphus.intcoords.update import transform_int_step
 from pysisyphus.intcoords.eval import (
     eval_primitives,
     check_primitives,
+    PrimitiveBatch,
+    B_sparse_from_prim_internals,
 )
 from pysisyphus.intcoords.setup import setup_redundant, get_primitives, PrimTypes
 from pysisyphus.intcoords.valid import check_typed_prims
@@ -41,6 +46,9 @@ class RedundantCoords:
         # Corresponds to a threshold of 1e-7 for eigenvalues of G, as proposed by
         # Pulay in [5].
         svd_inv_thresh=3.16e-4,
+        # Use a sparse Wilson B-matrix and iterative solvers in the force
+        # transformation, the back-transformation and vector projection.
+        sparse=False,
     ):
         self.atoms = atoms
         self.coords3d = np.reshape(coords3d, (-1, 3)).copy()
@@ -56,8 +64,14 @@ class RedundantCoords:
         self.min_weight = float(min_weight)
         assert self.min_weight > 0.0, "min_weight must be a positive rational!"
         self.svd_inv_thresh = svd_inv_thresh
+        self.sparse = sparse
 
         self._B_prim = None
+        self._B_prim_sparse = None
+        self._inv_cache = dict()
+        # Number of generalized inverses computed and time spent on them.
+        self.inversion_counter = 0
+        self.inversion_time = 0.0
         # Lists for the other types of primitives will be created afterwards.
         # Linear bends may have been disabled, so we create the list here.
         self.linear_bend_indices = list()
@@ -81,6 +95,8 @@ class RedundantCoords:
             self.bond_factor = -math.log(self.min_weight) + 1
         self.log(f"Using a factor of {self.bond_factor:.6f} for bond detection.")
         self.log(f"Using svd_inv_thresh={self.svd_inv_thresh:.4e} for inversions.")
+        if self.sparse:
+            self.log("Using sparse Wilson B-matrix.")
 
         # Set up primitive coordinate indices
         if typed_prims is None:
@@ -121,7 +137,10 @@ class RedundantCoords:
             self.primitives = [
                 prim for prim in self.primitives if isinstance(prim, Stretch)
             ]
-        check_primitives(self.coords3d, self.primitives, logger=self.logger)
+        # The check relies on the dense B-matrix and a diagonalization of
+        # B^T.B, so it is skipped for sparse B-matrices.
+        if not self.sparse:
+            check_primitives(self.coords3d, self.primitives, logger=self.logger)
 
         self._prim_internals = self.eval(self.coords3d)
         self._prim_coords = np.array(
@@ -148,8 +167,10 @@ class RedundantCoords:
     def coords3d(self, coords3d):
         self._coords3d = coords3d.reshape(-1, 3)
         self._B_prim = None
+        self._B_prim_sparse = None
         self._prim_coords = None
         self._prim_internals = None
+        self.reset_inversions()
 
     @property
     def primitives(self):
@@ -158,6 +179,9 @@ class RedundantCoords:
     @primitives.setter
     def primitives(self, primitives):
         self._primitives = primitives
+        # Vectorized evaluation of the primitives
+        self.prim_batch = PrimitiveBatch(self._primitives)
+        self.reset_inversions()
 
     @property
     def prim_indices(self):
@@ -216,7 +240,10 @@ class RedundantCoords:
     @property
     def B_prim(self):
         """Wilson B-Matrix"""
-        if self._B_prim is None:
+        if self._B_prim is None and self.sparse:
+            # Only primitives with local gradients are available
+            self._B_prim = self.B_prim_sparse.toarray()
+        elif self._B_prim is None:
             self._B_prim = np.array([prim_int.grad for prim_int in self.prim_internals])
 
         return self._B_prim
@@ -226,89 +253,123 @@ class RedundantCoords:
         """Wilson B-Matrix"""
         return self.B_prim
 
+    @property
+    def B_prim_sparse(self):
+        """Wilson B-Matrix in CSR format, built from the local gradients of
+        the primitive internals. Only available with sparse=True."""
+        assert self.sparse, "Sparse B-matrix requires 'sparse=True'!"
+        if self._B_prim_sparse is None:
+            self._B_prim_sparse = B_sparse_from_prim_internals(
+                self.prim_internals, self.coords3d.size
+            )
+        return self._B_prim_sparse
+
+    @property
+    def B_sparse(self):
+        """Wilson B-Matrix in CSR format."""
+        return self.B_prim_sparse
+
+    @property
+    def lsqr_conlim(self):
+        """Condition number limit for LSQR, derived from svd_inv_thresh.
+
+        svd_inv drops singular values of G=B.B^T, i.e., squared singular
+        values of B, below svd_inv_thresh. ||B||_F bounds the largest singular
+        value of B (and of U^T.B in DLC) from above."""
+        return sparse_norm(self.B_prim_sparse) / math.sqrt(self.svd_inv_thresh)
+
+    @property
+    def B_inv_prim_op(self):
+        """Generalized inverse of the sparse primitive Wilson B-Matrix as
+        LinearOperator. Its adjoint is the transposed generalized inverse."""
+        return lsqr_pinv(self.B_prim_sparse, conlim=self.lsqr_conlim)
+
+    @property
+    def B_inv_op(self):
+        """Generalized inverse of the sparse Wilson B-Matrix as LinearOperator."""
+        return lsqr_pinv(self.B_sparse, conlim=self.lsqr_conlim)
+
+    def reset_inversions(self):
+        """Drop all cached generalized inverses."""
+        self._inv_cache = dict()
+
     def inv_B(self, B):
-        return B.T.dot(svd_inv(B.dot(B.T), thresh=self.svd_inv_thresh, hermitian=True))
+        return B.T.dot(self.inv_G(B))
         # return B.T.dot(self.pinv(B.dot(B.T)))
 
     def inv_Bt(self, B):
-        return svd_inv(B.dot(B.T), thresh=self.svd_inv_thresh, hermitian=True).dot(B)
+        return self.inv_G(B).dot(B)
         # return self.pinv(B.dot(B.T)).dot(B)
 
+    def inv_G(self, B):
+        """Generalized inverse of G = B.B^T. B⁺ = B^T.G⁺ and (B^T)⁺ = G⁺.B."""
+        start = time.time()
+        G_inv = svd_inv(B.dot(B.T), thresh=self.svd_inv_thresh, hermitian=True)
+        self.inversion_time += time.time() - start
+        self.inversion_counter += 1
+        return G_inv
+
+    def cached_inv_B(self, key, B_getter):
+        """Generalized inverse of a Wilson B-matrix, cached until the
+        coordinates change. (B^T)⁺ is just the transpose of B⁺, so both are
+        derived from the same inversion of G = B.B^T."""
+        try:
+            B_inv = self._inv_cache[key]
+        except KeyError:
+            B_inv = self.inv_B(B_getter())
+            self._inv_cache[key] = B_inv
+        return B_inv
+
     @property
     def Bt_inv_prim(self):
         """Transposed generalized inverse of the primitive Wilson B-Matrix."""
-        return self.inv_Bt(self.B_prim)
+        return self.B_inv_prim.T
 
     @property
     def Bt_inv(self):
         """Transposed generalized inverse of the Wilson B-Matrix."""
-        return self.inv_Bt(self.B)
+        return self.B_inv.T
 
     @property
     def B_inv_prim(self):
         """Generalized inverse of the primitive Wilson B-Matrix."""
-        return self.inv_B(self.B_prim)
+        return self.cached_inv_B("B_inv_prim", lambda: self.B_prim)
 
     @property
     def B_inv(self):
         """Generalized inverse of the Wilson B-Matrix."""
-        return self.inv_B(self.B)
+        return self.cached_inv_B("B_inv", lambda: self.B)
 
     @property
     def P(self):
         """Projection matrix onto B. See [1] Eq. (4)."""
-        return self.B.dot(self.B_inv)
+        try:
+            P = self._inv_cache["P"]
+        except KeyError:
+            P = self.B.dot(self.B_inv)
+            self._inv_cache["P"] = P
+        return P
 
     def transform_forces(self, cart_forces):
         """Combination of Eq. (9) and (11) in [1]."""
+        if self.sparse:
+            return self.B_inv_op.rmatvec(cart_forces)
         return self.Bt_inv.dot(cart_forces)
 
-    def get_K_matrix(self, int_gradient=None):
+    def get_K_matrix(self, int_gradient=None, sparse=False):
+        """Derivatives of the Wilson B-matrix, contracted with a gradient in
+        primitive internals. Returned as CSR matrix when sparse=True."""
         if int_gradient is not None:
             assert len(int_gradient) == len(self._primitives)
 
         size_ = self.coords3d.size
         if int_gradient is None:
-            return np.zeros((size_, size_))
-
-        K_flat = np.zeros(size_ * size_)
-        coords3d = self.coords3d
-        for primitive, int_grad_item in zip(self.primitives, int_gradient):
-            # Contract with gradient
-            val = np.rad2deg(primitive.calculate(coords3d))
-            # self.log(f"K, {primitive}={val:.2f}°")
-            # The generated code (d2q_d) seems unstable for these values...
-            if isinstance(primitive, Torsion) and ((abs(val) < 1) or (abs(val) > 179)):
-                self.log(f"Skipped 2nd derivative of {primitive} with val={val:.2f}°")
-                continue
-            # 2nd derivative of normal, but linear, bends is undefined.
-            try:
-                dg = int_grad_item * primitive.jacobian(coords3d)
-            except (ValueError, ZeroDivisionError) as err:
-                self.log(
-                    "Error in calculation of 2nd derivative of primitive "
-                    f"internal {primitive.indices}."
-                )
-                continue
-            # Depending on the type of internal coordinate dg is a flat array
-            # of size 36 (stretch), 81 (bend) or 144 (torsion).
-            #
-            # An internal coordinate contributes to an element K[j, k] of the
-            # K matrix if the cartesian coordinate indices j and k belong to an
-            # atom that contributes to the respective internal coordinate.
-            #
-            # As for now we build up the K matrix as flat array. To add the dg
-            # entries at the appropriate places in K_flat we have to calculate
-            # the corresponding flat indices of dg in K_flat.
-            cart_inds = list(
-                it.chain(*[range(3 * i, 3 * i + 3) for i in primitive.indices])
-            )
-            flat_inds = [
-                row * size_ + col for row, col in it.product(cart_inds, cart_inds)
-            ]
-            K_flat[flat_inds] += dg
-        K = K_flat.reshape(size_, size_)
-        return K
+            K = csr_matrix((size_, size_))
+            return K if sparse else K.toarray()
+
+        return self.prim_batch.K_matrix(
+            self.coords3d, int_gradient, sparse=sparse, logger=self.logger
+        )
 
     def log_int_grad_msg(self, int_gradient):
         if int_gradient is None:
@@ -325,9 +386,13 @@ class RedundantCoords:
         return self.Bt_inv_prim.dot(cart_hessian - K).dot(self.B_inv_prim)
 
     def backtransform_hessian(self, redund_hessian, int_gradient=None):
-        """Transform Hessian in internal coordinates to Cartesians."""
+        """Transform Hessian in internal coordinates to Cartesians.
+
+        A diagonal Hessian may also be given as 1d array."""
         self.log_int_grad_msg(int_gradient)
         K = self.get_K_matrix(int_gradient)
+        if redund_hessian.ndim == 1:
+            return self.B.T.dot(redund_hessian[:, None] * self.B) + K
         return self.B.T.dot(redund_hessian).dot(self.B) + K
 
     def project_hessian(self, H, shift=1000):
@@ -337,6 +402,8 @@ class RedundantCoords:
 
     def project_vector(self, vector):
         """Project supplied vector onto range of B."""
+        if self.sparse:
+            return self.B_sparse.dot(self.B_inv_op.matvec(vector))
         return self.P.dot(vector)
 
     def set_inds_from_typed_prims(self, typed_prims):
@@ -390,7 +457,9 @@ class RedundantCoords:
         self.fragments = coord_info.fragments
 
     def eval(self, coords3d, attr=None):
-        prim_internals = eval_primitives(coords3d, self.primitives)
+        prim_internals = eval_primitives(
+            coords3d, self.primitives, local=self.sparse, batch=self.prim_batch
+        )
 
         if attr is not None:
             return np.array(
@@ -401,13 +470,19 @@ class RedundantCoords:
 
     def transform_int_step(self, int_step, pure=False):
         self.log(f"Backtransformation {self.backtransform_counter}")
+        if self.sparse:
+            Bt_inv_prim = self.B_inv_prim_op.T
+        else:
+            Bt_inv_prim = self.Bt_inv_prim
         new_prim_internals, cart_step, failed = transform_int_step(
             int_step,
             self.coords3d.flatten(),
             self.prim_coords,
-            self.Bt_inv_prim,
+            Bt_inv_prim,
             self.primitives,
             check_dihedrals=self.rebuild,
+            local=self.sparse,
+            batch=self.prim_batch,
             logger=self.logger,
         )
         # Update coordinates
@@ -1,7 +1,14 @@
+import itertools as it
 import logging
 import random
+from types import FunctionType, SimpleNamespace
 
 import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix
+
+from pysisyphus.helpers_pure import log
+from pysisyphus.intcoords import Bend, LinearBend, OutOfPlane, Stretch, Torsion
+from pysisyphus.intcoords.derivatives import d2q_a, d2q_b, d2q_d, d2q_lb, d2q_oop
 
 
 class PrimInternal:
@@ -20,20 +27,473 @@ class PrimInternal:
     # return (1 - abs(dot)) < thresh
 
 
-def eval_primitives(coords3d, primitives):
+def eval_primitives(coords3d, primitives, local=False, batch=None):
+    """Evaluate values and gradients of primitive internals.
+
+    With local=True every gradient only comprises the 3*k Cartesian components
+    of the k atoms defining the primitive. Otherwise full rows of length 3N
+    are returned. When a PrimitiveBatch for the given primitives is supplied,
+    the primitives are evaluated in a vectorized fashion.
+    """
+    if batch is not None:
+        return batch.prim_internals(coords3d, local=local)
+
     prim_internals = list()
     for primitive in primitives:
-        value, gradient = primitive.calculate(coords3d, gradient=True)
+        if local:
+            inds = primitive.indices
+            value, gradient = primitive.calculate(
+                coords3d[inds], indices=list(range(len(inds))), gradient=True
+            )
+        else:
+            value, gradient = primitive.calculate(coords3d, gradient=True)
         prim_internal = PrimInternal(primitive.indices, value, gradient)
         prim_internals.append(prim_internal)
     return prim_internals
 
 
+def _norm(vecs):
+    return np.linalg.norm(vecs, axis=1)
+
+
+def _dot(vecs1, vecs2):
+    return np.einsum("ij,ij->i", vecs1, vecs2)
+
+
+def _stretches(coords3d, inds, gradient=False):
+    n, m = inds.T
+    bond = coords3d[m] - coords3d[n]
+    bond_lengths = _norm(bond)
+    if gradient:
+        bond_normed = bond / bond_lengths[:, None]
+        grads = np.stack((-bond_normed, bond_normed), axis=1)
+        return bond_lengths, grads
+    return bond_lengths
+
+
+def _are_parallel(u, v, thresh=1e-6):
+    dot = _dot(u, v) / (_norm(u) * _norm(v))
+    return (1 - np.abs(dot)) < thresh
+
+
+def _bends(coords3d, inds, gradient=False):
+    m, o, n = inds.T
+    u_dash = coords3d[m] - coords3d[o]
+    v_dash = coords3d[n] - coords3d[o]
+    u_norm = _norm(u_dash)
+    v_norm = _norm(v_dash)
+    u = u_dash / u_norm[:, None]
+    v = v_dash / v_norm[:, None]
+
+    angles_rad = np.arccos(_dot(u, v))
+
+    if gradient:
+        # Same choice of the second vector for the cross product as in
+        # Bend._calculate().
+        cross_vec1 = np.full_like(u, (1, -1, 1))
+        cross_vec2 = np.full_like(u, (-1, 1, 1))
+        cross_vec = np.where(
+            _are_parallel(u, cross_vec1)[:, None], cross_vec2, cross_vec1
+        )
+        cross_vec = np.where(_are_parallel(u, v)[:, None], cross_vec, v)
+
+        w_dash = np.cross(u, cross_vec)
+        w = w_dash / _norm(w_dash)[:, None]
+
+        first_term = np.cross(u, w) / u_norm[:, None]
+        second_term = np.cross(w, v) / v_norm[:, None]
+        grads = np.stack(
+            (first_term, -first_term - second_term, second_term), axis=1
+        )
+        return angles_rad, grads
+    return angles_rad
+
+
+def _torsions(coords3d, inds, gradient=False):
+    m, o, p, n = inds.T
+    u_dash = coords3d[m] - coords3d[o]
+    v_dash = coords3d[n] - coords3d[p]
+    w_dash = coords3d[p] - coords3d[o]
+    u_norm = _norm(u_dash)
+    v_norm = _norm(v_dash)
+    w_norm = _norm(w_dash)
+    u = u_dash / u_norm[:, None]
+    v = v_dash / v_norm[:, None]
+    w = w_dash / w_norm[:, None]
+    phi_u = np.arccos(_dot(u, w))
+    phi_v = np.arccos(-_dot(w, v))
+    uxw = np.cross(u, w)
+    vxw = np.cross(v, w)
+    cos_diheds = _dot(uxw, vxw) / (np.sin(phi_u) * np.sin(phi_v))
+    diheds_rad = np.arccos(np.clip(cos_diheds, -1, 1))
+    # See Torsion._calculate() for the determination of the sign.
+    negative = (diheds_rad != np.pi) & (_dot(vxw, u) < 0)
+    diheds_rad[negative] *= -1
+
+    if gradient:
+        sin2_u = np.sin(phi_u) ** 2
+        sin2_v = np.sin(phi_v) ** 2
+        first_term = uxw / (u_norm * sin2_u)[:, None]
+        second_term = vxw / (v_norm * sin2_v)[:, None]
+        third_term = uxw * (np.cos(phi_u) / (w_norm * sin2_u))[:, None]
+        fourth_term = -vxw * (np.cos(phi_v) / (w_norm * sin2_v))[:, None]
+        grads = np.stack(
+            (
+                first_term,
+                -first_term + third_term - fourth_term,
+                second_term - third_term + fourth_term,
+                -second_term,
+            ),
+            axis=1,
+        )
+        return diheds_rad, grads
+    return diheds_rad
+
+
+def _normalized_grad(unit_vecs, norms, grad):
+    """Chain rule for the normalization u = u'/|u'|, i.e., the gradient
+    w.r.t. u' from the gradient w.r.t. u."""
+    return (grad - unit_vecs * _dot(unit_vecs, grad)[:, None]) / norms[:, None]
+
+
+def _out_of_planes(coords3d, inds, gradient=False):
+    m, n, o, p = inds.T
+    u_dash = coords3d[m] - coords3d[p]
+    v_dash = coords3d[n] - coords3d[p]
+    w_dash = coords3d[o] - coords3d[p]
+    u_norm = _norm(u_dash)
+    v_norm = _norm(v_dash)
+    w_norm = _norm(w_dash)
+    u = u_dash / u_norm[:, None]
+    v = v_dash / v_norm[:, None]
+    w = w_dash / w_norm[:, None]
+
+    z_dash = np.cross(u, v) + np.cross(v, w) + np.cross(w, u)
+    z_norm = _norm(z_dash)
+    z = z_dash / z_norm[:, None]
+
+    oop_coords = _dot(z, u)
+
+    if gradient:
+        # Gradient w.r.t. z' and then w.r.t. the unit vectors u, v and w
+        h = _normalized_grad(z, z_norm, u)
+        grad_u = np.cross(v, h) + np.cross(h, w) + z
+        grad_v = np.cross(h, u) + np.cross(w, h)
+        grad_w = np.cross(h, v) + np.cross(u, h)
+        grad_m = _normalized_grad(u, u_norm, grad_u)
+        grad_n = _normalized_grad(v, v_norm, grad_v)
+        grad_o = _normalized_grad(w, w_norm, grad_w)
+        grads = np.stack((grad_m, grad_n, grad_o, -grad_m - grad_n - grad_o), axis=1)
+        return oop_coords, grads
+    return oop_coords
+
+
+def _lb_orthogonal_directions(coords3d, inds, cross_vecs, complements):
+    """See LinearBend._get_orthogonal_direction()."""
+    m, o, _ = inds.T
+    u_dash = coords3d[m] - coords3d[o]
+    u = u_dash / _norm(u_dash)[:, None]
+    w_dash = np.cross(u, cross_vecs)
+    w = w_dash / _norm(w_dash)[:, None]
+    return np.where(complements[:, None], np.cross(u, w), w)
+
+
+def _linear_bends(coords3d, inds, cross_vecs, complements, gradient=False):
+    m, o, n = inds.T
+    u_dash = coords3d[m] - coords3d[o]
+    v_dash = coords3d[n] - coords3d[o]
+    u_norm = _norm(u_dash)
+    v_norm = _norm(v_dash)
+
+    w = _lb_orthogonal_directions(coords3d, inds, cross_vecs, complements)
+
+    uv_norm = u_norm * v_norm
+    lb_rad = _dot(w, np.cross(u_dash, v_dash)) / uv_norm
+
+    if gradient:
+        # As in the generated dq_lb the orthogonal direction is kept fixed.
+        grad_m = (
+            np.cross(v_dash, w) / uv_norm[:, None]
+            - (lb_rad / u_norm**2)[:, None] * u_dash
+        )
+        grad_n = (
+            np.cross(w, u_dash) / uv_norm[:, None]
+            - (lb_rad / v_norm**2)[:, None] * v_dash
+        )
+        grads = np.stack((grad_m, -grad_m - grad_n, grad_n), axis=1)
+        return lb_rad, grads
+    return lb_rad
+
+
+def _stack_broadcast(items, dtype=None):
+    return np.stack(np.broadcast_arrays(*items)).astype(dtype)
+
+
+def vectorize_derivative(func):
+    """Make a function from intcoords.derivatives accept arrays of arguments.
+
+    The generated code only uses math.sqrt, math.acos and np.array, so these
+    names are bound to NumPy functions operating on whole arrays. The entries
+    of the returned array have the shape of the arguments.
+    """
+    func_globals = {
+        "math": SimpleNamespace(sqrt=np.sqrt, acos=np.arccos),
+        "np": SimpleNamespace(array=_stack_broadcast, float64=np.float64),
+    }
+    return FunctionType(func.__code__, func_globals, func.__name__)
+
+
+class PrimitiveBatch:
+    """Vectorized evaluation of a fixed list of primitive internals.
+
+    Primitives of the same type are grouped and evaluated together, using
+    NumPy operations over arrays of atom indices. Values are returned in a
+    flat array of length len(primitives). The local gradients, i.e., the 3*k
+    Cartesian components belonging to the k atoms of every primitive, are
+    concatenated into one flat array in the order of the primitives.
+    Primitives without a vectorized implementation are evaluated one by
+    one.
+    """
+
+    batch_funcs = {
+        Stretch: _stretches,
+        Bend: _bends,
+        Torsion: _torsions,
+        OutOfPlane: _out_of_planes,
+    }
+    # Second derivatives w.r.t. Cartesians
+    jacobian_funcs = {
+        Stretch: vectorize_derivative(d2q_b),
+        Bend: vectorize_derivative(d2q_a),
+        Torsion: vectorize_derivative(d2q_d),
+        OutOfPlane: vectorize_derivative(d2q_oop),
+        LinearBend: vectorize_derivative(d2q_lb),
+    }
+
+    def __init__(self, primitives):
+        self.primitives = primitives
+
+        grad_sizes = [3 * len(prim.indices) for prim in self.primitives]
+        self.grad_offsets = np.concatenate(([0], np.cumsum(grad_sizes))).astype(int)
+        # Rows and columns of all local gradients in the Wilson B-matrix
+        self.rows = np.repeat(np.arange(len(self.primitives)), grad_sizes)
+        self.cols = get_cart_inds(
+            list(it.chain(*[prim.indices for prim in self.primitives]))
+        )
+
+        groups = dict()
+        self.fallback = list()
+        for i, prim in enumerate(self.primitives):
+            # Check for the exact type, as subclasses may differ.
+            key = type(prim)
+            if (key in self.batch_funcs) or (key is LinearBend):
+                groups.setdefault(key, list()).append(i)
+            else:
+                self.fallback.append(i)
+        self.groups = list()
+        for key, prim_inds in groups.items():
+            prim_inds = np.array(prim_inds, dtype=int)
+            atom_inds = np.array([self.primitives[i].indices for i in prim_inds])
+            grad_inds = (
+                self.grad_offsets[prim_inds, None]
+                + np.arange(3 * atom_inds.shape[1])[None, :]
+            ).flatten()
+            self.groups.append((key, prim_inds, atom_inds, grad_inds))
+
+    @property
+    def grad_size(self):
+        return self.grad_offsets[-1]
+
+    def _lb_kwargs(self, prim_inds, coords3d):
+        prims = [self.primitives[i] for i in prim_inds]
+        for prim in prims:
+            if prim.cross_vec is None:
+                prim.set_cross_vec(coords3d)
+        return {
+            "cross_vecs": np.array([prim.cross_vec for prim in prims]),
+            "complements": np.array([prim.complement for prim in prims], dtype=bool),
+        }
+
+    def _eval_group(self, key, prim_inds, atom_inds, coords3d, gradient):
+        if key is LinearBend:
+            return _linear_bends(
+                coords3d,
+                atom_inds,
+                gradient=gradient,
+                **self._lb_kwargs(prim_inds, coords3d),
+            )
+        return self.batch_funcs[key](coords3d, atom_inds, gradient=gradient)
+
+    def eval(self, coords3d, gradient=True):
+        """Values and, optionally, the flat array of local gradients."""
+        vals = np.empty(len(self.primitives))
+        if gradient:
+            grads = np.empty(self.grad_size)
+        for key, prim_inds, atom_inds, grad_inds in self.groups:
+            results = self._eval_group(key, prim_inds, atom_inds, coords3d, gradient)
+            if gradient:
+                vals[prim_inds], grads[grad_inds] = results[0], results[1].flatten()
+            else:
+                vals[prim_inds] = results
+        for i in self.fallback:
+            primitive = self.primitives[i]
+            inds = primitive.indices
+            local_coords3d = coords3d[inds]
+            local_inds = list(range(len(inds)))
+            if gradient:
+                vals[i], grads[self.grad_offsets[i] : self.grad_offsets[i + 1]] = (
+                    primitive.calculate(local_coords3d, local_inds, gradient=True)
+                )
+            else:
+                vals[i] = primitive.calculate(local_coords3d, local_inds)
+        if gradient:
+            return vals, grads
+        return vals
+
+    def B_sparse(self, grads, cart_size):
+        """Wilson B-matrix in CSR format from a flat array of local gradients."""
+        return csr_matrix(
+            (grads, (self.rows, self.cols)), shape=(len(self.primitives), cart_size)
+        )
+
+    def _jacobian_group(self, key, prim_inds, atom_inds, coords3d, vals):
+        args = list(coords3d[atom_inds].reshape(len(prim_inds), -1).T)
+        if key is LinearBend:
+            w = _lb_orthogonal_directions(
+                coords3d, atom_inds, **self._lb_kwargs(prim_inds, coords3d)
+            )
+            args.extend(w.T)
+        # Mimic the errors the scalar code raises for undefined derivatives.
+        with np.errstate(divide="raise", invalid="raise", over="raise"):
+            jacs = self.jacobian_funcs[key](*args)
+        jacs = np.broadcast_to(jacs, (jacs.shape[0], len(prim_inds))).T
+        if key is Torsion:
+            jacs = np.sign(vals[prim_inds])[:, None] * jacs
+        return jacs
+
+    def _jacobian(self, i, coords3d, logger=None):
+        primitive = self.primitives[i]
+        # 2nd derivative of normal, but linear, bends is undefined.
+        try:
+            return primitive.jacobian(coords3d).flatten()
+        except (ValueError, ZeroDivisionError, FloatingPointError):
+            log(
+                logger,
+                "Error in calculation of 2nd derivative of primitive "
+                f"internal {primitive.indices}.",
+            )
+
+    def K_matrix(self, coords3d, int_gradient, sparse=False, logger=None):
+        """Second derivatives of the primitives w.r.t. Cartesians, contracted
+        with a gradient in primitive internals.
+
+        All entries are assembled at once as COO matrix. Returns a CSR matrix
+        with sparse=True, otherwise a dense array."""
+        int_gradient = np.asarray(int_gradient)
+        assert len(int_gradient) == len(self.primitives)
+
+        vals = self.eval(coords3d, gradient=False)
+        # The generated code (d2q_d) seems unstable for these values...
+        diheds_deg = np.abs(np.rad2deg(vals))
+        skip = np.array(
+            [isinstance(prim, Torsion) for prim in self.primitives], dtype=bool
+        ) & ((diheds_deg < 1) | (diheds_deg > 179))
+        for i in np.flatnonzero(skip):
+            log(
+                logger,
+                f"Skipped 2nd derivative of {self.primitives[i]} with "
+                f"val={np.rad2deg(vals[i]):.2f}°",
+            )
+
+        # Blocks of primitive indices and their flattened 2nd derivatives
+        blocks = list()
+
+        def add_primitive_wise(prim_inds):
+            for i in prim_inds:
+                jac = self._jacobian(i, coords3d, logger)
+                if jac is not None:
+                    blocks.append(([i], jac[None, :]))
+
+        for key, prim_inds, atom_inds, _ in self.groups:
+            keep = ~skip[prim_inds]
+            prim_inds = prim_inds[keep]
+            atom_inds = atom_inds[keep]
+            if len(prim_inds) == 0:
+                continue
+            try:
+                jacs = self._jacobian_group(key, prim_inds, atom_inds, coords3d, vals)
+                blocks.append((prim_inds, jacs))
+            # Fall back to the primitive-wise evaluation, so only the
+            # problematic primitives are skipped.
+            except FloatingPointError:
+                add_primitive_wise(prim_inds)
+        add_primitive_wise([i for i in self.fallback if not skip[i]])
+
+        # An internal coordinate contributes to an element K[j, k] if the
+        # Cartesian indices j and k belong to atoms of the internal coordinate.
+        rows = [np.array([], dtype=int)]
+        cols = [np.array([], dtype=int)]
+        data = [np.array([], dtype=float)]
+        for prim_inds, jacs in blocks:
+            cart_inds = np.array(
+                [get_cart_inds(self.primitives[i].indices) for i in prim_inds]
+            )
+            cart_num = cart_inds.shape[1]
+            rows.append(np.repeat(cart_inds, cart_num, axis=1).flatten())
+            cols.append(np.tile(cart_inds, (1, cart_num)).flatten())
+            data.append((int_gradient[prim_inds][:, None] * jacs).flatten())
+        size_ = coords3d.size
+        K = coo_matrix(
+            (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(size_, size_),
+        )
+        return K.tocsr() if sparse else K.toarray()
+
+    def prim_internals(self, coords3d, local=False):
+        """Same as eval_primitives(coords3d, self.primitives, local)."""
+        vals, grads = self.eval(coords3d)
+        if local:
+            grads = np.split(grads, self.grad_offsets[1:-1])
+        else:
+            grads = self.B_sparse(grads, coords3d.size).toarray()
+        return [
+            PrimInternal(prim.indices, val, grad)
+            for prim, val, grad in zip(self.primitives, vals, grads)
+        ]
+
+
 def eval_B(coords3d, primitives):
     prim_internals = eval_primitives(coords3d, primitives)
     return np.array([prim_int.grad for prim_int in prim_internals])
 
 
+def get_cart_inds(inds):
+    """Cartesian indices belonging to the given atom indices."""
+    inds = np.array(inds, dtype=int)
+    return (3 * inds[:, None] + np.arange(3)[None, :]).flatten()
+
+
+def B_sparse_from_prim_internals(prim_internals, cart_size):
+    """Wilson B-matrix in CSR format from primitive internals with local
+    gradients, as obtained from eval_primitives(..., local=True).
+
+    Every row holds only the 3*k nonzero entries that belong to the k atoms
+    defining the respective primitive internal.
+    """
+    rows = list()
+    cols = list()
+    data = list()
+    for i, prim_int in enumerate(prim_internals):
+        cart_inds = get_cart_inds(prim_int.inds)
+        rows.append(np.full_like(cart_inds, i))
+        cols.append(cart_inds)
+        data.append(prim_int.grad)
+    rows = np.concatenate(rows) if rows else np.array([], dtype=int)
+    cols = np.concatenate(cols) if cols else np.array([], dtype=int)
+    data = np.concatenate(data) if data else np.array([], dtype=float)
+    return csr_matrix((data, (rows, cols)), shape=(len(prim_internals), cart_size))
+
+
 def check_primitives(coords3d, primitives, thresh=1e-6, logger=None):
     def log(msg, level=logging.DEBUG):
         if logger is not None:
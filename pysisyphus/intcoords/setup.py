@@ -2,10 +2,13 @@ from collections import namedtuple
 import itertools as it
 
 import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
 from scipy.spatial.distance import pdist, squareform
 
 from pysisyphus.constants import BOHR2ANG
-from pysisyphus.helpers_pure import log, sort_by_central, merge_sets
+from pysisyphus.helpers_pure import log, sort_by_central
 from pysisyphus.elem_data import VDW_RADII, COVALENT_RADII as CR
 from pysisyphus.intcoords import Stretch, Bend, LinearBend, Torsion
 from pysisyphus.intcoords.PrimTypes import PrimTypes, PrimMap
@@ -27,21 +30,53 @@ def get_bond_mat(geom, bond_factor=1.3):
 
 
 def get_bond_sets(atoms, coords3d, bond_factor=1.3, return_cdm=False, return_cbm=False):
-    cdm = pdist(coords3d)
-    # Generate indices corresponding to the atom pairs in the
-    # condensed distance matrix cdm.
-    atom_inds = list(it.combinations(range(len(coords3d)), 2))
-    atom_inds = np.array(atom_inds, dtype=int)
-    scaled_cr_sums = bond_factor * get_pair_covalent_radii(atoms)
-    # condensed bond matrix
-    cbm = cdm <= scaled_cr_sums
-    bond_inds = atom_inds[cbm]
-    if not return_cbm and not return_cdm:
-        return bond_inds
-    add_returns = tuple(
-        [mat for flag, mat in ((return_cdm, cdm), (return_cbm, cbm)) if flag]
+    """Bonded atom pairs (i, j), i < j, sorted by i and j.
+
+    Bonds are found by a neighbour search in a KD-tree. Only when the condensed
+    distance or bond matrix is requested via return_cdm/return_cbm, all
+    pair distances are calculated.
+    """
+    if return_cdm or return_cbm:
+        cdm = pdist(coords3d)
+        # Generate indices corresponding to the atom pairs in the
+        # condensed distance matrix cdm.
+        atom_inds = list(it.combinations(range(len(coords3d)), 2))
+        atom_inds = np.array(atom_inds, dtype=int)
+        scaled_cr_sums = bond_factor * get_pair_covalent_radii(atoms)
+        # condensed bond matrix
+        cbm = cdm <= scaled_cr_sums
+        bond_inds = atom_inds[cbm]
+        add_returns = tuple(
+            [mat for flag, mat in ((return_cdm, cdm), (return_cbm, cbm)) if flag]
+        )
+        return (bond_inds,) + add_returns
+
+    cov_radii = np.array([CR[atom.lower()] for atom in atoms])
+    # No bond can be longer than twice the biggest scaled covalent radius.
+    max_bond = 2 * bond_factor * cov_radii.max()
+    tree = cKDTree(coords3d)
+    pair_inds = tree.query_pairs(max_bond, output_type="ndarray")
+    first, second = pair_inds.T
+    distances = np.linalg.norm(coords3d[first] - coords3d[second], axis=1)
+    bonded = distances <= bond_factor * (cov_radii[first] + cov_radii[second])
+    bond_inds = pair_inds[bonded]
+    bond_inds = bond_inds[np.lexsort(bond_inds.T[::-1])]
+    return bond_inds.astype(int)
+
+
+def get_fragments_from_bonds(atom_num, bond_inds):
+    """Connected components of the bond graph, sorted by their smallest atom
+    index. Atoms without any bond form fragments of their own."""
+    bond_inds = np.array(bond_inds, dtype=int).reshape(-1, 2)
+    adjacency = coo_matrix(
+        (np.ones(len(bond_inds)), bond_inds.T), shape=(atom_num, atom_num)
     )
-    return (bond_inds,) + add_returns
+    frag_num, labels = connected_components(adjacency, directed=False)
+    fragments = [set() for _ in range(frag_num)]
+    for atom, label in enumerate(labels):
+        fragments[label].add(atom)
+    fragments = sorted([frozenset(frag) for frag in fragments], key=min)
+    return fragments
 
 
 def get_fragments(atoms, coords):
@@ -49,92 +84,112 @@ def get_fragments(atoms, coords):
     # Bond indices without interfragment bonds and/or hydrogen bonds
     bond_inds = get_bond_sets(atoms, coords3d)
 
-    bond_ind_sets = [frozenset(bi) for bi in bond_inds]
-    fragments = merge_sets(bond_ind_sets)
+    fragments = get_fragments_from_bonds(len(atoms), bond_inds)
+    # Only fragments that contain bonds
+    fragments = [frag for frag in fragments if len(frag) > 1]
 
     return fragments
 
 
-def connect_fragments(cdm, fragments, max_aux=3.78, aux_factor=1.3, logger=None):
+def connect_fragments(coords3d, fragments, max_aux=3.78, aux_factor=1.3, logger=None):
     """Determine the smallest interfragment bond for a list
-    of fragments and a condensed distance matrix."""
+    of fragments and Cartesian coordinates.
+
+    Interfragment distances are looked up in KD-trees of the fragments, so
+    no full distance matrix is built."""
     if len(fragments) > 1:
         log(
             logger,
             f"Detected {len(fragments)} fragments. Generating interfragment bonds.",
         )
-    dist_mat = squareform(cdm)
+    frag_inds = [np.array(sorted(frag), dtype=int) for frag in fragments]
+    frag_trees = [cKDTree(coords3d[inds]) for inds in frag_inds]
     interfrag_inds = list()
     aux_interfrag_inds = list()
-    for frag1, frag2 in it.combinations(fragments, 2):
-        log(logger, f"\tConnecting {len(frag1)} atom and {len(frag2)} atom fragment")
-        inds = [(i1, i2) for i1, i2 in it.product(frag1, frag2)]
-        distances = np.array([dist_mat[ind] for ind in inds])
-
+    for (inds1, tree1), (inds2, tree2) in it.combinations(
+        zip(frag_inds, frag_trees), 2
+    ):
+        log(logger, f"\tConnecting {len(inds1)} atom and {len(inds2)} atom fragment")
         # Determine minimum distance bond
+        distances, nearest = tree2.query(coords3d[inds1])
         min_ind = distances.argmin()
         min_dist = distances[min_ind]
-        interfrag_bond = tuple(inds[min_ind])
+        interfrag_bond = (int(inds1[min_ind]), int(inds2[nearest[min_ind]]))
         interfrag_inds.append(interfrag_bond)
         log(logger, f"\tMinimum distance bond: {interfrag_bond}, {min_dist:.4f} au")
 
         # Determine auxiliary interfragment bonds that are either below max_aux
-        # (default 2 Å, ≈ 3.78 au), or less than aux_factor (default 1.3) times the
+        # (default 2 Å, ≈ 3.78 au), or less than aux_factor (default 1.3) times the
         # minimum interfragment distance.
+        scaled_min_dist = aux_factor * min_dist
+        close = tree1.sparse_distance_matrix(
+            tree2, max(max_aux, scaled_min_dist), output_type="ndarray"
+        )
+        close.sort(order=["i", "j"])
+        close_dists = {
+            (int(inds1[i]), int(inds2[j])): dist for i, j, dist in close.tolist()
+        }
         below_max_aux = [
-            ind for ind in inds if (dist_mat[ind] < max_aux) and (ind != interfrag_bond)
+            ind
+            for ind, dist in close_dists.items()
+            if (dist < max_aux) and (ind != interfrag_bond)
         ]
         if below_max_aux:
             log(
                 logger,
-                f"\tAux. interfrag bonds below {max_aux*BOHR2ANG:.2f} Å:\n"
+                f"\tAux. interfrag bonds below {max_aux*BOHR2ANG:.2f} Å:\n"
                 + "\n".join(
-                    [f"\t\t{ind}: {dist_mat[ind]:.4f} au" for ind in below_max_aux]
+                    [f"\t\t{ind}: {close_dists[ind]:.4f} au" for ind in below_max_aux]
                 ),
             )
-        scaled_min_dist = aux_factor * min_dist
         above_min_dist = [
             ind
-            for ind in inds
-            if (dist_mat[ind] < scaled_min_dist)
+            for ind, dist in close_dists.items()
+            if (dist < scaled_min_dist)
             and (ind != interfrag_bond)
-            and (ind not in below_max_aux)
+            and (dist >= max_aux)
         ]
         if above_min_dist:
             log(
                 logger,
                 f"\tAux. interfrag bonds below {aux_factor:.2f} * min_dist:\n"
                 + "\n".join(
-                    [f"\t\t{ind}: {dist_mat[ind]:.4f} au" for ind in above_min_dist]
+                    [f"\t\t{ind}: {close_dists[ind]:.4f} au" for ind in above_min_dist]
                 ),
             )
         aux_interfrag_inds.extend(below_max_aux)
         aux_interfrag_inds.extend(above_min_dist)
-    # Or as Philipp proposed: two loops over the fragments and only
-    # generate interfragment distances. So we get a full matrix with
-    # the original indices but only the required distances.
     return interfrag_inds, aux_interfrag_inds
 
 
 def get_hydrogen_bond_inds(atoms, coords3d, bond_inds, logger=None):
-    tmp_sets = [frozenset(bi) for bi in bond_inds]
+    atoms = [atom.lower() for atom in atoms]
     # Check for hydrogen bonds as described in [1] A.1 .
     # Find hydrogens bonded to small electronegative atoms X = (N, O
     # F, P, S, Cl).
-    hydrogen_inds = [i for i, a in enumerate(atoms) if a.lower() == "h"]
-    x_inds = [i for i, a in enumerate(atoms) if a.lower() in "n o f p s cl".split()]
+    x_atoms = "n o f p s cl".split()
+    x_inds = np.array([i for i, a in enumerate(atoms) if a in x_atoms], dtype=int)
+    xh_bonds = list()
+    for from_, to_ in bond_inds:
+        for h_ind, x_ind in ((from_, to_), (to_, from_)):
+            if (atoms[h_ind] == "h") and (atoms[x_ind] in x_atoms):
+                xh_bonds.append((h_ind, x_ind))
     hydrogen_bond_inds = list()
-    for h_ind, x_ind in it.product(hydrogen_inds, x_inds):
-        as_set = set((h_ind, x_ind))
-        if as_set not in tmp_sets:
-            continue
+    if not xh_bonds:
+        return hydrogen_bond_inds
+
+    # Only electronegative atoms Y below 0.9 times the biggest possible sum
+    # of van der Waals radii are considered.
+    x_tree = cKDTree(coords3d[x_inds])
+    max_vdw = 0.9 * (VDW_RADII["h"] + max([VDW_RADII[atoms[i]] for i in x_inds]))
+    for h_ind, x_ind in sorted(xh_bonds):
         # Check if distance of H to another electronegative atom Y is
         # greater than the sum of their covalent radii but smaller than
         # the 0.9 times the sum of their van der Waals radii. If the
         # angle X-H-Y is greater than 90° a hydrogen bond is asigned.
-        y_inds = set(x_inds) - set((x_ind,))
-        for y_ind in y_inds:
-            y_atom = atoms[y_ind].lower()
+        y_inds = set(x_inds[x_tree.query_ball_point(coords3d[h_ind], max_vdw)])
+        for y_ind in sorted(y_inds - set((x_ind,))):
+            y_atom = atoms[y_ind]
             cov_rad_sum = CR["h"] + CR[y_atom]
             distance = Stretch._calculate(coords3d, (h_ind, y_ind))
             vdw = 0.9 * (VDW_RADII["h"] + VDW_RADII[y_atom])
@@ -151,32 +206,44 @@ def get_hydrogen_bond_inds(atoms, coords3d, bond_inds, logger=None):
 
 
 def get_bend_inds(coords3d, bond_inds, min_deg, max_deg, logger=None):
-    bond_sets = {frozenset(bi) for bi in bond_inds}
+    bond_sets = list({frozenset(bi) for bi in bond_inds})
+
+    # Only pairs of bonds sharing one atom can form a bend. They are
+    # determined from the bonds of every atom.
+    bonds_per_atom = dict()
+    for i, bond_set in enumerate(bond_sets):
+        for atom in bond_set:
+            bonds_per_atom.setdefault(atom, list()).append(i)
+    bond_pairs = sorted(
+        it.chain(*[it.combinations(bonds, 2) for bonds in bonds_per_atom.values()])
+    )
 
     bend_inds = list()
-    for bond_set1, bond_set2 in it.combinations(bond_sets, 2):
-        union = bond_set1 | bond_set2
-        if len(union) == 3:
-            indices, _ = sort_by_central(bond_set1, bond_set2)
-            if not bend_valid(coords3d, indices, min_deg, max_deg):
-                log(logger, f"Bend {indices} is not valid!")
-                continue
-            bend_inds.append(indices)
+    for i, j in bond_pairs:
+        indices, _ = sort_by_central(bond_sets[i], bond_sets[j])
+        if not bend_valid(coords3d, indices, min_deg, max_deg):
+            log(logger, f"Bend {indices} is not valid!")
+            continue
+        bend_inds.append(indices)
 
     return bend_inds
 
 
-def get_linear_bend_inds(coords3d, cbm, bends, min_deg=175, max_bonds=4, logger=None):
+def get_linear_bend_inds(
+    coords3d, bond_inds, bends, min_deg=175, max_bonds=4, logger=None
+):
     linear_bends = list()
     complements = list()
 
     if min_deg is None:
         return linear_bends, complements
 
-    bm = squareform(cbm)
+    bond_nums = np.bincount(
+        np.array(bond_inds, dtype=int).flatten(), minlength=len(coords3d)
+    )
     for bend in bends:
         deg = np.rad2deg(Bend._calculate(coords3d, bend))
-        bonds = sum(bm[bend[1]])
+        bonds = bond_nums[bend[1]]
         if (deg >= min_deg) and (bonds <= max_bonds):
             log(
                 logger,
@@ -197,6 +264,9 @@ def get_dihedral_inds(coords3d, bond_inds, bend_inds, max_deg, logger=None):
     proper_dihedral_inds = list()
     improper_candidates = list()
     improper_dihedral_inds = list()
+    # Sets for fast lookup of already present dihedrals
+    proper_dihedral_set = set()
+    improper_dihedral_set = set()
 
     def log_dihed_skip(inds):
         log(
@@ -207,7 +277,7 @@ def get_dihedral_inds(coords3d, bond_inds, bend_inds, max_deg, logger=None):
 
     def set_dihedral_index(dihedral_ind, proper=True):
         dihed = tuple(dihedral_ind)
-        check_in = proper_dihedral_inds if proper else improper_dihedral_inds
+        check_in = proper_dihedral_set if proper else improper_dihedral_set
         # Check if this dihedral is already present
         if (dihed in check_in) or (dihed[::-1] in check_in):
             return
@@ -215,12 +285,24 @@ def get_dihedral_inds(coords3d, bond_inds, bend_inds, max_deg, logger=None):
         if not dihedral_valid(coords3d, dihedral_ind, deg_thresh=max_deg):
             log_dihed_skip(dihedral_ind)
             return
+        check_in.add(dihed)
         if proper:
             proper_dihedral_inds.append(dihed)
         else:
             improper_dihedral_inds.append(dihed)
 
-    for bond, bend in it.product(bond_inds, bend_inds):
+    # Only bends sharing at least one atom with a bond are considered.
+    bends_per_atom = dict()
+    for i, bend in enumerate(bend_inds):
+        for atom in bend:
+            bends_per_atom.setdefault(atom, list()).append(i)
+    bond_bend_pairs = (
+        (bond, bend_inds[i])
+        for bond in bond_inds
+        for i in sorted(set(it.chain(*[bends_per_atom.get(atom, ()) for atom in bond])))
+    )
+
+    for bond, bend in bond_bend_pairs:
         # print("bond", bond, "bend", bend)
         central = bend[1]
         bend_set = set(bend)
@@ -360,27 +442,17 @@ def setup_redundant(
         return [prim for prim in prims if keep_coord(prim_cls, prim)]
 
     # Bonds
-    bonds, cdm, cbm = get_bond_sets(
-        atoms,
-        coords3d,
-        bond_factor=factor,
-        return_cdm=True,
-        return_cbm=True,
-    )
-    bonds = [tuple(bond) for bond in bonds]
+    all_bonds = get_bond_sets(atoms, coords3d, bond_factor=factor)
+    bonds = [tuple(bond) for bond in all_bonds.tolist()]
     bonds = keep_coords(bonds, Stretch)
 
-    # Fragments
-    fragments = merge_sets(bonds)
-    # Check for unbonded single atoms and create fragments for them.
-    bonded_set = set(tuple(np.ravel(bonds)))
-    unbonded_set = set(range(len(atoms))) - bonded_set
-    fragments.extend([frozenset((atom,)) for atom in unbonded_set])
+    # Fragments. Unbonded single atoms form fragments of their own.
+    fragments = get_fragments_from_bonds(len(atoms), bonds)
 
     # Check for disconnected fragments. If they are present, create interfragment
     # bonds between them.
     interfrag_bonds, aux_interfrag_bonds = connect_fragments(
-        cdm, fragments, logger=logger
+        coords3d, fragments, logger=logger
     )
 
     # Hydrogen bonds
@@ -416,7 +488,7 @@ def setup_redundant(
     # Linear Bends and orthogonal complements
     linear_bends, linear_bend_complements = get_linear_bend_inds(
         coords3d,
-        cbm,
+        all_bonds,
         bends,
         min_deg=lb_min_deg,
         max_bonds=lb_max_bonds,
@@ -44,9 +44,13 @@ def update_internals(
     primitives,
     dihedral_inds,
     check_dihedrals=False,
+    local=False,
+    batch=None,
     logger=None,
 ):
-    prim_internals = eval_primitives(new_coords3d, primitives)
+    prim_internals = eval_primitives(
+        new_coords3d, primitives, local=local, batch=batch
+    )
     new_internals = [prim_int.val for prim_int in prim_internals]
     internal_diffs = np.array(new_internals) - old_internals
 
@@ -92,6 +96,8 @@ def transform_int_step(
     primitives,
     check_dihedrals=False,
     cart_rms_thresh=1e-6,
+    local=False,
+    batch=None,
     logger=None,
 ):
     """Transformation is done in primitive internals, so int_step must be given
@@ -120,6 +126,8 @@ def transform_int_step(
             primitives,
             dihedral_inds,
             check_dihedrals=check_dihedrals,
+            local=local,
+            batch=batch,
             logger=logger,
         )
         new_internals = [prim.val for prim in new_prim_ints]
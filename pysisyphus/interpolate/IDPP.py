@@ -1,7 +1,12 @@
-from scipy.spatial.distance import pdist
+import numpy as np
 
 # from pysisyphus.constants import BOHR2ANG, ANG2BOHR
-from pysisyphus.calculators.IDPPCalculator import IDPPCalculator
+from pysisyphus.calculators.IDPPCalculator import (
+    IDPPCalculator,
+    get_idpp_pairs,
+    get_pair_distances,
+    idpp_energies_forces,
+)
 from pysisyphus.constants import BOHR2ANG, ANG2BOHR
 from pysisyphus.cos.NEB import NEB
 from pysisyphus.helpers import align_geoms
@@ -13,8 +18,36 @@ from pysisyphus.interpolate.Interpolator import Interpolator
 # See https://gitlab.com/ase/ase/blob/master/ase/neb.py
 
 
+class IDPPNEB(NEB):
+    """NEB that evaluates the IDPP objective of all images in one batch."""
+
+    def calc_images(self, images):
+        calcs = [image.calculator for image in images]
+        coords3d = np.array([image.coords3d for image in images])
+        targets = np.array([calc.target for calc in calcs])
+        energies, forces = idpp_energies_forces(coords3d, targets, calcs[0].pairs)
+        return [
+            {"energy": energy, "forces": forces_.flatten()}
+            for energy, forces_ in zip(energies, forces)
+        ]
+
+
 class IDPP(Interpolator):
 
+    def __init__(self, *args, cutoff=None, **kwargs):
+        """IDPP interpolation.
+
+        Parameters
+        ----------
+        cutoff : float, optional
+            Only atom pairs closer than this distance in Angstrom in the
+            initial or final geometry enter the IDPP objective. By default
+            all pairs are considered.
+        """
+        super().__init__(*args, **kwargs)
+
+        self.cutoff = cutoff
+
     def interpolate(self, initial_geom, final_geom):
         # Do an initial linear interpolation to generate all geometries/images
         # that will be refined later by IDPP interpolation.
@@ -27,16 +60,19 @@ class IDPP(Interpolator):
         for geom in idpp_geoms:
             geom.coords *= BOHR2ANG
 
-        # We want to interpolate between these two condensed distance matrices
-        initial_pd = pdist(initial_geom.coords3d)
-        final_pd = pdist(final_geom.coords3d)
+        # We want to interpolate between the distances of these two geometries
+        pairs = get_idpp_pairs(
+            (initial_geom.coords3d, final_geom.coords3d), cutoff=self.cutoff
+        )
+        initial_pd = get_pair_distances(initial_geom.coords3d, pairs)
+        final_pd = get_pair_distances(final_geom.coords3d, pairs)
         steps = 1 + self.between
         pd_diff = (final_pd - initial_pd) / steps
 
         for i, geom in enumerate(idpp_geoms):
-            geom.set_calculator(IDPPCalculator(initial_pd + i * pd_diff))
+            geom.set_calculator(IDPPCalculator(initial_pd + i * pd_diff, pairs))
 
-        neb = NEB(idpp_geoms, fix_ends=True)
+        neb = IDPPNEB(idpp_geoms, fix_ends=True)
         opt_kwargs = {
             "max_cycles": 1000,
             "rms_force": 1e-2,
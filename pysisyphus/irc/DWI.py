@@ -19,24 +19,82 @@ def taylor_grad(gradient, hessian, step):
     return gradient + hessian @ step
 
 
+class LowRankHessian:
+
+    # Make NumPy defer 'vec @ hessian' to __rmatmul__
+    __array_ufunc__ = None
+
+    def __init__(self, reference, U=None, C=None):
+        """Hessian H = reference + U @ C @ U.T.
+
+        The dense reference is shared between all Hessians derived from it
+        by updates, so every Hessian only stores its low-rank part with U of
+        shape (N, k) and C of shape (k, k). BFGS and Bofill updates add two
+        columns to U.
+        """
+        self.reference = reference
+        size = self.reference.shape[0]
+        if U is None:
+            U = np.zeros((size, 0))
+            C = np.zeros((0, 0))
+        self.U = U
+        self.C = C
+
+    @property
+    def rank(self):
+        return self.U.shape[1]
+
+    @property
+    def shape(self):
+        return self.reference.shape
+
+    def updated(self, U, C):
+        """New Hessian with the update U @ C @ U.T added."""
+        rank = self.rank
+        new_rank = rank + U.shape[1]
+        new_C = np.zeros((new_rank, new_rank))
+        new_C[:rank, :rank] = self.C
+        new_C[rank:, rank:] = C
+        return LowRankHessian(self.reference, np.hstack((self.U, U)), new_C)
+
+    def dot(self, vec):
+        return self.reference @ vec + self.U @ (self.C @ (self.U.T @ vec))
+
+    def __matmul__(self, vec):
+        return self.dot(vec)
+
+    def __rmatmul__(self, vec):
+        # The Hessian is symmetric
+        return self.dot(vec)
+
+    def to_dense(self):
+        return self.reference + self.U @ self.C @ self.U.T
+
+    def __repr__(self):
+        return f"LowRankHessian(size={self.shape[0]}, rank={self.rank})"
+
+
 class DWI:
 
     def __init__(self, n=4, maxlen=2):
-        """Distance weighted interpolation."""
+        """Distance weighted interpolation.
+
+        The Taylor expansions around the last 'maxlen' points are combined.
+        Hessians may be given as dense arrays or as LowRankHessian.
+        """
 
         self.n = int(n)
         assert self.n > 0
         assert (self.n % 2) == 0
-        self.maxlen = maxlen
-        assert self.maxlen == 2, \
-            "Right now only maxlen=2 is supported!"
+        self.maxlen = int(maxlen)
+        assert self.maxlen >= 2
 
         # Using FIFO deques for easy updating of the lists
         self.coords = deque(maxlen=self.maxlen)
         self.energies = deque(maxlen=self.maxlen)
         self.gradients = deque(maxlen=self.maxlen)
         self.hessians = deque(maxlen=self.maxlen)
-    
+
     def update(self, coords, energy, gradient, hessian):
         self.coords.append(coords)
         self.energies.append(energy)
@@ -47,52 +105,61 @@ class DWI:
                == len(self.gradients) == len(self.hessians)
 
     def interpolate(self, at_coords, gradient=False):
-        """See [1] Eq. (25) - (29)"""
-        c1, c2 = self.coords
-
-        dx1 = at_coords - c1
-        dx2 = at_coords - c2
-
-        dx1_norm = np.linalg.norm(dx1)
-        dx2_norm = np.linalg.norm(dx2)
-        dx1_norm_n = dx1_norm**self.n
-        dx2_norm_n = dx2_norm**self.n
-
-        denom = dx1_norm**self.n + dx2_norm**self.n
-        w1 = dx2_norm_n / denom
-        w2 = dx1_norm_n / denom
-
-        e1, e2 = self.energies
-        g1, g2 = self.gradients
-        h1, h2 = self.hessians
-
-        t1 = taylor(e1, g1, h1, dx1)
-        t2 = taylor(e2, g2, h2, dx2)
-
-        E_dwi = w1*t1 + w2*t2
+        """See [1] Eq. (25) - (29), generalized to more than two points.
+
+        The weight of point i is w_i = p_i / Σ_j p_j with the products
+        p_i = Π_(j != i) |x - x_j|**n. For two points this reduces to
+        w_1 = |x - x_2|**n / (|x - x_1|**n + |x - x_2|**n)."""
+        dxs = [at_coords - c for c in self.coords]
+        dx_norms = np.array([np.linalg.norm(dx) for dx in dxs])
+        dx_norms_n = dx_norms**self.n
+        num = len(dxs)
+
+        # Products of all distances, excluding point i
+        others = ~np.eye(num, dtype=bool)
+        prods = np.array([dx_norms_n[others[i]].prod() for i in range(num)])
+        denom = prods.sum()
+        weights = prods / denom
+
+        taylors = [taylor(e, g, h, dx) for e, g, h, dx
+                   in zip(self.energies, self.gradients, self.hessians, dxs)]
+        E_dwi = weights.dot(taylors)
 
         if not gradient:
             return E_dwi
 
-        t1_grad = taylor_grad(g1, h1, dx1)
-        t2_grad = taylor_grad(g2, h2, dx2)
+        taylor_grads = [taylor_grad(g, h, dx) for g, h, dx
+                        in zip(self.gradients, self.hessians, dxs)]
 
-        # The gradient of dx2_norm_n w.r.t the coordinates is formulated with
+        # The gradient of dx_norm_n w.r.t the coordinates is formulated with
         # **2n instead of **n, so the square root can be easily reduced.
         # sqrt(x)**2n = x**(1/2)**2n = x**n
         #
         # Thats why we do the following calculations with n/2.
         # of n.
         n_2 = self.n // 2
-        dx1_norm_n_grad = 2 * n_2 * dx1_norm**(2*n_2-2) * dx1
-        dx2_norm_n_grad = 2 * n_2 * dx2_norm**(2*n_2-2) * dx2
-        w1_grad = (dx2_norm_n_grad*dx1_norm_n  - dx1_norm_n_grad*dx2_norm_n) / denom**2
-        w2_grad = -w1_grad
-
-        # E_dwi = w1(x)*T1(x) + w2(x)*T2(x)
+        dx_norms_n_grad = [2 * n_2 * dx_norm**(2*n_2-2) * dx
+                           for dx_norm, dx in zip(dx_norms, dxs)]
+        # dp_i/dx = Σ_(j != i) d|x - x_j|**n/dx * Π_(k != i, j) |x - x_k|**n
+        prods_grad = list()
+        for i in range(num):
+            prod_grad = np.zeros_like(at_coords)
+            for j in range(num):
+                if j == i:
+                    continue
+                mask = others[i] & others[j]
+                prod_grad += dx_norms_n_grad[j] * dx_norms_n[mask].prod()
+            prods_grad.append(prod_grad)
+        denom_grad = np.sum(prods_grad, axis=0)
+        weights_grad = [(prod_grad * denom - prod * denom_grad) / denom**2
+                        for prod, prod_grad in zip(prods, prods_grad)]
+
+        # E_dwi = Σ_i w_i(x)*T_i(x)
         #
-        # dE_DWI / dx = dw1(x)*T1(x) + w1(x)*dT1(x) + dw2(x)*T2(x) + w2*dT2(x)
-        grad_dwi = w1_grad*t1 + w1*t1_grad + w2_grad*t2 + w2*t2_grad
+        # dE_DWI / dx = Σ_i dw_i(x)*T_i(x) + w_i(x)*dT_i(x)
+        grad_dwi = np.sum([w_grad*t + w*t_grad for w_grad, t, w, t_grad
+                           in zip(weights_grad, taylors, weights, taylor_grads)],
+                          axis=0)
 
         return E_dwi, grad_dwi
 
@@ -101,14 +168,35 @@ class DWI:
             "coords": np.array(self.coords, dtype=float),
             "energies": np.array(self.energies, dtype=float),
             "gradients": np.array(self.gradients, dtype=float),
-            "hessians": np.array(self.hessians, dtype=float),
         }
 
+        low_rank = all([isinstance(h, LowRankHessian) for h in self.hessians])
+        if low_rank:
+            # Every shared reference is only written once
+            ref_ids = list()
+            references = list()
+            for h in self.hessians:
+                if id(h.reference) not in ref_ids:
+                    ref_ids.append(id(h.reference))
+                    references.append(h.reference)
+            data["hessian_references"] = np.array(references, dtype=float)
+        else:
+            hessians = [h.to_dense() if isinstance(h, LowRankHessian) else h
+                        for h in self.hessians]
+            data["hessians"] = np.array(hessians, dtype=float)
+
         with h5py.File(fn, "w") as handle:
             for key, val in data.items():
                 handle.create_dataset(name=key, dtype=val.dtype, data=val)
             handle.create_dataset(name="maxlen", data=self.maxlen, dtype=int)
             handle.create_dataset(name="n", data=self.n, dtype=int)
+            if low_rank:
+                for i, h in enumerate(self.hessians):
+                    group = handle.create_group(f"hessian_{i}")
+                    group.create_dataset(name="reference", dtype=int,
+                                         data=ref_ids.index(id(h.reference)))
+                    group.create_dataset(name="U", data=h.U)
+                    group.create_dataset(name="C", data=h.C)
 
     @staticmethod
     def from_h5(fn):
@@ -116,7 +204,18 @@ class DWI:
             coords = handle["coords"][:]
             energies = handle["energies"][:]
             gradients = handle["gradients"][:]
-            hessians = handle["hessians"][:]
+            if "hessians" in handle:
+                hessians = handle["hessians"][:]
+            else:
+                # Derived Hessians share the same reference object again
+                references = list(handle["hessian_references"][:])
+                hessians = list()
+                for i in range(len(coords)):
+                    group = handle[f"hessian_{i}"]
+                    ref_ind = int(group["reference"][()])
+                    hessians.append(
+                        LowRankHessian(references[ref_ind], group["U"][:], group["C"][:])
+                    )
 
             maxlen = int(handle["maxlen"][()])
             n = int(handle["n"][()])
@@ -19,19 +19,26 @@ import time
 
 import numpy as np
 from scipy.integrate import solve_ivp
+from scipy.optimize import brentq
 
 from pysisyphus.helpers import rms
 from pysisyphus.io.hessian import save_hessian
-from pysisyphus.irc.DWI import DWI
+from pysisyphus.irc.DWI import DWI, LowRankHessian
 from pysisyphus.irc.IRC import IRC
-from pysisyphus.optimizers.hessian_updates import bfgs_update, bofill_update
+from pysisyphus.optimizers.hessian_updates import (
+    bfgs_update,
+    bofill_update,
+    bfgs_update_factors,
+    bofill_update_factors,
+)
 
 
 class EulerPC(IRC):
 
     def __init__(self, *args, hessian_recalc=None, hessian_update="bofill",
                  hessian_init="calc", max_pred_steps=500, dump_dwi=False,
-                 scipy_method=None, corr_func="mbs", **kwargs):
+                 scipy_method=None, corr_func="mbs", predictor="euler",
+                 dwi_maxlen=2, dwi_low_rank=False, dwi_max_rank=100, **kwargs):
         super().__init__(*args, hessian_init=hessian_init, **kwargs)
 
         self.hessian_recalc = hessian_recalc
@@ -40,8 +47,20 @@ class EulerPC(IRC):
             "bofill": bofill_update,
         }
         self.hessian_update_func = self.hessian_update[hessian_update]
+        self.hessian_factors_func = {
+            "bfgs": bfgs_update_factors,
+            "bofill": bofill_update_factors,
+        }[hessian_update]
         self.max_pred_steps = int(max_pred_steps)
         self.dump_dwi = dump_dwi
+        # Number of points used in the distance weighted interpolation
+        self.dwi_maxlen = int(dwi_maxlen)
+        # Store the Hessians of the DWI as low-rank updates to a shared
+        # reference, instead of dense copies.
+        self.dwi_low_rank = dwi_low_rank
+        # A new reference is created when the rank of the updates exceeds this
+        self.dwi_max_rank = int(dwi_max_rank)
+        self.dwi_hessian = None
 
         self.scipy_method = scipy_method
         corr_funcs = {
@@ -55,18 +74,26 @@ class EulerPC(IRC):
             )
             corr_func = "scipy"
         self.corr_func = corr_funcs[corr_func]
+        pred_funcs = {
+            # Explicit Euler integration on the quadratic model
+            "euler": self.euler_predictor_step,
+            # Closed form solution in the eigenbasis of the Hessian
+            "analytic": self.analytic_predictor_step,
+        }
+        self.pred_func = pred_funcs[predictor]
 
     def prepare(self, *args, **kwargs):
         super().prepare(*args, **kwargs)
 
         # Initialize the distance weighted interpolator with the data
         # from the initial displacement.
-        self.dwi = DWI()
+        self.dwi = DWI(maxlen=self.dwi_maxlen)
         mw_grad = self.mw_gradient
         energy = self.energy
 
         # Store starting information for distances weighted interpolation
-        self.dwi.update(self.mw_coords, energy, mw_grad, self.mw_hessian.copy())
+        self.reset_dwi_hessian()
+        self.dwi.update(self.mw_coords, energy, mw_grad, self.get_dwi_hessian())
 
         if self.downhill:
             return
@@ -75,9 +102,34 @@ class EulerPC(IRC):
         # and the initially displaced geometry.
         dx = self.mw_coords - self.ts_mw_coords
         dg = mw_grad - self.ts_mw_gradient
-        dH, key = self.hessian_update_func(self.mw_hessian, dx, dg)
+        key = self.update_hessian(dx, dg)
         self.log(f"Did {key} hessian update.")
-        self.mw_hessian += dH
+
+    def reset_dwi_hessian(self):
+        """Use the current Hessian as new reference for low-rank DWI Hessians."""
+        if self.dwi_low_rank:
+            self.dwi_hessian = LowRankHessian(self.mw_hessian.copy())
+
+    def get_dwi_hessian(self):
+        """Hessian that is stored in the DWI."""
+        if self.dwi_low_rank:
+            return self.dwi_hessian
+        return self.mw_hessian.copy()
+
+    def update_hessian(self, dx, dg):
+        """Update the mass-weighted Hessian and return the update kind."""
+        if not self.dwi_low_rank:
+            dH, key = self.hessian_update_func(self.mw_hessian, dx, dg)
+            self.mw_hessian += dH
+            return key
+
+        U, C, key = self.hessian_factors_func(self.mw_hessian, dx, dg)
+        self.mw_hessian += U @ C @ U.T
+        if self.dwi_hessian.rank + U.shape[1] > self.dwi_max_rank:
+            self.reset_dwi_hessian()
+        else:
+            self.dwi_hessian = self.dwi_hessian.updated(U, C)
+        return key
 
     def get_integration_length_func(self, init_mw_coords):
         def get_integration_length(cur_mw_coords):
@@ -97,23 +149,81 @@ class EulerPC(IRC):
         if self.cur_cycle > 0:
             if self.hessian_recalc and (self.cur_cycle % self.hessian_recalc == 0):
                 self.mw_hessian = self.geometry.mw_hessian
+                self.reset_dwi_hessian()
                 h5_fn = f"hess_calc_irc_{self.direction}_cyc{self.cur_cycle}.h5"
                 save_hessian(h5_fn, self.geometry)
                 self.log("Calculated excact hessian")
             else:
                 dx = self.mw_coords - self.irc_mw_coords[-2]
                 dg = mw_grad - self.irc_mw_gradients[-2]
-                dH, key = self.hessian_update_func(self.mw_hessian, dx, dg)
-                self.mw_hessian += dH
+                key = self.update_hessian(dx, dg)
                 self.log(f"Did {key} hessian update before predictor step.")
-            self.dwi.update(self.mw_coords.copy(), energy, mw_grad, self.mw_hessian.copy())
+            self.dwi.update(self.mw_coords.copy(), energy, mw_grad, self.get_dwi_hessian())
 
         # Create a copy of the inital coordinates for the determination
-        # of the actual step size in the predictor Euler integration.
+        # of the actual step size in the predictor step.
         init_mw_coords = self.mw_coords.copy()
 
         get_integration_length = self.get_integration_length_func(init_mw_coords)
 
+        pred_mw_coords, pred_mw_grad, pred_converged = self.pred_func(
+            init_mw_coords, mw_grad
+        )
+        if not pred_converged:
+            # Check if we are already sufficiently converged. If so signal
+            # convergence.
+            self.mw_coords = pred_mw_coords
+
+            # Use rms of gradient from taylor expansion for convergence check.
+            pred_grad = self.unweight_vec(pred_mw_grad)
+            rms_grad = rms(pred_grad)
+
+            # Or check true gradient? But this would need an additional calculation,
+            # so I disabled it for now.
+            # rms_grad = rms(self.gradient)
+
+            # if rms_grad <= 5*self.rms_grad_thresh:
+            if rms_grad <= self.rms_grad_thresh:
+                self.log("Sufficient convergence achieved on rms(grad)")
+                self.converged = True
+                return
+        self.log("")
+
+        # Calculate energy and gradient at new predicted geometry. Update the
+        # hessian accordingly. These results will be added to the DWI for use
+        # in the corrector step.
+        self.mw_coords = pred_mw_coords
+        self.log("Calculating energy and gradient at predictor step geometry.")
+        mw_grad = self.mw_gradient
+        energy = self.energy
+
+        # Hessian update
+        dx = self.mw_coords - self.irc_mw_coords[-1]
+        dg = mw_grad - self.irc_mw_gradients[-1]
+        key = self.update_hessian(dx, dg)
+        self.log(f"Did {key} hessian update after predictor step.\n")
+        self.dwi.update(self.mw_coords.copy(), energy, mw_grad, self.get_dwi_hessian())
+        if self.dump_dwi:
+            self.dwi.dump(f"dwi_{self.cur_direction}_{self.cur_cycle:0{self.cycle_places}d}.h5")
+
+        corrected_mw_coords = self.corr_func(
+                                init_mw_coords,
+                                self.step_length,
+                                self.dwi
+        )
+        self.mw_coords = corrected_mw_coords
+        corr_step_length = get_integration_length(self.mw_coords)
+        self.log(f"Corrected unweighted step length: {corr_step_length:.6f}")
+
+    def euler_predictor_step(self, init_mw_coords, mw_grad):
+        """Explicit Euler integration of the steepest descent path on the
+        quadratic model, until self.step_length is reached.
+
+        Returns the predicted mass-weighted coordinates, the mass-weighted
+        gradient from the Taylor expansion there and whether the step length
+        was reached."""
+        get_integration_length = self.get_integration_length_func(init_mw_coords)
+
         # Calculate predictor Euler-integration step length. See get_conv_fact
         # method definition for a comment on this.
         conv_fact = self.get_conv_fact(mw_grad)
@@ -125,7 +235,7 @@ class EulerPC(IRC):
 
         # These variables will hold the coordinates and gradients along
         # the Euler integration and will be updated frequently.
-        euler_mw_coords = self.mw_coords.copy()
+        euler_mw_coords = init_mw_coords.copy()
         euler_mw_grad = mw_grad.copy()
         self.log(f"Predictor-Euler-integration with Δs={euler_step_length:.6f} "
                  f"for up to {self.max_pred_steps} steps")
@@ -144,62 +254,81 @@ class EulerPC(IRC):
                          f"Δs={cur_length:.4f} (desired Δs={self.step_length:.4f}) "
                          f"after {i+1} steps!"
                 )
-                break
+                return euler_mw_coords, euler_mw_grad, True
             step_ = euler_step_length * -euler_mw_grad / np.linalg.norm(euler_mw_grad)
             euler_mw_coords += step_
             # Determine actual step by comparing the current and the initial coordinates
             euler_step = euler_mw_coords - init_mw_coords
             euler_mw_grad = taylor_gradient(euler_step)
-        else:
-            self.log(f"Predictor-Euler integration did not converge in {i+1} "
-                     f"steps. Δs={cur_length:.4f}."
-            )
 
-            # Check if we are already sufficiently converged. If so signal
-            # convergence.
-            self.mw_coords = euler_mw_coords
+        self.log(f"Predictor-Euler integration did not converge in {i+1} "
+                 f"steps. Δs={cur_length:.4f}."
+        )
+        return euler_mw_coords, euler_mw_grad, False
 
-            # Use rms of gradient from taylor expansion for convergence check.
-            euler_grad = self.unweight_vec(euler_mw_grad)
-            rms_grad = rms(euler_grad)
+    def analytic_predictor_step(self, init_mw_coords, mw_grad, max_doublings=60):
+        """Steepest descent path on the quadratic model in closed form.
 
-            # Or check true gradient? But this would need an additional calculation,
-            # so I disabled it for now.
-            # rms_grad = rms(self.gradient)
+        In the eigenbasis of the mass-weighted Hessian (eigenvalues w_i) the
+        path dx/dt = -(g + Hx) has the solution
 
-            # if rms_grad <= 5*self.rms_grad_thresh:
-            if rms_grad <= self.rms_grad_thresh:
-                self.log("Sufficient convergence achieved on rms(grad)")
-                self.converged = True
-                return
-        self.log("")
+            x_i(t) = -g_i * (1 - exp(-w_i * t)) / w_i ,
 
-        # Calculate energy and gradient at new predicted geometry. Update the
-        # hessian accordingly. These results will be added to the DWI for use
-        # in the corrector step.
-        self.mw_coords = euler_mw_coords
-        self.log("Calculating energy and gradient at predictor step geometry.")
-        mw_grad = self.mw_gradient
-        energy = self.energy
+        with x_i(t) = -g_i * t for w_i = 0. It is the same path the Euler
+        predictor follows, only parametrized differently. The parameter t
+        where the path reaches self.step_length is found by a root search.
 
-        # Hessian update
-        dx = self.mw_coords - self.irc_mw_coords[-1]
-        dg = mw_grad - self.irc_mw_gradients[-1]
-        dH, key = self.hessian_update_func(self.mw_hessian, dx, dg)
-        self.mw_hessian += dH
-        self.log(f"Did {key} hessian update after predictor step.\n")
-        self.dwi.update(self.mw_coords.copy(), energy, mw_grad, self.mw_hessian.copy())
-        if self.dump_dwi:
-            self.dwi.dump(f"dwi_{self.cur_direction}_{self.cur_cycle:0{self.cycle_places}d}.h5")
+        Returns the same quantities as euler_predictor_step."""
+        w, v = np.linalg.eigh(self.mw_hessian)
+        grad_eig = v.T @ mw_grad
 
-        corrected_mw_coords = self.corr_func(
-                                init_mw_coords,
-                                self.step_length,
-                                self.dwi
+        def get_step_eig(t):
+            wt = w * t
+            with np.errstate(over="ignore", invalid="ignore"):
+                factors = np.where(
+                    np.abs(wt) > 1e-12, -np.expm1(-wt) / np.where(w == 0., 1., w), t
+                )
+            return -grad_eig * factors
+
+        def get_mw_step(t):
+            return v @ get_step_eig(t)
+
+        def length_diff(t):
+            return np.linalg.norm(get_mw_step(t) / self.m_sqrt) - self.step_length
+
+        # Bracket the root. Start with the parameter that a straight step
+        # along the initial gradient would need.
+        t_lo = 0.
+        t_hi = self.step_length / np.linalg.norm(self.unweight_vec(mw_grad))
+        for _ in range(max_doublings):
+            diff = length_diff(t_hi)
+            if (not np.isfinite(diff)) or (diff >= 0.):
+                break
+            t_lo = t_hi
+            t_hi *= 2
+        else:
+            # The path ends in the minimum of the quadratic model before
+            # self.step_length is reached.
+            mw_step = get_mw_step(t_hi)
+            self.log("Analytic predictor path ended after Δs="
+                     f"{np.linalg.norm(mw_step / self.m_sqrt):.4f} "
+                     f"(desired Δs={self.step_length:.4f})."
+            )
+            mw_grad_eig = grad_eig + w * get_step_eig(t_hi)
+            return init_mw_coords + mw_step, v @ mw_grad_eig, False
+
+        # Shrink the bracket when the step length overflowed at t_hi
+        while not np.isfinite(length_diff(t_hi)):
+            t_hi = (t_lo + t_hi) / 2
+        t = brentq(length_diff, t_lo, t_hi, xtol=1e-14, rtol=1e-12)
+        step_eig = get_step_eig(t)
+        mw_step = v @ step_eig
+        pred_mw_grad = v @ (grad_eig + w * step_eig)
+        self.log("Analytic predictor step converged with "
+                 f"Δs={np.linalg.norm(mw_step / self.m_sqrt):.4f} "
+                 f"(desired Δs={self.step_length:.4f}) at t={t:.6f}."
         )
-        self.mw_coords = corrected_mw_coords
-        corr_step_length = get_integration_length(self.mw_coords)
-        self.log(f"Corrected unweighted step length: {corr_step_length:.6f}")
+        return init_mw_coords + mw_step, pred_mw_grad, True
 
     def corrector_step(self, init_mw_coords, step_length, dwi):
         self.log("Corrector step using mBS integration")
@@ -54,7 +54,7 @@ class IRC:
         self.dump_fn = dump_fn
         self.dump_every = int(dump_every)
 
-        self._m_sqrt = np.sqrt(self.geometry.masses_rep)
+        self._m_sqrt = self.geometry.masses_rep_sqrt
 
         self.all_energies = list()
         self.all_coords = list()
@@ -159,7 +159,6 @@ class IRC:
 
         See https://aip.scitation.org/doi/pdf/10.1063/1.454172?class=pdf
         """
-        mm_sqr_inv = self.geometry.mm_sqrt_inv
         mw_hessian = self.mass_weigh_hessian(self.init_hessian)
         try:
             if not self.geometry.calculator.analytical_2d:
@@ -175,7 +174,7 @@ class IRC:
         mw_trans_vec = eigvecs[:,self.mode]
         self.mw_transition_vector = mw_trans_vec
         # Un-mass-weight the transition vector
-        trans_vec = mm_sqr_inv.dot(mw_trans_vec)
+        trans_vec = mw_trans_vec / self.m_sqrt
         self.transition_vector = trans_vec / np.linalg.norm(trans_vec)
 
         if self.downhill:
@@ -1,4 +1,5 @@
 import numpy as np
+from scipy.sparse.linalg import aslinearoperator, lsqr, LinearOperator
 
 
 def gram_schmidt(vecs, thresh=1e-8):
@@ -36,3 +37,36 @@ def svd_inv(array, thresh, hermitian=False):
     S_inv = np.zeros_like(S)
     S_inv[keep] = 1 / S[keep]
     return Vt.T.dot(np.diag(S_inv)).dot(U.T)
+
+
+def lsqr_pinv(A, conlim=1e8, atol=1e-12, btol=1e-12, iter_lim=None):
+    """Generalized inverse A⁺ of a (sparse) matrix as LinearOperator.
+
+    A⁺ is never formed explicitly. Products A⁺.b (matvec) and (A^T)⁺.b
+    (rmatvec) are minimum norm least squares solutions obtained by LSQR,
+    which only requires sparse matrix-vector products with A and A^T.
+
+    Contrary to svd_inv, LSQR can't drop individual small singular values.
+    Singular values that are numerically zero don't contribute to the
+    minimum norm solution, so both agree when A has no singular values
+    close to the threshold. Near-singular directions are only damped, as
+    LSQR stops when its estimate of cond(A) exceeds 'conlim'.
+    """
+    A = aslinearoperator(A)
+    lsqr_kwargs = {
+        "atol": atol,
+        "btol": btol,
+        "conlim": conlim,
+        "iter_lim": iter_lim,
+    }
+
+    def matvec(b):
+        return lsqr(A, b, **lsqr_kwargs)[0]
+
+    def rmatvec(b):
+        return lsqr(A.T, b, **lsqr_kwargs)[0]
+
+    rows, cols = A.shape
+    return LinearOperator(
+        (cols, rows), matvec=matvec, rmatvec=rmatvec, dtype=A.dtype
+    )
@@ -0,0 +1,216 @@
+"""Numerical Hessians from central finite differences of forces.
+
+For every Cartesian coordinate q_j two gradient calculations at q_j ± h are
+run. Column j of the Hessian is then
+
+    H[:, j] = -(F(q_j + h) - F(q_j - h)) / 2h .
+
+All displacements are independent, so they are run through an executor
+(see pysisyphus.executors), every job with its own copy of the calculator.
+The results of finished displacements can be stored in a directory, so an
+interrupted calculation can be restarted.
+"""
+
+import copy
+import logging
+from pathlib import Path
+
+import numpy as np
+
+from pysisyphus.executors import get_executor
+
+
+logger = logging.getLogger("numhess")
+
+
+def get_cart_inds(atom_inds):
+    atom_inds = np.array(atom_inds, dtype=int)
+    return (3 * atom_inds[:, None] + np.arange(3)).flatten()
+
+
+def get_displacement_keys(atom_num, atom_inds=None, trans_invariant=False):
+    """Keys (cart_ind, sign) of all displacements that have to be calculated.
+
+    With 'trans_invariant' the last atom is not displaced, as its Hessian
+    columns follow from translational invariance."""
+    if atom_inds is None:
+        atom_inds = range(atom_num)
+        if trans_invariant and atom_num > 1:
+            atom_inds = range(atom_num - 1)
+    cart_inds = get_cart_inds(list(atom_inds))
+    return [(int(cart_ind), sign) for cart_ind in cart_inds for sign in (1, -1)]
+
+
+def get_displaced_coords(cart_coords, key, step_size):
+    cart_ind, sign = key
+    coords = cart_coords.copy()
+    if cart_ind is not None:
+        coords[cart_ind] += sign * step_size
+    return coords
+
+
+def get_restart_fn(restart_dir, key):
+    cart_ind, sign = key
+    if cart_ind is None:
+        name = "numhess_ref.npz"
+    else:
+        name = f"numhess_{cart_ind:05d}_{'p' if sign > 0 else 'm'}.npz"
+    return Path(restart_dir) / name
+
+
+def load_results(restart_dir, key, coords):
+    """Results of a displacement stored in 'restart_dir', if they were
+    calculated at the given coordinates."""
+    fn = get_restart_fn(restart_dir, key)
+    try:
+        data = np.load(fn)
+    except FileNotFoundError:
+        return None
+    if not np.allclose(data["coords"], coords, rtol=0.0, atol=1e-10):
+        logger.debug(f"Coordinates in '{fn}' don't match. Ignoring it.")
+        return None
+    return {
+        "energy": float(data["energy"]),
+        "forces": data["forces"],
+    }
+
+
+def save_results(restart_dir, key, coords, results):
+    fn = get_restart_fn(restart_dir, key)
+    np.savez(fn, coords=coords, energy=results["energy"], forces=results["forces"])
+
+
+def clone_calculator(calculator, job_ind):
+    """Independent copy of a calculator for one displacement. Copies derived
+    from Calculator get distinct file names."""
+    clone = copy.deepcopy(calculator)
+    if hasattr(clone, "base_name"):
+        clone.base_name = f"{clone.base_name}_numhess"
+        clone.calc_number = job_ind
+    return clone
+
+
+def numerical_hessian(
+    calculator,
+    atoms,
+    cart_coords,
+    step_size=0.005,
+    atom_inds=None,
+    trans_invariant=False,
+    executor=None,
+    scheduler=None,
+    max_workers=None,
+    chunk_size=None,
+    restart_dir=None,
+):
+    """Cartesian Hessian from central differences of forces.
+
+    Parameters
+    ----------
+    calculator : Calculator
+        Any calculator implementing get_forces.
+    atoms : iterable
+        Atom descriptors (element symbols).
+    cart_coords : np.array, 1d
+        Cartesian coordinates in Bohr.
+    step_size : float, optional
+        Displacement in Bohr.
+    atom_inds : iterable of int, optional
+        Only displace these atoms and return a partial Hessian. The rows and
+        columns belonging to the other atoms are known for these atoms only,
+        the block of the not-displaced atoms is zero.
+    trans_invariant : bool, optional
+        Skip the displacements of the last atom and derive its columns from
+        translational invariance, i.e., Σ_B H[:, 3B+k] = 0. Only valid for
+        energies that don't depend on the absolute position, e.g., not with
+        external potentials. Ignored for partial Hessians.
+    executor : str, optional
+        Kind of the executor running the displacements. See
+        pysisyphus.executors.get_executor.
+    scheduler : str, optional
+        Address of a dask scheduler.
+    max_workers : int, optional
+        Number of workers of the executor.
+    chunk_size : int, optional
+        Number of displacements that are submitted together. Results are
+        stored after every chunk. Defaults to all displacements.
+    restart_dir : str or Path, optional
+        Results of every displacement are stored in this directory and
+        already present results at the same coordinates are reused.
+
+    Returns
+    -------
+    results : dict
+        Dictionary containing the energy at the reference coordinates and
+        the Hessian.
+    """
+    cart_coords = np.array(cart_coords, dtype=float).flatten()
+    size_ = cart_coords.size
+    atom_num = size_ // 3
+    partial = atom_inds is not None
+    keys = [(None, 0)] + get_displacement_keys(
+        atom_num, atom_inds=atom_inds, trans_invariant=trans_invariant
+    )
+
+    all_results = dict()
+    if restart_dir is not None:
+        restart_dir = Path(restart_dir)
+        restart_dir.mkdir(parents=True, exist_ok=True)
+        for key in keys:
+            coords = get_displaced_coords(cart_coords, key, step_size)
+            results = load_results(restart_dir, key, coords)
+            if results is not None:
+                all_results[key] = results
+        logger.debug(f"Loaded {len(all_results)} displacements from '{restart_dir}'.")
+
+    job_inds = {key: i for i, key in enumerate(keys)}
+    todo = [key for key in keys if key not in all_results]
+    if chunk_size is None:
+        chunk_size = max(len(todo), 1)
+    with get_executor(executor, scheduler=scheduler, max_workers=max_workers) as exe:
+        for chunk_start in range(0, len(todo), chunk_size):
+            chunk = todo[chunk_start : chunk_start + chunk_size]
+            calcs = [clone_calculator(calculator, job_inds[key]) for key in chunk]
+            coords_list = [
+                get_displaced_coords(cart_coords, key, step_size) for key in chunk
+            ]
+            chunk_results = exe.map(calcs, [atoms] * len(chunk), coords_list)
+            # Don't keep the clones registered on the workers
+            exe.retain(list())
+            for key, coords, results in zip(chunk, coords_list, chunk_results):
+                all_results[key] = results
+                if restart_dir is not None:
+                    save_results(restart_dir, key, coords, results)
+            logger.debug(
+                f"Calculated {chunk_start+len(chunk)}/{len(todo)} displacements."
+            )
+
+    # Assemble Hessian columns
+    cart_inds = sorted(set([cart_ind for cart_ind, _ in keys[1:]]))
+    columns = np.zeros((size_, len(cart_inds)))
+    for i, cart_ind in enumerate(cart_inds):
+        plus = all_results[(cart_ind, 1)]["forces"]
+        minus = all_results[(cart_ind, -1)]["forces"]
+        columns[:, i] = -(plus - minus) / (2 * step_size)
+
+    hessian = np.zeros((size_, size_))
+    hessian[:, cart_inds] = columns
+    if partial:
+        hessian[cart_inds, :] = columns.T
+    elif len(cart_inds) < size_:
+        # Columns of the last atom from translational invariance
+        hessian[:, -3:] = -columns.reshape(size_, -1, 3).sum(axis=1)
+    # Symmetrize
+    hessian = (hessian + hessian.T) / 2
+
+    return {
+        "energy": all_results[(None, 0)]["energy"],
+        "hessian": hessian,
+    }
+
+
+def numerical_geom_hessian(geom, **kwargs):
+    """Numerical Cartesian Hessian of a Geometry, set as its cart_hessian."""
+    results = numerical_hessian(geom.calculator, geom.atoms, geom.cart_coords, **kwargs)
+    geom.set_results(results)
+    return geom.cart_hessian
@@ -136,7 +136,8 @@ class HessianOptimizer(Optimizer):
         if hessian_init is None:
             hessian_init = self.hessian_init
 
-        self.H, hess_str = get_guess_hessian(self.geometry, hessian_init)
+        # Diagonal (model) Hessians are returned as 1d arrays
+        H, hess_str = get_guess_hessian(self.geometry, hessian_init, diagonal=True)
         self.log(f"Using {hess_str} Hessian.")
 
         # Dump to disk if hessian was calculated
@@ -150,7 +151,12 @@ class HessianOptimizer(Optimizer):
             and hessian_init != "calc"
         ):
             U = self.geometry.internal.U
-            self.H = U.T.dot(self.H).dot(U)
+            if H.ndim == 1:
+                H = (U.T * H).dot(U)
+            else:
+                H = U.T.dot(H).dot(U)
+        # The Hessian updates in the following cycles require a full matrix
+        self.H = np.diag(H) if (H.ndim == 1) else H
 
         if self.hessian_recalc_adapt:
             self.adapt_norm = np.linalg.norm(self.geometry.forces)
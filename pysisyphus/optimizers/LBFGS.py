@@ -51,8 +51,8 @@ class LBFGS(Optimizer):
                 vector_lists=(self.steps, self.forces, self.coord_diffs, self.grad_diffs)
             )
             rot_steps, rot_forces, rot_coord_diffs, rot_grad_diffs = rot_vec_lists
-            self.steps = rot_steps
-            self.forces = rot_forces
+            self.steps[:] = rot_steps
+            self.forces[:] = rot_forces
             self.coord_diffs = rot_coord_diffs
             self.grad_diffs = rot_grad_diffs
 
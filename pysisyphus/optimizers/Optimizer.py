@@ -6,6 +6,7 @@ import sys
 import textwrap
 import time
 
+import h5py
 import numpy as np
 import yaml
 
@@ -13,6 +14,7 @@ from pysisyphus.cos.ChainOfStates import ChainOfStates
 from pysisyphus.helpers import check_for_end_sign, highlight_text, get_coords_diffs
 from pysisyphus.intcoords.exceptions import RebuiltInternalsException
 from pysisyphus.io.hdf5 import get_h5_group, resize_h5_group
+from pysisyphus.optimizers.history import History, HistoryStore
 
 
 def get_data_model(geometry, is_cos, max_cycles):
@@ -74,7 +76,8 @@ class Optimizer(metaclass=abc.ABCMeta):
                  rms_force=None, rms_force_only=False, align=False, dump=False,
                  dump_restart=None, prefix="", reparam_thresh=1e-3, overachieve_factor=0.,
                  restart_info=None, check_coord_diffs=True, coord_diff_thresh=0.01,
-                 h5_fn="optimization.h5", h5_group_name="opt"):
+                 h5_fn="optimization.h5", h5_group_name="opt", history_window=None,
+                 history_compression=None):
         assert thresh in self.CONV_THRESHS.keys()
 
         self.geometry = geometry
@@ -109,6 +112,17 @@ class Optimizer(metaclass=abc.ABCMeta):
             os.mkdir(self.out_dir)
         self.h5_fn = self.out_dir / h5_fn
         self.h5_group_name = h5_group_name
+        # Handle of the HDF5 file is kept open during the optimization
+        self.h5_handle = None
+        # Number of cycles kept in memory. Older cycles are moved to the
+        # HDF5 file. By default everything is kept in memory.
+        self.history_window = history_window
+        self.history_store = None
+        if self.history_window is not None:
+            self.history_store = HistoryStore(
+                self.h5_fn, f"{self.h5_group_name}_history",
+                compression=history_compression,
+            )
 
         current_fn = "current_geometries.trj" if self.is_cos else "current_geometry.xyz"
         self.current_fn = self.get_path_for_fn(current_fn)
@@ -122,11 +136,11 @@ class Optimizer(metaclass=abc.ABCMeta):
 
         self.logger = logging.getLogger("optimizer")
 
-        # Setting some empty lists as default. The actual shape of the respective
+        # Setting some empty histories as default. The actual shape of the respective
         # entries is not considered, which gives us some flexibility.
         self.data_model = get_data_model(self.geometry, self.is_cos, self.max_cycles)
         for la in self.data_model.keys():
-            setattr(self, la, list())
+            setattr(self, la, History(la, self.history_window, self.history_store))
 
         if self.dump:
             out_trj_fn = self.get_path_for_fn("optimization.trj")
@@ -312,9 +326,22 @@ class Optimizer(metaclass=abc.ABCMeta):
             as_xyz = image.as_xyz(comment)
             self.write_to_out_dir(image_fn, as_xyz+"\n", "a")
 
+    def get_h5_group(self):
+        """Results group in the HDF5 file, that is only opened once."""
+        if self.h5_handle is None:
+            self.h5_handle = h5py.File(self.h5_fn, mode="a")
+        return self.h5_handle[self.h5_group_name]
+
+    def close_h5(self):
+        if self.h5_handle is not None:
+            self.h5_handle.close()
+            self.h5_handle = None
+        if self.history_store is not None:
+            self.history_store.close()
+
     def write_results(self):
         # Save results from the Optimizer to HDF5 file if requested
-        h5_group = get_h5_group(self.h5_fn, self.h5_group_name)
+        h5_group = self.get_h5_group()
 
         # Some attributes never change and are only set in the first cycle
         if self.cur_cycle == 0:
@@ -344,7 +371,7 @@ class Optimizer(metaclass=abc.ABCMeta):
             else:
                 h5_group[key][self.cur_cycle] = value[-1]
 
-        h5_group.file.close()
+        h5_group.file.flush()
 
     def write_cycle_to_file(self):
         as_xyz_str = self.geometry.as_xyz()
@@ -382,6 +409,12 @@ class Optimizer(metaclass=abc.ABCMeta):
             int_str = f"""
             \tmax(forces, internal): {max_int_forces:.6f} hartree/(bohr,rad)
             \trms(forces, internal): {rms_int_forces:.6f} hartree/(bohr,rad)"""
+            try:
+                internal = self.geometry.internal
+                int_str += f"""
+            \tB-matrix inversions: {internal.inversion_counter} in {internal.inversion_time:.2f} s"""
+            except AttributeError:
+                pass
         energy = self.geometry.energy
         final_summary = f"""
         Final summary:{int_str}
@@ -401,138 +434,145 @@ class Optimizer(metaclass=abc.ABCMeta):
 
         self.print_header()
         self.stopped = False
-        # Actual optimization loop
-        for self.cur_cycle in range(self.last_cycle, self.max_cycles):
-            start_time = time.time()
-            self.log(highlight_text(f"Cycle {self.cur_cycle:03d}"))
-
-            if self.is_cos and self.check_coord_diffs:
-                image_coords = [image.cart_coords for image in self.geometry.images]
-                align = len(image_coords[0]) > 3
-                cds = get_coords_diffs(image_coords, align=align)
-                # Differences of coordinate differences ;)
-                cds_diffs = np.diff(cds)
-                min_ind = cds_diffs.argmin()
-                if cds_diffs[min_ind] < self.coord_diff_thresh:
-                    similar_inds = min_ind, min_ind+1
-                    msg = f"Cartesian coordinates of images {similar_inds} are " \
-                           "too similar. Stopping optimization!"
-                    # I should improve my logging :)
-                    print(msg)
-                    self.log(msg)
-                    break
+        try:
+            # Actual optimization loop
+            for self.cur_cycle in range(self.last_cycle, self.max_cycles):
+                start_time = time.time()
+                self.log(highlight_text(f"Cycle {self.cur_cycle:03d}"))
+
+                if self.is_cos and self.check_coord_diffs:
+                    image_coords = [image.cart_coords for image in self.geometry.images]
+                    align = len(image_coords[0]) > 3
+                    cds = get_coords_diffs(image_coords, align=align)
+                    # Differences of coordinate differences ;)
+                    cds_diffs = np.diff(cds)
+                    min_ind = cds_diffs.argmin()
+                    if cds_diffs[min_ind] < self.coord_diff_thresh:
+                        similar_inds = min_ind, min_ind+1
+                        msg = f"Cartesian coordinates of images {similar_inds} are " \
+                               "too similar. Stopping optimization!"
+                        # I should improve my logging :)
+                        print(msg)
+                        self.log(msg)
+                        break
 
-            # Check if something considerably changed in the optimization,
-            # e.g. new images were added/interpolated. Then the optimizer
-            # should be reset.
-            reset_flag = False
-            if self.cur_cycle > 0 and self.is_cos:
-                reset_flag = self.geometry.prepare_opt_cycle(self.coords[-1],
-                                                             self.energies[-1],
-                                                             self.forces[-1])
-            # Reset when number of coordinates changed
-            elif self.cur_cycle > 0:
-                reset_flag = reset_flag or (self.geometry.coords.size != self.coords[-1].size)
-
-            if reset_flag:
-                self.reset()
-
-            self.coords.append(self.geometry.coords.copy())
-            self.cart_coords.append(self.geometry.cart_coords.copy())
-
-            # Determine and store number of currenctly actively optimized images
-            try:
-                image_inds = self.geometry.image_inds
-                image_num = len(image_inds)
-            except AttributeError:
-                image_inds = [0, ]
-                image_num = 1
-            self.image_inds.append(image_inds)
-            self.image_nums.append(image_num)
+                # Check if something considerably changed in the optimization,
+                # e.g. new images were added/interpolated. Then the optimizer
+                # should be reset.
+                reset_flag = False
+                if self.cur_cycle > 0 and self.is_cos:
+                    reset_flag = self.geometry.prepare_opt_cycle(self.coords[-1],
+                                                                 self.energies[-1],
+                                                                 self.forces[-1])
+                # Reset when number of coordinates changed
+                elif self.cur_cycle > 0:
+                    reset_flag = reset_flag or (self.geometry.coords.size != self.coords[-1].size)
+
+                if reset_flag:
+                    self.reset()
+
+                self.coords.append(self.geometry.coords.copy())
+                self.cart_coords.append(self.geometry.cart_coords.copy())
+
+                # Determine and store number of currenctly actively optimized images
+                try:
+                    image_inds = self.geometry.image_inds
+                    image_num = len(image_inds)
+                except AttributeError:
+                    image_inds = [0, ]
+                    image_num = 1
+                self.image_inds.append(image_inds)
+                self.image_nums.append(image_num)
+
+                step = self.optimize()
+
+                if step is None:
+                    # Remove the previously added coords
+                    self.coords.pop(-1)
+                    self.cart_coords.pop(-1)
+                    continue
 
-            step = self.optimize()
+                if self.is_cos:
+                    self.tangents.append(self.geometry.get_tangents().flatten())
 
-            if step is None:
-                # Remove the previously added coords
-                self.coords.pop(-1)
-                self.cart_coords.pop(-1)
-                continue
+                self.steps.append(step)
 
-            if self.is_cos:
-                self.tangents.append(self.geometry.get_tangents().flatten())
+                # Convergence check
+                self.is_converged = self.check_convergence()
 
-            self.steps.append(step)
+                end_time = time.time()
+                elapsed_seconds = end_time - start_time
+                self.cycle_times.append(elapsed_seconds)
 
-            # Convergence check
-            self.is_converged = self.check_convergence()
+                if self.dump:
+                    self.write_cycle_to_file()
+                    with open(self.current_fn, "w") as handle:
+                        handle.write(self.geometry.as_xyz())
 
-            end_time = time.time()
-            elapsed_seconds = end_time - start_time
-            self.cycle_times.append(elapsed_seconds)
+                if self.dump and self.dump_restart \
+                   and (self.cur_cycle % self.dump_restart) == 0:
+                    self.dump_restart_info()
 
-            if self.dump:
-                self.write_cycle_to_file()
-                with open(self.current_fn, "w") as handle:
-                    handle.write(self.geometry.as_xyz())
-
-            if self.dump and self.dump_restart \
-               and (self.cur_cycle % self.dump_restart) == 0:
-                self.dump_restart_info()
-
-            self.print_opt_progress()
-            if self.is_converged:
-                print("Converged!")
-                print()
-                break
-
-            # Update coordinates
-            new_coords = self.geometry.coords.copy() + step
-            try:
-                self.geometry.coords = new_coords
-                # Use the actual step. It may differ from the proposed step
-                # when internal coordinates are used, as the internal-Cartesian
-                # transformation is done iteratively.
-                self.steps[-1] = self.geometry.coords - self.coords[-1]
-            except RebuiltInternalsException as exception:
-                print("Rebuilt internal coordinates")
-                with open("rebuilt_primitives.xyz", "w") as handle:
-                    handle.write(self.geometry.as_xyz())
-                if self.is_cos:
-                    for image in self.geometry.images:
-                        image.reset_coords(exception.typed_prims)
-                self.reset()
-
-            if hasattr(self.geometry, "reparametrize"):
-                reparametrized = self.geometry.reparametrize()
-                cur_coords = self.geometry.coords
-                prev_coords = self.coords[-1]
-
-                if reparametrized and (cur_coords.size == prev_coords.size):
-                    self.log("Did reparametrization")
-
-                    rms = np.sqrt(np.mean((prev_coords - cur_coords)**2))
-                    self.log(f"rms of coordinates after reparametrization={rms:.6f}")
-                    self.is_converged = rms < self.reparam_thresh
-                    if self.is_converged:
-                        print("Insignificant coordinate change after "
-                              "reparametrization. Signalling convergence!"
-                        )
-                        print()
-                        break
+                self.print_opt_progress()
+                if self.is_converged:
+                    print("Converged!")
+                    print()
+                    break
 
-            sys.stdout.flush()
-            sign = check_for_end_sign()
-            if sign == "stop":
-                self.stopped = True
-                break
-            elif sign == "converged":
-                self.converged = True
-                print("Operator indicated convergence!")
-                break
-
-            self.log("")
-        else:
-            print("Number of cycles exceeded!")
+                # Update coordinates
+                new_coords = self.geometry.coords.copy() + step
+                try:
+                    self.geometry.coords = new_coords
+                    # Use the actual step. It may differ from the proposed step
+                    # when internal coordinates are used, as the internal-Cartesian
+                    # transformation is done iteratively.
+                    self.steps[-1] = self.geometry.coords - self.coords[-1]
+                except RebuiltInternalsException as exception:
+                    print("Rebuilt internal coordinates")
+                    with open("rebuilt_primitives.xyz", "w") as handle:
+                        handle.write(self.geometry.as_xyz())
+                    if self.is_cos:
+                        for image in self.geometry.images:
+                            image.reset_coords(exception.typed_prims)
+                    self.reset()
+
+                if hasattr(self.geometry, "reparametrize"):
+                    reparametrized = self.geometry.reparametrize()
+                    cur_coords = self.geometry.coords
+                    prev_coords = self.coords[-1]
+
+                    if reparametrized and (cur_coords.size == prev_coords.size):
+                        self.log("Did reparametrization")
+
+                        rms = np.sqrt(np.mean((prev_coords - cur_coords)**2))
+                        self.log(f"rms of coordinates after reparametrization={rms:.6f}")
+                        self.is_converged = rms < self.reparam_thresh
+                        if self.is_converged:
+                            print("Insignificant coordinate change after "
+                                  "reparametrization. Signalling convergence!"
+                            )
+                            print()
+                            break
+
+                sys.stdout.flush()
+                sign = check_for_end_sign()
+                if sign == "stop":
+                    self.stopped = True
+                    break
+                elif sign == "converged":
+                    self.converged = True
+                    print("Operator indicated convergence!")
+                    break
+
+                self.log("")
+            else:
+                print("Number of cycles exceeded!")
+        finally:
+            # Always release the workers of the ChainOfStates executor, even
+            # when a calculation failed.
+            if self.is_cos:
+                self.geometry.shutdown_executor()
+            self.close_h5()
 
         # Outside loop
         if self.dump:
@@ -563,14 +603,19 @@ class Optimizer(metaclass=abc.ABCMeta):
             "geom_info": self.geometry.get_restart_info(),
             "last_cycle": self.cur_cycle,
             "max_cycles": self.max_cycles,
-            "energies": self.energies,
-            "coords": self.coords,
+            "energies": list(self.energies),
+            "coords": list(self.coords),
             "forces": [forces.tolist() for forces in self.forces],
             "steps": [step.tolist() for step in self.steps],
         }
         restart_info.update(self._get_opt_restart_info())
         return restart_info
 
+    def set_history(self, key, items):
+        history = getattr(self, key)
+        history.clear()
+        history.extend(items)
+
     def set_restart_info(self, restart_info):
         # Set restart information general to all optimizers
         self.last_cycle = restart_info["last_cycle"] + 1
@@ -584,10 +629,10 @@ class Optimizer(metaclass=abc.ABCMeta):
                 resize_h5_group(h5_group, self.max_cycles)
                 h5_group.file.close()
 
-        self.coords = [np.array(coords) for coords in restart_info["coords"]]
-        self.energies = restart_info["energies"]
-        self.forces = [np.array(forces) for forces in restart_info["forces"]]
-        self.steps = [np.array(step) for step in restart_info["steps"]]
+        self.set_history("coords", [np.array(coords) for coords in restart_info["coords"]])
+        self.set_history("energies", restart_info["energies"])
+        self.set_history("forces", [np.array(forces) for forces in restart_info["forces"]])
+        self.set_history("steps", [np.array(step) for step in restart_info["steps"]])
 
         # Set subclass specific information
         self._set_opt_restart_info(restart_info)
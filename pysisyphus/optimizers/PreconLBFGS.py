@@ -1,7 +1,6 @@
 from collections import deque
 
 import numpy as np
-from scipy.sparse.linalg import spsolve
 
 from pysisyphus.calculators import Dimer
 from pysisyphus.line_searches import *
@@ -18,6 +17,7 @@ class PreconLBFGS(Optimizer):
         history=7,
         precon=True,
         precon_update=None,
+        precon_rebuild_thresh=0.0,
         max_step_element=None,
         line_search="armijo",
         c_stab=None,
@@ -29,6 +29,9 @@ class PreconLBFGS(Optimizer):
         # Set before calling the superclass constructor so we can the value
         # in _set_opt_restart_info.
         self.history = history
+        # Rebuild the preconditioner only when an atom moved by more than
+        # this threshold (in Bohr) since the last build.
+        self.precon_rebuild_thresh = float(precon_rebuild_thresh)
 
         super().__init__(geometry, **kwargs)
 
@@ -76,9 +79,19 @@ class PreconLBFGS(Optimizer):
             self.grad_diffs = deque(maxlen=self.history)
             self.steps_ = deque(maxlen=self.history)
 
+    def get_precon_getter(self, c_stab=None):
+        if c_stab is None:
+            c_stab = self.c_stab
+        return precon_getter(
+            self.geometry,
+            c_stab=c_stab,
+            rebuild_thresh=self.precon_rebuild_thresh,
+            logger=self.logger,
+        )
+
     def prepare_opt(self):
         if self.precon:
-            self.precon_getter = precon_getter(self.geometry, c_stab=self.c_stab)
+            self.precon_getter = self.get_precon_getter()
 
     def _get_opt_restart_info(self):
         opt_restart_info = {
@@ -97,7 +110,7 @@ class PreconLBFGS(Optimizer):
         )
 
         c_stab = opt_restart_info["c_stab"]
-        self.precon_getter = precon_getter(self.geometry, c_stab=c_stab)
+        self.precon_getter = self.get_precon_getter(c_stab=c_stab)
 
     def optimize(self):
         forces = self.geometry.forces
@@ -120,19 +133,18 @@ class PreconLBFGS(Optimizer):
             and self.cur_cycle > 0
             and self.cur_cycle % self.precon_update == 0
         ):
-            self.precon_getter = precon_getter(self.geometry, c_stab=self.c_stab)
+            self.precon_getter = self.get_precon_getter()
 
         # Construct preconditoner if requested
-        P = None
+        P_solve = None
         if self.precon:
-            P = self.precon_getter(self.geometry.coords)
-            self.log("Calculated new preconditioner P")
-            step = spsolve(P, forces)
+            _, P_solve = self.precon_getter(self.geometry.coords)
+            step = P_solve(forces)
 
         if self.cur_cycle > 0:
             self.grad_diffs.append(-forces - -self.forces[-2])
             self.steps_.append(self.steps[-1])
-            step = bfgs_multiply(self.steps_, self.grad_diffs, forces, P=P)
+            step = bfgs_multiply(self.steps_, self.grad_diffs, forces, P=P_solve)
 
         step_dir = step / np.linalg.norm(step)
 
@@ -43,7 +43,9 @@ def bfgs_multiply(s_list, y_list, vector, beta=1, P=None, logger=None,
     rhos = rhos[::-1]
 
     if P is not None:
-        r = spsolve(P, q)
+        # P may also be a function solving P.r = q, e.g., using a cached
+        # factorization of P.
+        r = P(q) if callable(P) else spsolve(P, q)
         msg = "preconditioner."
     elif gamma_mult and (cycles > 0):
         s = s_list[-1]
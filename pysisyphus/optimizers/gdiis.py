@@ -51,7 +51,8 @@ def valid_diis_direction(diis_step, ref_step, use):
 
 
 def from_coeffs(vec, coeffs):
-    return np.sum(coeffs[:,None] * vec[::-1][:len(coeffs)], axis=0)
+    # Only access the last items, as 'vec' may be a bounded optimizer history.
+    return np.sum(coeffs[:,None] * np.array(vec[-len(coeffs):][::-1]), axis=0)
 
 
 def diis_result(coeffs, coords, forces, energy=None, prefix=""):
@@ -142,9 +143,9 @@ def gdiis(err_vecs, coords, forces, ref_step, max_vecs=5):
 def gediis(coords, energies, forces, hessian=None, max_vecs=3):
     use = min(len(coords), max_vecs)
 
-    R = coords[::-1][:use]
-    E = np.ravel(energies[::-1][:use])
-    f = forces[::-1][:use]
+    R = np.array(coords[-use:][::-1])
+    E = np.ravel(energies[-use:][::-1])
+    f = np.array(forces[-use:][::-1])
     assert len(R) == len(E) == len(f)
     log(f"Trying GEDIIS with {use} previous cycles.")
     # Precompute values so they can be reused in fun()
@@ -5,62 +5,75 @@
 # [3] https://onlinelibrary.wiley.com/doi/full/10.1002/qua.21049
 #     Swart, Bickelhaupt, 2006
 
-from math import exp
 import itertools as it
 
 import h5py
 import numpy as np
-from scipy.spatial.distance import pdist, squareform
 
 from pysisyphus.calculators.XTB import XTB
-from pysisyphus.intcoords.setup import get_pair_covalent_radii
+from pysisyphus.elem_data import COVALENT_RADII as CR
+from pysisyphus.intcoords.setup import get_bond_sets
 from pysisyphus.io.hessian import save_hessian
 
 
-def fischer_guess(geom):
-    cdm = pdist(geom.coords3d)
-    pair_cov_radii = get_pair_covalent_radii(geom.atoms)
+def get_prim_pair_data(geom):
+    """Distances and covalent radii sums of the atom pairs in primitives.
 
-    dihedrals = geom.internal.dihedrals
+    Only the pairs of consecutive atoms in every primitive are considered, so
+    no full distance matrix has to be built. Primitives are grouped by their
+    number of atoms. Yields tuples (atom_num, prim_inds, inds, dists, cov_radii),
+    with 'inds' of shape (len(prim_inds), atom_num) and 'dists' and 'cov_radii'
+    of shape (len(prim_inds), atom_num-1).
+    """
+    primitives = geom.internal.primitives
+    coords3d = geom.coords3d
+    atom_cov_radii = np.array([CR[atom.lower()] for atom in geom.atoms])
+    prim_inds = dict()
+    for i, prim in enumerate(primitives):
+        prim_inds.setdefault(len(prim.indices), list()).append(i)
+    for atom_num, inds_ in prim_inds.items():
+        inds = np.array([primitives[i].indices for i in inds_], dtype=int)
+        first, second = inds[:, :-1], inds[:, 1:]
+        dists = np.linalg.norm(coords3d[first] - coords3d[second], axis=2)
+        cov_radii = atom_cov_radii[first] + atom_cov_radii[second]
+        yield atom_num, np.array(inds_), inds, dists, cov_radii
+
+
+def diag_hessian(h_diag, diagonal=False):
+    """Return a diagonal model Hessian as 1d array or as dense matrix."""
+    h_diag = np.array(h_diag, dtype=float)
+    return h_diag if diagonal else np.diagflat(h_diag)
+
+
+def fischer_guess(geom, diagonal=False):
+    primitives = geom.internal.primitives
     # For the dihedral force constants we also have to count the number
     # of bonds formed with the centrals atoms of the dihedral.
-    central_atoms = [dh.inds[1:3] for dh in dihedrals]
-    bond_factor = geom.internal.bond_factor
-    bond_mat = squareform(cdm <= (pair_cov_radii * bond_factor))
-    tors_atom_bonds = dict()
-    for a, b in central_atoms:
-        # Substract 2, as we don't want the bond between a and b,
-        # but this bond will be in both rows of the bond_mat.
-        bond_sum = bond_mat[a].sum() + bond_mat[b].sum() - 2
-        tors_atom_bonds[(a, b)] = bond_sum
-
-    dist_mat = squareform(cdm)
-    pair_cov_radii_mat = squareform(pair_cov_radii)
-
-    def h_bond(bond):
-        a, b = bond.indices
-        r_ab = dist_mat[a, b]
-        r_ab_cov = pair_cov_radii_mat[a, b]
-        return 0.3601 * exp(-1.944*(r_ab - r_ab_cov))
-
-    def h_bend(bend):
-        b, a, c = bend.indices
-        r_ab = dist_mat[a, b]
-        r_ac = dist_mat[a, c]
-        r_ab_cov = pair_cov_radii_mat[a, b]
-        r_ac_cov = pair_cov_radii_mat[a, c]
+    bond_inds = get_bond_sets(geom.atoms, geom.coords3d, geom.internal.bond_factor)
+    bond_nums = np.bincount(bond_inds.flatten(), minlength=len(geom.atoms))
+
+    def h_bond(inds, r, r_cov):
+        r_ab, = r.T
+        r_ab_cov, = r_cov.T
+        return 0.3601 * np.exp(-1.944*(r_ab - r_ab_cov))
+
+    def h_bend(inds, r, r_cov):
+        # Central atom is in the middle, so the two pairs are (b, a) and (a, c)
+        r_ab, r_ac = r.T
+        r_ab_cov, r_ac_cov = r_cov.T
         return (0.089 + 0.11/(r_ab_cov*r_ac_cov)**(-0.42)
-                * exp(-0.44*(r_ab + r_ac - r_ab_cov - r_ac_cov))
+                * np.exp(-0.44*(r_ab + r_ac - r_ab_cov - r_ac_cov))
         )
 
-    def h_dihedral(dihedral):
-        # import pdb; pdb.set_trace()
-        c, a, b, d = dihedral.indices
-        r_ab = dist_mat[a, b]
-        r_ab_cov = pair_cov_radii_mat[a, b]
-        bond_sum = max(tors_atom_bonds[(a, b)], 0)
+    def h_dihedral(inds, r, r_cov):
+        # c, a, b, d = dihedral.indices
+        r_ab = r[:, 1]
+        r_ab_cov = r_cov[:, 1]
+        # Substract 2, as we don't want the bond between a and b, but this
+        # bond is counted for both atoms.
+        bond_sum = np.maximum(bond_nums[inds[:, 1]] + bond_nums[inds[:, 2]] - 2, 0)
         return (0.0015 + 14.0*bond_sum**0.57 / (r_ab*r_ab_cov)**4.0
-                * exp(-2.85*(r_ab - r_ab_cov))
+                * np.exp(-2.85*(r_ab - r_ab_cov))
         )
     h_funcs = {
         2: h_bond,
@@ -68,15 +81,13 @@ def fischer_guess(geom):
         4: h_dihedral,
     }
 
-    h_diag = list()
-    for primitive in geom.internal.primitives:
-        f = h_funcs[len(primitive.indices)]
-        h_diag.append(f(primitive))
-    H = np.array(np.diagflat(h_diag))
-    return H
+    h_diag = np.zeros(len(primitives))
+    for atom_num, prim_inds, inds, r, r_cov in get_prim_pair_data(geom):
+        h_diag[prim_inds] = h_funcs[atom_num](inds, r, r_cov)
+    return diag_hessian(h_diag, diagonal)
 
 
-def lindh_guess(geom):
+def lindh_guess(geom, diagonal=False):
     """Slightly modified Lindh model hessian as described in [1].
 
     Instead of using the tabulated r_ref,ij values from [1] we will use the
@@ -87,63 +98,47 @@ def lindh_guess(geom):
     period will be (re)used.
     """
     first_period = "h he".split()
-    def get_alpha(atom1, atom2):
-        if (atom1 in first_period) and (atom2 in first_period):
-            return 1.
-        elif (atom1 in first_period) or (atom2 in first_period):
-            return 0.3949
-        else:
-            return 0.28
-    atoms = [a.lower() for a in geom.atoms]
-    alphas = [get_alpha(a1, a2)
-              for a1, a2 in it.combinations(atoms, 2)]
-    pair_cov_radii = get_pair_covalent_radii(geom.atoms)
-    cdm = pdist(geom.coords3d)
-    rhos = squareform(np.exp(alphas*(pair_cov_radii**2-cdm**2)))
+    in_first_period = np.array([a.lower() in first_period for a in geom.atoms])
+
+    def get_alphas(first, second):
+        first_num = in_first_period[first].astype(int) + in_first_period[second]
+        return np.array((0.28, 0.3949, 1.))[first_num]
 
     k_dict = {
         2: 0.45,  # Stretches/bonds
         3: 0.15,  # Bends/angles
         4: 0.005,  # Torsions/dihedrals
     }
-    k_diag = list()
-    for prim_int in geom.internal.prim_internals:
-        rho_product = 1
-        for i in range(len(prim_int.inds)-1):
-            i1, i2 = prim_int.inds[i:i+2]
-            rho_product *= rhos[i1, i2]
-        k_diag.append(k_dict[len(prim_int.inds)] * rho_product)
-    H = np.diagflat(k_diag)
-    return H
-
-
-def simple_guess(geom):
+    k_diag = np.zeros(len(geom.internal.primitives))
+    for atom_num, prim_inds, inds, r, r_cov in get_prim_pair_data(geom):
+        alphas = get_alphas(inds[:, :-1], inds[:, 1:])
+        rhos = np.exp(alphas*(r_cov**2 - r**2))
+        k_diag[prim_inds] = k_dict[atom_num] * rhos.prod(axis=1)
+    return diag_hessian(k_diag, diagonal)
+
+
+def simple_guess(geom, diagonal=False):
     h_dict = {
         2: 0.5,  # Stretches/bonds
         3: 0.2,  # Bends/angles
         4: 0.1,  # Torsions/dihedrals
     }
     h_diag = [h_dict[len(prim.indices)] for prim in geom.internal.primitives]
-    return np.diagflat(h_diag)
+    return diag_hessian(h_diag, diagonal)
 
 
-def swart_guess(geom):
-    pair_cov_radii = get_pair_covalent_radii(geom.atoms)
-    cdm = pdist(geom.coords3d)
-    rhos = squareform(np.exp(-cdm/pair_cov_radii + 1))
+def swart_guess(geom, diagonal=False):
     k_dict = {
         2: 0.35,
         3: 0.15,
         4: 0.005,
     }
-    k_diag = list()
-    for primitive in geom.internal.primitives:
-        rho_product = 1
-        for i in range(len(primitive.indices)-1):
-            i1, i2 = primitive.indices[i:i+2]
-            rho_product *= rhos[i1, i2]
-        k_diag.append(k_dict[len(primitive.indices)] * rho_product)
-    return np.diagflat(k_diag)
+    primitives = geom.internal.primitives
+    k_diag = np.zeros(len(primitives))
+    for atom_num, prim_inds, inds, r, r_cov in get_prim_pair_data(geom):
+        rhos = np.exp(-r/r_cov + 1)
+        k_diag[prim_inds] = k_dict[atom_num] * rhos.prod(axis=1)
+    return diag_hessian(k_diag, diagonal)
 
 
 def xtb_hessian(geom, gfn=None):
@@ -162,12 +157,16 @@ def xtb_hessian(geom, gfn=None):
 
 
 def get_guess_hessian(geometry, hessian_init, int_gradient=None,
-                      cart_gradient=None, h5_fn=None):
+                      cart_gradient=None, h5_fn=None, diagonal=False):
     """Obtain/calculate (model) Hessian.
 
     For hessian_init="calc" the Hessian will be in the coord_type
     of the geometry, otherwise a Hessian in primitive internals will
     be returned.
+
+    With diagonal=True, diagonal Hessians in internal coordinates (the
+    model Hessians and the unit Hessian) are returned as 1d arrays holding
+    only the diagonal.
     """
     model_hessian = hessian_init in ("fischer", "lindh", "simple", "swart")
     target_coord_type = geometry.coord_type
@@ -180,15 +179,16 @@ def get_guess_hessian(geometry, hessian_init, int_gradient=None,
         # Calculate true hessian
         "calc": lambda: (geometry.hessian, "calculated exact"),
         # Unit hessian
-        "unit": lambda: (np.eye(geometry.coords.size), "unit"),
+        "unit": lambda: (diag_hessian(np.ones(geometry.coords.size), diagonal),
+                         "unit"),
         # Fischer model hessian
-        "fischer": lambda: (fischer_guess(geometry), "Fischer"),
+        "fischer": lambda: (fischer_guess(geometry, diagonal), "Fischer"),
         # Lindh model hessian
-        "lindh": lambda: (lindh_guess(geometry), "Lindh"),
+        "lindh": lambda: (lindh_guess(geometry, diagonal), "Lindh"),
         # Simple (0.5, 0.2, 0.1) model hessian
-        "simple": lambda: (simple_guess(geometry), "simple"),
+        "simple": lambda: (simple_guess(geometry, diagonal), "simple"),
         # Swart model hessian
-        "swart": lambda: (swart_guess(geometry), "Swart"),
+        "swart": lambda: (swart_guess(geometry, diagonal), "Swart"),
         # XTB hessian using GFN-2
         "xtb": lambda: (xtb_hessian(geometry, gfn=2), "GFN2-XTB"),
         # XTB hessian using GFN-1
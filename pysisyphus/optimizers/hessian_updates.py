@@ -172,6 +172,35 @@ def bofill_update(H, dx, dg):
     return bofill_update, "Bofill"
 
 
+def bfgs_update_factors(H, dx, dg):
+    """Factors (U, C) of the BFGS update dH = U @ C @ U.T.
+
+    H only has to support matrix-vector products, so it may also be
+    given in a compact (low-rank) representation."""
+    Hdx = H @ dx
+    U = np.stack((dg, Hdx), axis=1)
+    C = np.diag((1 / dg.dot(dx), -1 / dx.dot(Hdx)))
+    return U, C, "BFGS"
+
+
+def bofill_update_factors(H, dx, dg):
+    """Factors (U, C) of the Bofill update dH = U @ C @ U.T. See
+    bfgs_update_factors."""
+    z = dg - H @ dx
+    zdx = z.dot(dx)
+    dxdx = dx.dot(dx)
+    # Bofill mixing-factor
+    mix = zdx**2 / (z.dot(z) * dxdx)
+    U = np.stack((z, dx), axis=1)
+    # SR1 contributes to the (z, z) element, PSB to all elements
+    psb = (1 - mix) / dxdx
+    C = np.array((
+        (mix / zdx, psb),
+        (psb, -psb * zdx / dxdx),
+    ))
+    return U, C, "Bofill"
+
+
 """
 def multi_step_update(H, coords, gradients, energies, last_cycles=3,
                       key="flowchart"):
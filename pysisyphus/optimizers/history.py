@@ -0,0 +1,196 @@
+from collections.abc import MutableSequence
+
+import h5py
+import numpy as np
+
+
+class HistoryStore:
+
+    def __init__(self, fn, group_name, chunk_size=64, compression=None):
+        """HDF5 group that receives the cycles spilled from histories.
+
+        The file is opened once, on the first access, and stays open until
+        close() is called. Every item is stored flattened in a chunked,
+        variable-length dataset, together with its original shape.
+
+        Parameters
+        ----------
+        fn : str or Path
+            HDF5 file name.
+        group_name : str
+            Name of the group holding the datasets. An already present
+            group of the same name is replaced.
+        chunk_size : int, optional
+            Number of cycles per HDF5 chunk.
+        compression : str, optional
+            HDF5 compression filter, e.g., "gzip" or "lzf".
+        """
+        self.fn = fn
+        self.group_name = group_name
+        self.chunk_size = int(chunk_size)
+        self.compression = compression
+
+        self.handle = None
+        self.group = None
+        # An already present group is only replaced on the first opening
+        self.initialized = False
+
+    @property
+    def is_open(self):
+        return self.handle is not None
+
+    def open(self):
+        if self.is_open:
+            return
+        self.handle = h5py.File(self.fn, mode="a")
+        if not self.initialized:
+            if self.group_name in self.handle:
+                del self.handle[self.group_name]
+            self.handle.create_group(self.group_name)
+            self.initialized = True
+        self.group = self.handle[self.group_name]
+
+    def close(self):
+        if self.is_open:
+            self.handle.close()
+        self.handle = None
+        self.group = None
+
+    def get_datasets(self, name):
+        self.open()
+        if name not in self.group:
+            for key, dtype in ((name, np.float64), (f"{name}_shapes", np.int64)):
+                self.group.create_dataset(
+                    key,
+                    shape=(0, ),
+                    maxshape=(None, ),
+                    chunks=(self.chunk_size, ),
+                    dtype=h5py.vlen_dtype(dtype),
+                    compression=self.compression,
+                )
+        return self.group[name], self.group[f"{name}_shapes"]
+
+    def write(self, name, index, item):
+        data, shapes = self.get_datasets(name)
+        if index >= data.shape[0]:
+            data.resize((index + 1, ))
+            shapes.resize((index + 1, ))
+        item = np.asarray(item, dtype=float)
+        data[index] = item.flatten()
+        shapes[index] = np.array(item.shape, dtype=np.int64)
+
+    def read(self, name, index):
+        data, shapes = self.get_datasets(name)
+        item = data[index].reshape(shapes[index])
+        if item.ndim == 0:
+            item = float(item)
+        return item
+
+    def flush(self):
+        if self.is_open:
+            self.handle.flush()
+
+
+class History(MutableSequence):
+
+    def __init__(self, name, window=None, store=None):
+        """List of per-cycle optimizer data with a bounded in-memory part.
+
+        Only the last 'window' items are kept in memory. Older items are
+        written to the HistoryStore and are read back from it when they are
+        accessed. Without a window all items stay in memory and the history
+        behaves like a plain list.
+
+        Parameters
+        ----------
+        name : str
+            Name of the datasets in the store.
+        window : int, optional
+            Number of items kept in memory.
+        store : HistoryStore, optional
+            Receives the items that drop out of the window. Required when
+            a window is given.
+        """
+        self.name = name
+        if window is not None:
+            window = int(window)
+            assert window > 0, "History window must be positive!"
+            assert store is not None, "A bounded history needs a store!"
+        self.window = window
+        self.store = store
+
+        self._items = list()
+        # Number of items that were moved to the store
+        self._spilled = 0
+
+    @property
+    def spilled(self):
+        return self._spilled
+
+    def _normalize_index(self, index, allow_end=False):
+        size = len(self)
+        if index < 0:
+            index += size
+        upper = size + 1 if allow_end else size
+        if not (0 <= index < upper):
+            raise IndexError("History index out of range")
+        return index
+
+    def _spill(self):
+        if self.window is None:
+            return
+        while len(self._items) > self.window:
+            self.store.write(self.name, self._spilled, self._items.pop(0))
+            self._spilled += 1
+
+    def __len__(self):
+        return self._spilled + len(self._items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = self._normalize_index(index)
+        if index >= self._spilled:
+            return self._items[index - self._spilled]
+        return self.store.read(self.name, index)
+
+    def __setitem__(self, index, item):
+        if isinstance(index, slice):
+            indices = range(*index.indices(len(self)))
+            items = list(item)
+            if len(indices) != len(items):
+                raise ValueError("History slices can only be replaced by "
+                                 "the same number of items!")
+            for i, item_ in zip(indices, items):
+                self[i] = item_
+            return
+        index = self._normalize_index(index)
+        if index >= self._spilled:
+            self._items[index - self._spilled] = item
+        else:
+            self.store.write(self.name, index, item)
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            for i in sorted(range(*index.indices(len(self))), reverse=True):
+                del self[i]
+            return
+        index = self._normalize_index(index)
+        if index < self._spilled:
+            raise IndexError("Can't delete items that were already spilled!")
+        del self._items[index - self._spilled]
+
+    def insert(self, index, item):
+        index = self._normalize_index(index, allow_end=True)
+        if index < self._spilled:
+            raise IndexError("Can't insert before items that were already spilled!")
+        self._items.insert(index - self._spilled, item)
+        self._spill()
+
+    def clear(self):
+        self._items = list()
+        self._spilled = 0
+
+    def __repr__(self):
+        return (f"History(name={self.name}, len={len(self)}, "
+                f"window={self.window}, spilled={self._spilled})")
@@ -1,11 +1,12 @@
 import itertools as it
 
 import numpy as np
-from scipy.spatial.distance import pdist, squareform
-from scipy.sparse import csc_matrix
+from scipy.sparse import coo_matrix
+from scipy.sparse.linalg import factorized
 
-from pysisyphus.intcoords.setup import get_pair_covalent_radii
+from pysisyphus.elem_data import COVALENT_RADII as CR
 from pysisyphus.intcoords.derivatives import dq_b, dq_a, dq_d
+from pysisyphus.intcoords.eval import vectorize_derivative
 from pysisyphus.intcoords import RedundantCoords
 
 
@@ -13,8 +14,11 @@ from pysisyphus.intcoords import RedundantCoords
 #     Mones, 2018
 
 
+FIRST_PERIOD = ("h", "he")
+
+
 def get_lindh_alpha(atom1, atom2):
-    first_period = ("h", "he")
+    first_period = FIRST_PERIOD
 
     if (atom1 in first_period) and (atom2 in first_period):
         return 1.
@@ -33,11 +37,12 @@ def get_lindh_k(atoms, coords3d, bonds=None, angles=None, torsions=None):
         torsions = list()
 
     atoms = [a.lower() for a in atoms]
-
-    alphas = [get_lindh_alpha(a1, a2) for a1, a2 in it.combinations(atoms, 2)]
-    pair_cov_radii = get_pair_covalent_radii(atoms)
-    cdm = pdist(coords3d)
-    rhos = squareform(np.exp(alphas*(pair_cov_radii**2-cdm**2)))
+    cov_radii = np.array([CR[atom] for atom in atoms])
+    # Lindh alphas, indexed by the number of first period atoms in a pair
+    alpha_table = np.array(
+        [get_lindh_alpha(*pair) for pair in (("c", "c"), ("h", "c"), ("h", "h"))]
+    )
+    first_period = np.array([atom in FIRST_PERIOD for atom in atoms], dtype=int)
 
     k_dict = {
         2: 0.45,  # Stretches/bonds
@@ -45,19 +50,33 @@ def get_lindh_k(atoms, coords3d, bonds=None, angles=None, torsions=None):
         4: 0.005, # Torsions/dihedrals
     }
     ks = list()
-    for inds in it.chain(bonds, angles, torsions):
-        rho_product = 1
-        for i in range(len(inds)-1):
-            i1, i2 = inds[i:i+2]
-            rho_product *= rhos[i1, i2]
-        ks.append(k_dict[len(inds)] * rho_product)
+    # Only the pairs of consecutive atoms in the primitives are needed
+    for atom_num, inds in zip((2, 3, 4), (bonds, angles, torsions)):
+        inds = np.array(inds, dtype=int).reshape(-1, atom_num)
+        first, second = inds[:, :-1], inds[:, 1:]
+        dists = np.linalg.norm(coords3d[first] - coords3d[second], axis=2)
+        alphas = alpha_table[first_period[first] + first_period[second]]
+        pair_cov_radii = cov_radii[first] + cov_radii[second]
+        rhos = np.exp(alphas*(pair_cov_radii**2-dists**2))
+        ks.extend(k_dict[atom_num] * rhos.prod(axis=1))
     return ks
 
 
+# Vectorized first derivatives of the primitives, indexed by number of atoms
+GRAD_FUNCS = {
+    2: vectorize_derivative(dq_b),
+    3: vectorize_derivative(dq_a),
+    4: vectorize_derivative(dq_d),
+}
+
+
 def get_lindh_precon(atoms, coords, bonds=None, bends=None, dihedrals=None,
                      c_stab=0.0103):
     """c_stab = 0.00103 hartree/bohr² corresponds to 0.1 eV/Å² as
-    given in the paper."""
+    given in the paper.
+
+    P = Σ_i |k_i| b_i b_i^T + c_stab·1 is assembled directly in COO format
+    from the local (3k, 3k) blocks of the k atoms of every primitive."""
 
     if bonds is None:
         bonds = list()
@@ -70,50 +89,78 @@ def get_lindh_precon(atoms, coords, bonds=None, bends=None, dihedrals=None,
     c3d = coords.reshape(-1, 3)
 
     # Calculate Lindh force constants
-    ks = get_lindh_k(atoms, c3d, bonds, bends)
-
-    grad_funcs = {
-        # Bond
-        2: lambda i, j: dq_b(*c3d[i], *c3d[j]),
-        # Bend
-        3: lambda i, j, k: dq_a(*c3d[i], *c3d[j], *c3d[k]),
-        # Dihedral
-        4: lambda i, j, k, l: dq_d(*c3d[i], *c3d[j], *c3d[k]),
-    }
-
-    row = np.zeros(dim)
-    P = np.zeros((dim, dim))
-    for inds, k in zip(it.chain(bonds, bends, dihedrals), ks):
-        # Construct full row
-        cart_inds = list(it.chain(*[range(3*i,3*i+3) for i in inds]))
-
-        # First derivatives of internal coordinates w.r.t cartesian coordinates
-        int_grad = grad_funcs[len(inds)](*inds)
-        # Assign to the correct cartesian indices
-        full_row = row.copy()
-        full_row[cart_inds] = int_grad
-        P += np.outer(full_row, full_row*abs(k))
-
-    # Add stabilization to diagonal
-    P += c_stab*np.eye(dim)
-    # Convert to sparse matrix
-    P = csc_matrix(P)
+    ks = np.abs(get_lindh_k(atoms, c3d, bonds, bends, dihedrals))
+
+    # Stabilization on the diagonal
+    rows = [np.arange(dim)]
+    cols = [np.arange(dim)]
+    data = [np.full(dim, c_stab)]
+    k_offset = 0
+    for atom_num, inds in zip((2, 3, 4), (bonds, bends, dihedrals)):
+        inds = np.array(inds, dtype=int).reshape(-1, atom_num)
+        prim_num = len(inds)
+        if prim_num == 0:
+            continue
+        ks_ = ks[k_offset:k_offset+prim_num]
+        k_offset += prim_num
+        # First derivatives of internal coordinates w.r.t cartesian coordinates,
+        # shape (prim_num, 3*atom_num)
+        int_grads = GRAD_FUNCS[atom_num](*c3d[inds].reshape(prim_num, -1).T).T
+        blocks = np.einsum("pi,pj,p->pij", int_grads, int_grads, ks_)
+        # Cartesian indices belonging to the primitives
+        cart_inds = (3*inds[:, :, None] + np.arange(3)).reshape(prim_num, -1)
+        size_ = cart_inds.shape[1]
+        rows.append(np.repeat(cart_inds, size_, axis=1).flatten())
+        cols.append(np.tile(cart_inds, (1, size_)).flatten())
+        data.append(blocks.flatten())
+    # Duplicate entries are summed upon conversion.
+    P = coo_matrix(
+        (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(dim, dim),
+    ).tocsc()
 
     return P
 
 
-def precon_getter(geometry, c_stab=0.0103):
+def precon_getter(geometry, c_stab=0.0103, rebuild_thresh=0.0, logger=None):
+    """Returns a function that yields the Lindh preconditioner P at given
+    coordinates and a function solving P.x = b.
+
+    The sparse LU factorization of P is cached. P and its factorization are
+    only rebuilt when an atom moved by more than 'rebuild_thresh' (in Bohr)
+    since the last build; the default rebuilds them for any change."""
     atoms = geometry.atoms
     internal = RedundantCoords(atoms, geometry.cart_coords)
     bonds  = internal.bond_indices
     bends = internal.bending_indices
-    dihedrals = internal.dihedrals
+    # Torsions are not included in the preconditioner.
+    dihedrals = None
+
+    cache = {
+        "coords3d": None,
+        "P": None,
+        "solve": None,
+        "builds": 0,
+    }
 
     def wrapper(coords):
-        P = get_lindh_precon(
-                atoms, coords,
-                bonds, bends, dihedrals,
-                c_stab=c_stab,
-        )
-        return P
+        coords3d = coords.reshape(-1, 3)
+        prev_coords3d = cache["coords3d"]
+        if (prev_coords3d is None) or (
+            np.linalg.norm(coords3d - prev_coords3d, axis=1).max() > rebuild_thresh
+        ):
+            P = get_lindh_precon(
+                    atoms, coords,
+                    bonds, bends, dihedrals,
+                    c_stab=c_stab,
+            )
+            cache.update({
+                "coords3d": coords3d.copy(),
+                "P": P,
+                "solve": factorized(P),
+                "builds": cache["builds"] + 1,
+            })
+            if logger is not None:
+                logger.debug(f"Built preconditioner P, build {cache['builds']}.")
+        return cache["P"], cache["solve"]
     return wrapper
@@ -1205,6 +1205,7 @@ def main(run_dict, restart=False, yaml_dir="./", scheduler=None, dryrun=None):
     if run_dict["stocastic"]:
         stoc_key = run_dict["stocastic"].pop("type")
         stoc_kwargs = run_dict["stocastic"]
+        stoc_kwargs["scheduler"] = scheduler
     if run_dict["tsopt"]:
         tsopt_key = run_dict["tsopt"].pop("type")
         tsopt_kwargs = run_dict["tsopt"]
@@ -8,6 +8,7 @@ import rmsd
 from scipy.spatial.distance import pdist
 
 from pysisyphus.calculators.XTB import XTB
+from pysisyphus.executors import map_jobs
 from pysisyphus.helpers import check_for_stop_sign, highlight_text
 from pysisyphus.intcoords.setup import get_pair_covalent_radii
 from pysisyphus.optimizers.RFOptimizer import RFOptimizer
@@ -15,12 +16,36 @@ from pysisyphus.stocastic.align import matched_rmsd
 from pysisyphus.xyzloader import make_trj_str_from_geoms
 
 
+def run_geom_opt(geom, calc_number, calc_getter=None, calc_kwargs=None):
+    """Optimize one geometry. Returns the optimized geometry or None if
+    the optimization failed.
+
+    Module level function, so it can be sent to worker processes."""
+    if calc_getter is not None:
+        calc = calc_getter(calc_number=calc_number)
+        geom.set_calculator(calc)
+        opt_kwargs = {
+            "gdiis": False,
+            "thresh": "gau_loose",
+            "overachieve_factor": 2,
+            "max_cycles": 75,
+        }
+        opt = RFOptimizer(geom, **opt_kwargs)
+        opt.run()
+        opt_geom = geom if opt.is_converged else None
+    else:
+        calc = XTB(calc_number=calc_number, **calc_kwargs)
+        opt_result = calc.run_opt(geom.atoms, geom.coords, keep=False)
+        opt_geom = opt_result.opt_geom
+    return opt_geom
+
+
 class Pipeline:
 
     def __init__(self, geom, calc_getter=None, seed=None, max_cycles=5, cycle_size=15,
                  rmsd_thresh=.1, energy_thresh=1e-3, energy_range=.125,
                  compare_num=25, break_after=2,
-                 calc_kwargs=None):
+                 calc_kwargs=None, executor=None, scheduler=None, max_workers=None):
         self.initial_geom = geom
         self.calc_getter = calc_getter
         self.max_cycles = max_cycles
@@ -40,6 +65,11 @@ class Pipeline:
         }
         if calc_kwargs is not None:
             self.calc_kwargs.update(calc_kwargs)
+        # The optimizations of one cycle are independent and can be
+        # distributed, see pysisyphus.executors.map_jobs.
+        self.executor = executor
+        self.scheduler = scheduler
+        self.max_workers = max_workers
 
         np.random.seed(self.seed)
         self.logger = logging.getLogger("stocastic")
@@ -186,26 +216,30 @@ class Pipeline:
         return unique_geoms
 
     def run_geom_opt(self, geom):
-        if self.calc_getter is not None:
-            calc = self.calc_getter(calc_number=self.calc_counter)
-            geom.set_calculator(calc)
-            opt_kwargs = {
-                "gdiis": False,
-                "thresh": "gau_loose",
-                "overachieve_factor": 2,
-                "max_cycles": 75,
-            }
-            opt = RFOptimizer(geom, **opt_kwargs)
-            opt.run()
-            opt_geom = geom if opt.is_converged else None
-        else:
-            calc = XTB(calc_number=self.calc_counter, **self.calc_kwargs)
-            opt_result = calc.run_opt(geom.atoms, geom.coords, keep=False)
-            opt_geom = opt_result.opt_geom
-
+        opt_geom = run_geom_opt(geom, self.calc_counter, self.calc_getter,
+                                self.calc_kwargs)
         self.calc_counter += 1
         return opt_geom
 
+    def run_geom_opts(self, geoms):
+        """Optimize all geometries, possibly in parallel. Every optimization
+        gets its own calculator number. The optimized geometries are returned
+        in input order, independent of the order in which they finished."""
+        args_list = [
+            (geom, self.calc_counter + i, self.calc_getter, self.calc_kwargs)
+            for i, geom in enumerate(geoms)
+        ]
+        self.calc_counter += len(geoms)
+
+        opt_geoms = [None for _ in geoms]
+        jobs = map_jobs(run_geom_opt, args_list, kind=self.executor,
+                        scheduler=self.scheduler, max_workers=self.max_workers)
+        for finished, (index, opt_geom) in enumerate(jobs, 1):
+            print(f"Optimized geometry {finished:03d}/{len(geoms):03d}", end="\r")
+            opt_geoms[index] = opt_geom
+        print()
+        return opt_geoms
+
     def write_geoms_to_trj(self, geoms, fn, comments=None):
         with open(fn, "w") as handle:
             handle.write(
@@ -222,11 +256,7 @@ class Pipeline:
             self.write_geoms_to_trj(input_geoms, f"cycle_{self.cur_cycle:03d}_input.trj")
             # Run optimizations on input geometries
             calc_start = time.time()
-            opt_geoms = list()
-            for i, geom in enumerate(input_geoms, 1):
-                print(f"Optimizing geometry {i:03d}/{self.cycle_size:03d}", end="\r")
-                opt_geoms.append(self.run_geom_opt(geom))
-            print()
+            opt_geoms = self.run_geom_opts(input_geoms)
             calc_end = time.time()
             calc_duration = calc_end - calc_start
             self.log(f"Optimizations took {calc_duration:.0f} s.")
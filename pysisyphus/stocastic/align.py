@@ -3,6 +3,7 @@ import itertools as it
 import numpy as np
 import rmsd as rmsd
 from scipy.optimize import linear_sum_assignment
+from scipy.spatial import cKDTree
 from scipy.spatial.distance import cdist
 
 
@@ -60,6 +61,104 @@ def apply_transform(coords3d, swap, reflection):
     return coords3d
 
 
+# Six possible axis swaps, (3*2, (x, y, z)*((x), (y), (z))).
+SWAPS = np.array(list(it.permutations((0, 1, 2))))
+# Eight possible reflections, (±x, ±y, ±z).
+REFLECTIONS = np.array((
+        ( 1,  1,  1),  # no reflection
+        (-1,  1,  1),  # reflect on yz plane
+        ( 1, -1,  1),  # reflect on xz plane
+        ( 1,  1, -1),  # reflect on xy plane
+        (-1, -1,  1),  # reflect on yz and xz planes
+        (-1,  1, -1),  # reflect on yz and xy planes
+        ( 1, -1, -1),  # reflect on xz and xy planes
+        (-1, -1, -1)   # reflect on yz, xz, xy planes
+))
+
+
+def inertia_tensor(coords3d, masses):
+    """Array version of Geometry.inertia_tensor."""
+    squares = np.sum(coords3d**2 * masses[:, None], axis=0)
+    I = -np.einsum("i,ij,ik->jk", masses, coords3d, coords3d)
+    I[np.diag_indices(3)] = squares.sum() - squares
+    return I
+
+
+def standard_orientation(coords3d, masses):
+    """Array version of Geometry.standard_orientation.
+
+    Returns new coordinates with the center of mass at the origin and the
+    principal axes of inertia along the cartesian axes."""
+    coords3d = coords3d - (coords3d * masses[:, None]).sum(axis=0) / masses.sum()
+    for i in range(5):
+        _, v = np.linalg.eigh(inertia_tensor(coords3d, masses))
+        coords3d = coords3d @ v
+        _, v = np.linalg.eigh(inertia_tensor(coords3d, masses))
+        if np.allclose(v, np.eye(3)):
+            break
+    return coords3d
+
+
+def get_transformed_coords3d(coords3d):
+    """All 48 combinations of axis swaps and reflections at once.
+
+    Returns an array of shape (48, N, 3). The order of the transforms is the
+    same as in it.product(swaps, reflections)."""
+    # (6, N, 3)
+    swapped = coords3d[:, SWAPS].transpose(1, 0, 2)
+    # (6, 8, N, 3)
+    transformed = swapped[:, None, :, :] * REFLECTIONS[None, :, None, :]
+    return transformed.reshape(-1, *coords3d.shape)
+
+
+def matched_rmsd_coords(atoms, coords3d_1, coords3d_2, thresh=5e-2):
+    """RMSD for already centered and oriented coordinates.
+
+    Copy-free core of matched_rmsd. All transforms are applied at once and
+    the atom distances for the Hungarian method are calculated for all
+    transforms in one go. The transforms are then checked in order until
+    one yields an RMSD below 'thresh'.
+
+    Returns
+    -------
+    matched_rmsd : float
+        RMSD of optimally aligned and matched coordinates.
+    matched_coords3d : np.array, shape(N, 3)
+        Coordinates 2, transformed and reordered to match coordinates 1.
+    """
+    transformed = get_transformed_coords3d(coords3d_2)
+    atoms = np.array([atom.lower() for atom in atoms])
+    type_inds = [np.flatnonzero(atoms == atom) for atom in np.unique(atoms)]
+    # Distances between atoms of the same type for all transforms,
+    # shape (48, n_atom, n_atom) per atom type.
+    type_dists = [
+        np.linalg.norm(
+            coords3d_1[None, inds, None, :] - transformed[:, None, inds, :],
+            axis=-1
+        )
+        for inds in type_inds
+    ]
+
+    min_rmsd = np.inf
+    best_coords3d = None
+    for i, c3d_trans in enumerate(transformed):
+        # Reordering of the transformed coordinates
+        order = np.arange(len(atoms))
+        for inds, dists in zip(type_inds, type_dists):
+            _, col_inds = linear_sum_assignment(dists[i])
+            order[inds] = inds[col_inds]
+        c3d_matched = c3d_trans[order]
+        mrmsd = rmsd.kabsch_rmsd(coords3d_1, c3d_matched)
+        if mrmsd < min_rmsd:
+            min_rmsd = mrmsd
+            best_coords3d = c3d_matched
+        # Break when the two geometries are similar. Then we don't have to
+        # apply the remaining transformations.
+        if mrmsd <= thresh:
+            break
+    return min_rmsd, best_coords3d
+
+
 def matched_rmsd(geom1, geom2, thresh=5e-2):
     """RMSD for optimally aligned and matched geometries.
 
@@ -71,57 +170,111 @@ def matched_rmsd(geom1, geom2, thresh=5e-2):
         Tuple of the optimally aligned and matched geometries.
     """
 
-    # Work on copies of the Geometries, as calling standard_orientation
-    # moves their coordinates.
-    geom1_copy = geom1.copy()
-    geom1_copy.standard_orientation()
-    coords3d_1 = geom1_copy.coords3d
-    geom2_copy = geom2.copy()
-    geom2_copy.standard_orientation()
-    coords3d_2 = geom2_copy.coords3d.copy()
-
+    assert len(geom1.atoms) == len(geom2.atoms), \
+        "Atom numbers don't match!"
     # After bringing the Geometries into standard orientation we may
     # still have to consider additional axis swaps and reflections to
     # allow optimal atom matching using the Hungarian method.
-
-    # Six possible axis swaps, (3*2, (x, y, z)*((x), (y), (z))).
-    axes = (0, 1, 2)
-    swaps =  list(it.permutations(axes))
-    # Eight possible reflections, (±x, ±y, ±z).
-    reflections = (
-            ( 1,  1,  1),  # no reflection
-            (-1,  1,  1),  # reflect on yz plane
-            ( 1, -1,  1),  # reflect on xz plane
-            ( 1,  1, -1),  # reflect on xy plane
-            (-1, -1,  1),  # reflect on yz and xz planes
-            (-1,  1, -1),  # reflect on yz and xy planes
-            ( 1, -1, -1),  # reflect on xz and xy planes
-            (-1, -1, -1)   # reflect on yz, xz, xy planes
+    coords3d_1 = standard_orientation(geom1.coords3d, geom1.masses)
+    coords3d_2 = standard_orientation(geom2.coords3d, geom2.masses)
+    min_rmsd, best_coords3d = matched_rmsd_coords(
+        geom1.atoms, coords3d_1, coords3d_2, thresh=thresh
     )
-    # 48 combinations of six axis swaps and eight reflections.
-    transforms = list(it.product(swaps, reflections))
-
-    matched_rmsds = list()
-    matched_coords = list()
-    for i, transform in enumerate(transforms):
-        # Apply swap and reflection
-        c3d_trans = apply_transform(coords3d_2.copy(), *transform)
-        geom2_to_match = geom2.copy()
-        geom2_to_match.coords3d = c3d_trans
-        # Apply Hungarian method to the transformed Geometry
-        geom2_matched = match_geom_atoms(geom1_copy, geom2_to_match)
-        mrmsd = rmsd.kabsch_rmsd(coords3d_1, geom2_matched.coords3d)
-        matched_rmsds.append(mrmsd)
-        matched_coords.append(geom2_matched.coords)
 
-        # Break when the two geometries are similar. Then we don't have to
-        # apply the remaining transformations.
-        if mrmsd <= thresh:
-            break
-
-    matched_rmsds = np.array(matched_rmsds)
-    min_rmsd_ind = matched_rmsds.argmin()
-    min_rmsd = matched_rmsds.min()
-    best_matching_coords = matched_coords[min_rmsd_ind]
-    geom2_copy.coords = best_matching_coords
+    # Only the returned Geometries are copied
+    geom1_copy = geom1.copy()
+    geom1_copy.coords3d = coords3d_1
+    geom2_copy = geom2.copy()
+    geom2_copy.coords3d = best_coords3d
     return min_rmsd, (geom1_copy, geom2_copy)
+
+
+def shape_fingerprint(coords3d):
+    """Sorted singular values of the centered coordinates, divided by sqrt(N).
+
+    Their squares are the principal moments of the unweighted gyration
+    tensor. The fingerprints are invariant under rotations, reflections and
+    permutations and the euclidian distance between two fingerprints is a
+    lower bound to the RMSD of the two structures [3].
+
+        [3] Mirsky, 1960, |σ(A) - σ(B)| <= ||A - B||_F
+    """
+    centered = coords3d - coords3d.mean(axis=0)
+    return np.linalg.svd(centered, compute_uv=False) / np.sqrt(len(coords3d))
+
+
+def distance_fingerprint(atoms, coords3d):
+    """Sorted interatomic distances, grouped by the pair of atom types.
+
+    Each atomic displacement δ_i changes the distance d_ij by at most
+    |δ_i| + |δ_j|, so with the scaling by 1/sqrt(2N(N-1)) the euclidian
+    distance between two fingerprints is a lower bound to the RMSD of the
+    two structures."""
+    atoms = np.array([atom.lower() for atom in atoms])
+    atom_num = len(atoms)
+    i, j = np.triu_indices(atom_num, k=1)
+    dists = np.linalg.norm(coords3d[i] - coords3d[j], axis=1)
+    # Unordered pair of atom types, so it doesn't matter which atom is i
+    pair_types = np.where(atoms[i] < atoms[j],
+                          np.char.add(atoms[i], atoms[j]),
+                          np.char.add(atoms[j], atoms[i]))
+    # Sort by pair type first and by distance second
+    dists = dists[np.lexsort((dists, pair_types))]
+    return dists / np.sqrt(max(2 * atom_num * (atom_num - 1), 1))
+
+
+def get_fingerprints(geom):
+    """Shape and distance fingerprints of a Geometry."""
+    coords3d = geom.coords3d
+    return shape_fingerprint(coords3d), distance_fingerprint(geom.atoms, coords3d)
+
+
+def rmsd_lower_bounds(fingerprints, ref_fingerprints):
+    """Lower bounds to the RMSDs between one and several structures.
+
+    Parameters
+    ----------
+    fingerprints : tuple(np.array, np.array)
+        Shape and distance fingerprint of one structure, see get_fingerprints.
+    ref_fingerprints : list of tuple(np.array, np.array)
+        Fingerprints of the structures to compare to. All structures must
+        have the same composition.
+
+    Returns
+    -------
+    lower_bounds : np.array
+        Lower bounds to the matched RMSDs.
+    """
+    if len(ref_fingerprints) == 0:
+        return np.zeros(0)
+    shape_fp, dist_fp = fingerprints
+    ref_shape_fps, ref_dist_fps = zip(*ref_fingerprints)
+    shape_bounds = np.linalg.norm(np.array(ref_shape_fps) - shape_fp, axis=1)
+    dist_bounds = np.linalg.norm(np.array(ref_dist_fps) - dist_fp, axis=1)
+    return np.maximum(shape_bounds, dist_bounds)
+
+
+def get_similar_pairs(fingerprints, thresh):
+    """Pairs of structures that may have an RMSD below 'thresh'.
+
+    The shape fingerprints are put into a KD-tree, so only pairs that are
+    close in shape have to be considered. The remaining pairs are screened
+    with the distance fingerprints. Pairs with an RMSD below 'thresh' are
+    never discarded.
+
+    Returns
+    -------
+    pairs : np.array, shape(n, 2)
+        Index pairs (i, j) with i < j.
+    """
+    if len(fingerprints) < 2:
+        return np.zeros((0, 2), dtype=int)
+    shape_fps, dist_fps = [np.array(fps) for fps in zip(*fingerprints)]
+    tree = cKDTree(shape_fps)
+    pairs = tree.query_pairs(thresh, output_type="ndarray")
+    if len(pairs) == 0:
+        return np.zeros((0, 2), dtype=int)
+    pairs = np.sort(pairs, axis=1)
+    pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+    dist_bounds = np.linalg.norm(dist_fps[pairs[:, 0]] - dist_fps[pairs[:, 1]], axis=1)
+    return pairs[dist_bounds <= thresh]
@@ -0,0 +1,81 @@
+import asyncio
+import sys
+import time
+
+import pytest
+
+from pysisyphus.calculators.Calculator import Calculator
+from pysisyphus.executors import as_finished, run_batch
+
+
+class SleepCalc(Calculator):
+    """Runs a Python script that sleeps and prints a number."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.base_cmd = sys.executable
+        self.inp_fn = "calc.py"
+        self.parser_funcs = {
+            "energy": self.parse_energy,
+        }
+
+    def prepare_input(self, duration, energy):
+        return f"import time\ntime.sleep({duration})\nprint({energy})"
+
+    def parse_energy(self, path):
+        with open(path / self.out_fn) as handle:
+            return {"energy": float(handle.read())}
+
+
+def get_jobs(calcs, durations):
+    return [
+        lambda budget, calc=calc, i=i, duration=duration: calc.run_async(
+            calc.prepare_input(duration, i), "energy", budget=budget, symlink=False
+        )
+        for i, (calc, duration) in enumerate(zip(calcs, durations))
+    ]
+
+
+def test_run(tmp_path):
+    calc = SleepCalc(out_dir=tmp_path)
+    results = calc.run(calc.prepare_input(0, 1.5), "energy", symlink=False)
+    assert results["energy"] == 1.5
+    assert calc.calc_counter == 1
+
+
+def test_run_async(tmp_path):
+    calcs = [SleepCalc(calc_number=i, out_dir=tmp_path) for i in range(4)]
+
+    start = time.time()
+    results = run_batch(get_jobs(calcs, [0.5] * 4), cores=4)
+    duration = time.time() - start
+    assert [res["energy"] for res in results] == [0, 1, 2, 3]
+    assert all([calc.calc_counter == 1 for calc in calcs])
+    # Calculations ran concurrently
+    assert duration < 1.5
+
+
+@pytest.mark.parametrize(
+    "pal, cores, min_duration", [
+        (1, 2, 0.5),
+        (2, 2, 0.9),
+    ]
+)
+def test_core_budget(pal, cores, min_duration, tmp_path):
+    calcs = [SleepCalc(calc_number=i, pal=pal, out_dir=tmp_path) for i in range(2)]
+
+    start = time.time()
+    run_batch(get_jobs(calcs, [0.5, 0.5]), cores=cores)
+    duration = time.time() - start
+    assert min_duration <= duration < min_duration + 1.0
+
+
+def test_as_finished(tmp_path):
+    calcs = [SleepCalc(calc_number=i, out_dir=tmp_path) for i in range(3)]
+    jobs = get_jobs(calcs, [0.6, 0.1, 0.3])
+
+    async def collect():
+        return [index async for index, _ in as_finished(jobs, cores=3)]
+
+    assert asyncio.run(collect()) == [1, 2, 0]
@@ -0,0 +1,112 @@
+from distributed import LocalCluster
+import numpy as np
+import pytest
+
+from pysisyphus.calculators.AnaPot import AnaPot
+from pysisyphus.calculators.LennardJones import LennardJones
+from pysisyphus.cos.NEB import NEB
+from pysisyphus.executors import get_executor
+from pysisyphus.helpers import geom_loader
+from pysisyphus.interpolate.Interpolator import Interpolator
+from pysisyphus.optimizers.LBFGS import LBFGS
+
+
+class CountingLJ(LennardJones):
+
+    def get_forces(self, atoms, coords):
+        results = super().get_forces(atoms, coords)
+        self.calc_counter += 1
+        return results
+
+
+def get_lj_geoms(num=4):
+    geom = geom_loader("lib:ar14cluster.xyz")
+    geoms = list()
+    for i in range(num):
+        geom_ = geom.copy()
+        geom_.coords = geom.coords + 0.01 * i
+        geom_.set_calculator(CountingLJ())
+        geoms.append(geom_)
+    return geoms
+
+
+@pytest.mark.parametrize(
+    "kind", [
+        "serial",
+        "thread",
+        "process",
+        "async",
+    ]
+)
+def test_executors(kind):
+    geoms = get_lj_geoms()
+    ref_results = [geom.calculator.get_forces(geom.atoms, geom.cart_coords)
+                   for geom in geoms]
+
+    with get_executor(kind, max_workers=2) as executor:
+        for _ in range(2):
+            all_results = executor.calc_geoms(geoms)
+        for results, ref in zip(all_results, ref_results):
+            assert results["energy"] == pytest.approx(ref["energy"])
+            np.testing.assert_allclose(results["forces"], ref["forces"])
+
+        # Calculators are only registered once and their state is synced
+        # after every calculation.
+        assert len(executor.calcs) == len(geoms)
+        assert all([geom.calculator.calc_counter == 3 for geom in geoms])
+
+        # Calculators of geometries that are gone are unregistered
+        executor.retain([geom.calculator for geom in geoms[1:]])
+        assert len(executor.calcs) == len(geoms) - 1
+
+        executor.fetch_calculators(geoms)
+        assert len(executor.calcs) == 0
+    assert executor.is_shut_down
+    assert all([geom.calculator.calc_counter == 3 for geom in geoms])
+
+
+def test_dask_executor():
+    geoms = get_lj_geoms()
+    ref_energies = [geom.energy for geom in geoms]
+
+    with LocalCluster(n_workers=2, processes=False) as cluster:
+        executor = get_executor("dask", scheduler=cluster.scheduler_address)
+        for _ in range(2):
+            all_results = executor.calc_geoms(geoms)
+        # Local calculator state is synced after every calculation
+        assert all([geom.calculator.calc_counter == 2 for geom in geoms])
+        local_calcs = [geom.calculator for geom in geoms]
+        executor.fetch_calculators(geoms)
+        executor.shutdown()
+
+    # Calculators fetched from the workers carry the same state
+    assert all([geom.calculator is not calc
+                for geom, calc in zip(geoms, local_calcs)])
+    assert all([geom.calculator.calc_counter == 2 for geom in geoms])
+    energies = [results["energy"] for results in all_results]
+    np.testing.assert_allclose(energies, ref_energies)
+
+
+@pytest.mark.parametrize(
+    "executor", [
+        None,
+        "thread",
+        "process",
+        "async",
+    ]
+)
+def test_neb_executor(executor):
+    initial = AnaPot.get_geom((-1.05274, 1.02776, 0))
+    final = AnaPot.get_geom((1.94101, 3.85427, 0))
+    interpol = Interpolator((initial, final), between=5)
+    images = interpol.interpolate_all()
+    for image in images:
+        image.set_calculator(AnaPot())
+
+    neb = NEB(images, fix_ends=True, k_min=0.01, executor=executor)
+    opt = LBFGS(neb, gamma_mult=True)
+    opt.run()
+
+    assert opt.is_converged
+    assert opt.cur_cycle == 12
+    assert neb.executor is None
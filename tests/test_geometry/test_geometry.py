@@ -1,7 +1,13 @@
+import time
+
 import numpy as np
 import pytest
 
-from pysisyphus.Geometry import get_trans_rot_vectors
+from pysisyphus.Geometry import (
+    Geometry,
+    get_trans_rot_projector,
+    get_trans_rot_vectors,
+)
 from pysisyphus.helpers import geom_loader
 
 
@@ -44,3 +50,42 @@ def test_trans_rot_vec(geom, this_dir):
 
     trv = get_trans_rot_vectors(geom.cart_coords, geom.masses)
     np.testing.assert_allclose(trv, vecs)
+
+
+def test_mass_weighting(geom):
+    np.random.seed(20201019)
+    H = np.random.rand(geom.cart_coords.size, geom.cart_coords.size)
+    H = H + H.T
+    mm_sqrt_inv = geom.mm_sqrt_inv
+
+    ref_mw_H = mm_sqrt_inv.dot(H).dot(mm_sqrt_inv)
+    mw_H = geom.mass_weigh_hessian(H)
+    np.testing.assert_allclose(mw_H, ref_mw_H)
+    np.testing.assert_allclose(geom.unweight_mw_hessian(mw_H), H)
+
+    P = get_trans_rot_projector(geom.cart_coords, geom.masses)
+    np.testing.assert_allclose(geom.eckart_projection(mw_H), P.T.dot(mw_H).dot(P),
+                               atol=1e-12)
+
+
+@pytest.mark.benchmark
+def test_mass_weighting_1000_atoms():
+    atoms = ("C", "H", "O", "N") * 250
+    np.random.seed(20201019)
+    geom = Geometry(atoms, 10 * np.random.rand(len(atoms) * 3))
+    H = np.random.rand(geom.cart_coords.size, geom.cart_coords.size)
+    H = H + H.T
+
+    start = time.time()
+    mw_H = geom.eckart_projection(geom.mass_weigh_hessian(H))
+    dur = time.time() - start
+
+    mm_sqrt_inv = geom.mm_sqrt_inv
+    P = get_trans_rot_projector(geom.cart_coords, geom.masses)
+    ref_start = time.time()
+    ref_mw_H = P.T.dot(mm_sqrt_inv.dot(H).dot(mm_sqrt_inv)).dot(P)
+    ref_dur = time.time() - ref_start
+    print(f"Mass-weighting and projection: {dur:.2f} s, dense reference: {ref_dur:.2f} s")
+
+    np.testing.assert_allclose(mw_H, ref_mw_H, atol=1e-10)
+    assert geom.masses_rep.size == H.shape[0]
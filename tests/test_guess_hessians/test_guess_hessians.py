@@ -2,7 +2,7 @@ import pytest
 
 from pysisyphus.calculators.PySCF import PySCF
 from pysisyphus.helpers import geom_loader, do_final_hessian
-from pysisyphus.optimizers.guess_hessians import ts_hessian
+from pysisyphus.optimizers.guess_hessians import get_guess_hessian, ts_hessian
 from pysisyphus.optimizers.RFOptimizer import RFOptimizer
 from pysisyphus.tsoptimizers.RSPRFOptimizer import RSPRFOptimizer
 from pysisyphus.tsoptimizers.RSIRFOptimizer import RSIRFOptimizer
@@ -44,6 +44,29 @@ def test_guess_hessians(hessian_init, ref_cycle):
     assert geom.energy == pytest.approx(-150.65298169)
 
 
+@pytest.mark.parametrize(
+    "hessian_init", [
+        "fischer",
+        "lindh",
+        "simple",
+        "swart",
+    ]
+)
+def test_diagonal_guess_hessians(hessian_init):
+    geom = geom_loader("lib:h2o2_hf_321g_opt.xyz", coord_type="redund")
+
+    H, _ = get_guess_hessian(geom, hessian_init)
+    H_diag, _ = get_guess_hessian(geom, hessian_init, diagonal=True)
+    assert H_diag.shape == (len(geom.internal.primitives), )
+    np.testing.assert_allclose(np.diag(H_diag), H)
+
+    # Backtransformation to Cartesians
+    cart_geom = geom.copy(coord_type="cart")
+    H_cart, _ = get_guess_hessian(cart_geom, hessian_init, diagonal=True)
+    B = geom.internal.B
+    np.testing.assert_allclose(H_cart, B.T.dot(H).dot(B), atol=1e-12)
+
+
 @using("pyscf")
 def test_ts_hessian():
     H = np.diag((1, 0.5, 0.25))
@@ -4,7 +4,16 @@ import pytest
 from pysisyphus.calculators import XTB
 from pysisyphus.calculators.PySCF import PySCF
 from pysisyphus.helpers import geom_loader
-from pysisyphus.intcoords import Bend, LinearBend, Stretch, Bend, Torsion
+from pysisyphus.intcoords import (
+    Bend,
+    LinearBend,
+    LinearDisplacement,
+    OutOfPlane,
+    Stretch,
+    Torsion,
+)
+from pysisyphus.intcoords.eval import eval_primitives, get_cart_inds, PrimitiveBatch
+from pysisyphus.intcoords.setup import get_bond_sets, get_fragments_from_bonds
 from pysisyphus.optimizers.RFOptimizer import RFOptimizer
 from pysisyphus.testing import using
 
@@ -37,8 +46,15 @@ def test_compare_biaryl():
 
 
 @using("pyscf")
-def test_allene_opt():
-    geom = geom_loader("lib:08_allene.xyz", coord_type="redund")
+@pytest.mark.parametrize(
+    "sparse", [
+        False,
+        True,
+    ]
+)
+def test_allene_opt(sparse):
+    geom = geom_loader("lib:08_allene.xyz", coord_type="redund",
+                       coord_kwargs={"sparse": sparse})
 
     calc = PySCF(basis="321g", pal=1)
     geom.set_calculator(calc)
@@ -56,3 +72,188 @@ def test_hydrogen_bonds_fragments():
     int_ = geom.internal
     assert len(int_.hydrogen_bond_indices) == 1
     assert len(int_.fragments) == 3
+
+
+@pytest.mark.parametrize(
+    "xyz_fn", [
+        "lib:h2o2_hf_321g_opt.xyz",
+        "lib:biaryl_bare_pm6_splined_hei.xyz",
+        # Contains linear bends
+        "lib:08_allene.xyz",
+    ]
+)
+def test_sparse_B(xyz_fn):
+    dense = geom_loader(xyz_fn, coord_type="redund").internal
+    sparse = geom_loader(xyz_fn, coord_type="redund",
+                         coord_kwargs={"sparse": True}).internal
+
+    # Only local gradients are stored in sparse mode
+    for prim_int in sparse.prim_internals:
+        assert prim_int.grad.size == 3 * len(prim_int.inds)
+    B_sparse = sparse.B_prim_sparse
+    assert B_sparse.nnz == sum([3 * len(pi.inds) for pi in sparse.prim_internals])
+    np.testing.assert_allclose(B_sparse.toarray(), dense.B_prim, atol=1e-14)
+
+    np.random.seed(20201018)
+    cart_forces = np.random.rand(dense.coords3d.size)
+    np.testing.assert_allclose(
+        sparse.transform_forces(cart_forces),
+        dense.transform_forces(cart_forces),
+        atol=1e-10,
+    )
+
+    vec = np.random.rand(len(dense.prim_coords))
+    int_step = 0.01 * dense.project_vector(vec)
+    np.testing.assert_allclose(
+        sparse.project_vector(vec), dense.project_vector(vec), atol=1e-10
+    )
+
+    cart_step = sparse.transform_int_step(int_step)
+    ref_cart_step = dense.transform_int_step(int_step)
+    np.testing.assert_allclose(cart_step, ref_cart_step, atol=1e-10)
+    np.testing.assert_allclose(sparse.prim_coords, dense.prim_coords, atol=1e-10)
+
+
+def test_sparse_B_dlc():
+    xyz_fn = "lib:biaryl_bare_pm6_splined_hei.xyz"
+    dense = geom_loader(xyz_fn, coord_type="dlc").internal
+    sparse = geom_loader(xyz_fn, coord_type="dlc",
+                         coord_kwargs={"sparse": True}).internal
+
+    # DLCs are only defined up to rotations in degenerate subspaces, so the
+    # projectors onto the active space are compared.
+    np.testing.assert_allclose(
+        sparse.U.dot(sparse.U.T), dense.U.dot(dense.U.T), atol=1e-8
+    )
+
+    np.random.seed(20201018)
+    cart_forces = np.random.rand(dense.coords3d.size)
+    int_forces = sparse.transform_forces(cart_forces)
+    # Compare in primitive internals
+    np.testing.assert_allclose(
+        sparse.U.dot(int_forces),
+        dense.U.dot(dense.transform_forces(cart_forces)),
+        atol=1e-8,
+    )
+
+
+@pytest.mark.parametrize(
+    "xyz_fn", [
+        "lib:h2o2_hf_321g_opt.xyz",
+        "lib:biaryl_bare_pm6_splined_hei.xyz",
+        "lib:08_allene.xyz",
+    ]
+)
+@pytest.mark.parametrize(
+    "local", [
+        False,
+        True,
+    ]
+)
+def test_primitive_batch(xyz_fn, local):
+    geom = geom_loader(xyz_fn, coord_type="redund")
+    # Also include primitives that are not set up automatically. Linear
+    # displacements are not vectorized and evaluated one by one.
+    primitives = geom.internal.primitives + [
+        OutOfPlane((0, 1, 2, 3)),
+        OutOfPlane((3, 1, 0, 2)),
+        LinearBend((0, 1, 2)),
+        LinearBend((0, 1, 2), complement=True),
+        LinearDisplacement((0, 1, 2)),
+    ]
+    np.random.seed(20201018)
+    coords3d = geom.coords3d + 0.05 * np.random.rand(*geom.coords3d.shape)
+
+    batch = PrimitiveBatch(primitives)
+    vals, grads = batch.eval(coords3d)
+    assert grads.size == sum([3 * len(prim.indices) for prim in primitives])
+    np.testing.assert_allclose(batch.eval(coords3d, gradient=False), vals)
+
+    ref_prim_ints = eval_primitives(coords3d, primitives, local=local)
+    prim_ints = eval_primitives(coords3d, primitives, local=local, batch=batch)
+    for ref_prim_int, prim_int in zip(ref_prim_ints, prim_ints):
+        assert prim_int.inds == ref_prim_int.inds
+        assert prim_int.val == pytest.approx(ref_prim_int.val, abs=1e-10)
+        np.testing.assert_allclose(prim_int.grad, ref_prim_int.grad, atol=1e-12)
+
+
+@pytest.mark.parametrize(
+    "xyz_fn", [
+        "lib:biaryl_bare_pm6_splined_hei.xyz",
+        "lib:hydrogen_bond_fragments_test.xyz",
+        "lib:thr75_from_1bl8.xyz",
+    ]
+)
+def test_bond_sets_kdtree(xyz_fn):
+    geom = geom_loader(xyz_fn)
+
+    bonds = get_bond_sets(geom.atoms, geom.coords3d)
+    # Bonds from the full condensed distance matrix
+    ref_bonds, _ = get_bond_sets(geom.atoms, geom.coords3d, return_cbm=True)
+    np.testing.assert_equal(bonds, ref_bonds)
+
+
+def test_fragments_from_bonds():
+    fragments = get_fragments_from_bonds(6, ((4, 2), (0, 3), (3, 4)))
+    assert fragments == [
+        frozenset((0, 2, 3, 4)),
+        frozenset((1, )),
+        frozenset((5, )),
+    ]
+
+
+@pytest.mark.parametrize(
+    "xyz_fn", [
+        "lib:h2o2_hf_321g_opt.xyz",
+        "lib:biaryl_bare_pm6_splined_hei.xyz",
+        "lib:08_allene.xyz",
+    ]
+)
+def test_K_matrix(xyz_fn):
+    geom = geom_loader(xyz_fn, coord_type="redund")
+    int_ = geom.internal
+    coords3d = geom.coords3d
+    np.random.seed(20201018)
+    int_gradient = np.random.rand(len(int_.primitives))
+
+    # Primitive-wise reference
+    size_ = coords3d.size
+    ref_K = np.zeros((size_, size_))
+    for primitive, int_grad_item in zip(int_.primitives, int_gradient):
+        val = np.rad2deg(primitive.calculate(coords3d))
+        if isinstance(primitive, Torsion) and ((abs(val) < 1) or (abs(val) > 179)):
+            continue
+        cart_inds = get_cart_inds(primitive.indices)
+        ref_K[np.ix_(cart_inds, cart_inds)] += (
+            int_grad_item * primitive.jacobian(coords3d).reshape(cart_inds.size, -1)
+        )
+
+    K = int_.get_K_matrix(int_gradient)
+    np.testing.assert_allclose(K, ref_K, atol=1e-12)
+    K_sparse = int_.get_K_matrix(int_gradient, sparse=True)
+    np.testing.assert_allclose(K_sparse.toarray(), ref_K, atol=1e-12)
+
+
+@pytest.mark.parametrize("coord_type", ["redund", "dlc"])
+def test_cached_inversions(coord_type):
+    geom = geom_loader("lib:h2o2_hf_321g_opt.xyz", coord_type=coord_type)
+    int_ = geom.internal
+    B = int_.B
+    ref_B_inv = np.linalg.pinv(B, rcond=1e-8)
+
+    counter = int_.inversion_counter
+    np.testing.assert_allclose(int_.B_inv, ref_B_inv, atol=1e-10)
+    np.testing.assert_allclose(int_.Bt_inv, ref_B_inv.T, atol=1e-10)
+    np.testing.assert_allclose(int_.P, B.dot(ref_B_inv), atol=1e-10)
+    # B⁺, (B^T)⁺ and P are derived from one inversion
+    assert int_.inversion_counter == counter + 1
+    int_.Bt_inv_prim
+    int_.B_inv_prim
+    assert int_.inversion_counter == counter + 2
+
+    # Updated coordinates invalidate the cached inverses
+    geom.coords = geom.coords + 0.01
+    np.testing.assert_allclose(
+        int_.B_inv, np.linalg.pinv(int_.B, rcond=1e-8), atol=1e-10
+    )
+    assert int_.inversion_counter > counter + 2
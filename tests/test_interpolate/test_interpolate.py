@@ -1,5 +1,8 @@
+import numpy as np
 import pytest
+from scipy.spatial.distance import pdist, squareform
 
+from pysisyphus.calculators.IDPPCalculator import IDPPCalculator
 from pysisyphus.xyzloader import write_geoms_to_trj
 from pysisyphus.helpers import geom_from_library
 from pysisyphus.interpolate.Interpolator import Interpolator
@@ -39,3 +42,33 @@ def test_ala_dipeptide_interpol(interpol_cls):
     # interpolator.all_geoms_to_trj("interpolated.trj")
 
     assert len(geoms) == 30
+
+
+def test_idpp_calculator():
+    np.random.seed(20201018)
+    coords3d = np.random.rand(25, 3) * 5
+    target = pdist(coords3d + np.random.rand(*coords3d.shape) * 0.3)
+    results = IDPPCalculator(target).get_forces(None, coords3d.flatten())
+
+    # Dense reference, summing over the full distance matrix
+    dists = squareform(pdist(coords3d)) + np.eye(len(coords3d))
+    devs = dists - squareform(target) - np.eye(len(coords3d))
+    ref_energy = 0.5 * (devs**2 / dists**4).sum()
+    D = coords3d[None, :, :] - coords3d[:, None, :]
+    ref_forces = -2 * (
+        (devs * (1 - 2 * devs / dists) / dists**5)[..., None] * D
+    ).sum(0)
+
+    assert results["energy"] == pytest.approx(ref_energy)
+    np.testing.assert_allclose(results["forces"], ref_forces.flatten(), atol=1e-12)
+
+
+def test_idpp_cutoff():
+    initial = geom_from_library("dipeptide_init.xyz")
+    final = geom_from_library("dipeptide_fin.xyz")
+
+    geoms = (initial, final)
+    idpp = IDPP(geoms, 8, align=True, cutoff=5.0)
+    geoms = idpp.interpolate_all()
+
+    assert len(geoms) == 10
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from pysisyphus.calculators.AnaPot import AnaPot
+from pysisyphus.irc import EulerPC
+from pysisyphus.irc.DWI import DWI, LowRankHessian
+from pysisyphus.optimizers.hessian_updates import bofill_update_factors
+
+
+COORDS = np.array((
+    (-0.222, 1.413, 0.),
+    (-0.812, 1.242, 0.),
+    (-1.000, 1.100, 0.),
+))
+
+
+def get_dwi(maxlen, num, low_rank=False):
+    dwi = DWI(maxlen=maxlen)
+    geom = AnaPot.get_geom(COORDS[0])
+    hessian = LowRankHessian(geom.hessian) if low_rank else geom.hessian
+    prev_coords = None
+    prev_grad = None
+    for coords in COORDS[:num]:
+        geom.coords = coords
+        grad = geom.gradient
+        if prev_coords is not None:
+            # Update the Hessian instead of calculating it
+            U, C, _ = bofill_update_factors(
+                hessian, geom.coords - prev_coords, grad - prev_grad
+            )
+            if low_rank:
+                hessian = hessian.updated(U, C)
+            else:
+                hessian = hessian + U @ C @ U.T
+        dwi.update(geom.coords.copy(), geom.energy, grad, hessian)
+        prev_coords = geom.coords.copy()
+        prev_grad = grad
+    return dwi
+
+
+@pytest.mark.parametrize(
+    "maxlen", [2, 3]
+)
+def test_dwi_gradient(maxlen):
+    dwi = get_dwi(maxlen, maxlen)
+    at_coords = np.array((-0.5, 1.3, 0.))
+    _, grad = dwi.interpolate(at_coords, gradient=True)
+
+    step = 1e-5
+    fd_grad = list()
+    for i in range(3):
+        fd_step = np.zeros(3)
+        fd_step[i] = step
+        plus = dwi.interpolate(at_coords + fd_step)
+        minus = dwi.interpolate(at_coords - fd_step)
+        fd_grad.append((plus - minus) / (2 * step))
+    np.testing.assert_allclose(grad, fd_grad, atol=1e-8)
+
+    # Energies at the data points are reproduced
+    for coords, energy in zip(dwi.coords, dwi.energies):
+        assert dwi.interpolate(coords + 1e-10) == pytest.approx(energy)
+
+
+def test_low_rank_dwi():
+    dense_dwi = get_dwi(3, 3)
+    low_rank_dwi = get_dwi(3, 3, low_rank=True)
+    assert low_rank_dwi.hessians[-1].rank == 4
+    for dense, low_rank in zip(dense_dwi.hessians, low_rank_dwi.hessians):
+        np.testing.assert_allclose(low_rank.to_dense(), dense)
+
+    at_coords = np.array((-0.5, 1.3, 0.))
+    ref_energy, ref_grad = dense_dwi.interpolate(at_coords, gradient=True)
+    energy, grad = low_rank_dwi.interpolate(at_coords, gradient=True)
+    assert energy == pytest.approx(ref_energy)
+    np.testing.assert_allclose(grad, ref_grad)
+
+
+def test_low_rank_dwi_h5(tmp_path):
+    dwi = get_dwi(3, 3, low_rank=True)
+    fn = tmp_path / "dwi.h5"
+    dwi.dump(fn)
+    dwi_ = DWI.from_h5(fn)
+
+    # The shared reference is only stored once
+    assert dwi_.hessians[0].reference is dwi_.hessians[-1].reference
+    at_coords = np.array((-0.5, 1.3, 0.))
+    assert dwi_.interpolate(at_coords) == pytest.approx(dwi.interpolate(at_coords))
+
+
+@pytest.mark.parametrize(
+    "dwi_maxlen", [2, 3]
+)
+def test_eulerpc_low_rank_dwi(dwi_maxlen):
+    geom = AnaPot().get_geom((0.61173, 1.49297, 0.))
+
+    irc_kwargs = {
+        "step_length": 0.1,
+        "rms_grad_thresh": 1e-2,
+        "dwi_maxlen": dwi_maxlen,
+        "dwi_low_rank": True,
+    }
+    irc = EulerPC(geom, **irc_kwargs)
+    irc.run()
+
+    forward_ref = np.array((-1.0527, 1.0278, 0.))
+    backward_ref = np.array((1.941, 3.8543, 0.))
+    assert np.linalg.norm(irc.all_coords[0] - forward_ref) == pytest.approx(0.05, abs=0.1)
+    assert np.linalg.norm(irc.all_coords[-1] - backward_ref) == pytest.approx(0.05, abs=0.1)
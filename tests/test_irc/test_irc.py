@@ -48,6 +48,7 @@ def plot_irc(irc, title=None):
         (DampedVelocityVerlet, {"v0": 0.1, "max_cycles": 400,}, None),
         (Euler, {"step_length": 0.05,}, None),
         (EulerPC, {}, None),
+        (EulerPC, {"predictor": "analytic"}, None),
         (GonzalesSchlegel, {}, None),
         (IMKMod, {}, None),
         (RK4, {}, None),
@@ -196,6 +197,27 @@ def test_eulerpc_scipy(scipy_method):
     assert_anapot_irc(irc)
 
 
+def test_eulerpc_analytic_predictor():
+    # Non-stationary point near the TS
+    geom = AnaPot().get_geom((0.5, 1.4, 0.))
+    irc = EulerPC(geom, step_length=0.2, max_pred_steps=20000)
+    irc.mw_hessian = geom.mw_hessian
+
+    init_mw_coords = irc.mw_coords.copy()
+    mw_grad = irc.mw_gradient
+    euler_coords, euler_grad, euler_conv = irc.euler_predictor_step(
+        init_mw_coords, mw_grad
+    )
+    ana_coords, ana_grad, ana_conv = irc.analytic_predictor_step(
+        init_mw_coords, mw_grad
+    )
+    assert euler_conv and ana_conv
+    step_length = np.linalg.norm((ana_coords - init_mw_coords) / irc.m_sqrt)
+    assert step_length == pytest.approx(irc.step_length)
+    np.testing.assert_allclose(ana_coords, euler_coords, atol=5e-5)
+    np.testing.assert_allclose(ana_grad, euler_grad, atol=1e-4)
+
+
 @using("pyscf")
 @pytest.mark.parametrize(
     "hessian_init, ref_cycle", [
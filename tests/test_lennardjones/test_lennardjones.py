@@ -43,3 +43,57 @@ def test_ar_cluster():
 
     assert opt.is_converged
     assert opt.cur_cycle == 93
+
+
+def brute_force_lj(coords3d, calc):
+    a, b = np.triu_indices(len(coords3d), 1)
+    rs = np.linalg.norm(coords3d[a] - coords3d[b], axis=1)
+    rs = rs[rs <= calc.rc]
+    c6 = (calc.sigma / rs) ** 6
+    return np.sum(4 * calc.epsilon * (c6**2 - c6)) - calc.e0 * rs.size
+
+
+def random_lj_coords3d(num, sigma=1.8897261251, seed=20201018):
+    """Random particles at roughly liquid argon density."""
+    np.random.seed(seed)
+    box = (num / 0.8) ** (1 / 3) * sigma
+    return np.random.rand(num, 3) * box
+
+
+def test_verlet_list_reuse():
+    geom = geom_from_library("ar14cluster.xyz")
+    calc = LennardJones()
+    geom.set_calculator(calc)
+    ref_coords = geom.coords.copy()
+    ref_forces = geom.forces
+
+    # Small displacements reuse the neighbour list
+    for _ in range(5):
+        geom.coords = geom.coords + 0.01
+        geom.forces
+    assert calc.neighbours.builds == 1
+
+    # Larger displacements trigger a rebuild
+    coords = geom.coords.copy()
+    coords[:3] += calc.neighbours.skin
+    geom.coords = coords
+    geom.forces
+    assert calc.neighbours.builds == 2
+
+    geom.coords = ref_coords
+    np.testing.assert_allclose(geom.forces, ref_forces, atol=1e-10)
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("num", [100, 1000, 10000])
+def test_lj_neighbour_list_benchmark(num):
+    import time
+
+    coords3d = random_lj_coords3d(num)
+    calc = LennardJones()
+    start = time.time()
+    energy, _ = calc.calculate(coords3d)
+    dur = time.time() - start
+    print(f"{num} particles: {dur:.4f} s, {calc.neighbours.pairs.shape[0]} pairs")
+    if num <= 1000:
+        assert energy == pytest.approx(brute_force_lj(coords3d, calc))
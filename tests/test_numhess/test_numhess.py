@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from pysisyphus.calculators.AnaPot import AnaPot
+from pysisyphus.calculators.LennardJones import LennardJones
+from pysisyphus.helpers import geom_loader
+from pysisyphus.numhess import numerical_hessian
+
+
+@pytest.fixture
+def lj_geom():
+    geom = geom_loader("lib:ar14cluster.xyz")
+    geom.set_calculator(LennardJones())
+    return geom
+
+
+def test_anapot_numhess():
+    geom = AnaPot.get_geom((0.6906, 1.5491, 0.0))
+    ref_H = geom.calculator.get_hessian(geom.atoms, geom.cart_coords)["hessian"]
+
+    results = numerical_hessian(
+        geom.calculator, geom.atoms, geom.cart_coords, step_size=1e-4
+    )
+    np.testing.assert_allclose(results["hessian"], ref_H, atol=1e-6)
+    assert results["energy"] == pytest.approx(geom.energy)
+
+
+@pytest.mark.parametrize(
+    "executor", [
+        None,
+        "process",
+        "async",
+    ]
+)
+def test_numhess_executors(lj_geom, executor):
+    calc = lj_geom.calculator
+    atoms = lj_geom.atoms
+    coords = lj_geom.cart_coords
+
+    ref_H = numerical_hessian(calc, atoms, coords)["hessian"]
+    H = numerical_hessian(calc, atoms, coords, executor=executor, max_workers=2)["hessian"]
+    np.testing.assert_allclose(H, ref_H)
+    np.testing.assert_allclose(H, H.T)
+    # Clones were used, the original calculator was not touched
+    assert calc.calc_counter == 0
+
+
+def test_geometry_numhess(lj_geom):
+    # Calculators without analytical Hessians fall back to finite differences
+    H = lj_geom.cart_hessian
+    ref_H = numerical_hessian(
+        lj_geom.calculator, lj_geom.atoms, lj_geom.cart_coords
+    )["hessian"]
+    np.testing.assert_allclose(H, ref_H)
+
+
+def test_trans_invariant_numhess(lj_geom):
+    args = (lj_geom.calculator, lj_geom.atoms, lj_geom.cart_coords)
+    ref_H = numerical_hessian(*args)["hessian"]
+    H = numerical_hessian(*args, trans_invariant=True)["hessian"]
+    np.testing.assert_allclose(H, ref_H, atol=1e-8)
+
+
+def test_partial_numhess(lj_geom):
+    args = (lj_geom.calculator, lj_geom.atoms, lj_geom.cart_coords)
+    ref_H = numerical_hessian(*args, step_size=1e-4)["hessian"]
+    atom_inds = (0, 3, 4)
+    H = numerical_hessian(*args, step_size=1e-4, atom_inds=atom_inds)["hessian"]
+
+    cart_inds = (3 * np.array(atom_inds)[:, None] + np.arange(3)).flatten()
+    np.testing.assert_allclose(H[cart_inds], ref_H[cart_inds], atol=1e-6)
+    np.testing.assert_allclose(H[:, cart_inds], ref_H[:, cart_inds], atol=1e-6)
+    inactive = np.setdiff1d(np.arange(H.shape[0]), cart_inds)
+    np.testing.assert_allclose(H[np.ix_(inactive, inactive)], 0.0)
+
+
+class FailingLJ(LennardJones):
+
+    def get_forces(self, atoms, coords):
+        if self.calc_number > 20:
+            raise Exception("Interrupted")
+        return super().get_forces(atoms, coords)
+
+
+def test_numhess_restart(lj_geom, tmp_path):
+    atoms = lj_geom.atoms
+    coords = lj_geom.cart_coords
+    ref_H = numerical_hessian(LennardJones(), atoms, coords)["hessian"]
+
+    with pytest.raises(Exception):
+        numerical_hessian(FailingLJ(), atoms, coords, chunk_size=7, restart_dir=tmp_path)
+    assert len(list(tmp_path.glob("*.npz"))) == 21
+
+    H = numerical_hessian(LennardJones(), atoms, coords, restart_dir=tmp_path)["hessian"]
+    np.testing.assert_allclose(H, ref_H)
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from pysisyphus.calculators.AnaPot import AnaPot
+from pysisyphus.helpers import geom_loader
+from pysisyphus.calculators.LennardJones import LennardJones
+from pysisyphus.optimizers.history import History, HistoryStore
+from pysisyphus.optimizers.LBFGS import LBFGS
+from pysisyphus.optimizers.RFOptimizer import RFOptimizer
+
+
+def test_history(tmp_path):
+    store = HistoryStore(tmp_path / "history.h5", "test", chunk_size=2,
+                         compression="gzip")
+    history = History("vecs", window=3, store=store)
+    ref = list()
+    for i in range(10):
+        vec = np.full(4, i, dtype=float)
+        history.append(vec)
+        ref.append(vec)
+
+    assert len(history) == 10
+    assert history.spilled == 7
+    assert len(history._items) == 3
+    np.testing.assert_allclose(history[0], ref[0])
+    np.testing.assert_allclose(history[-1], ref[-1])
+    np.testing.assert_allclose(np.array(history), np.array(ref))
+    np.testing.assert_allclose(np.array(history[::-1][:5]), np.array(ref[::-1][:5]))
+
+    # Spilled items can be updated
+    history[1] = -ref[1]
+    np.testing.assert_allclose(history[1], -ref[1])
+    # but not deleted
+    with pytest.raises(IndexError):
+        history.pop(0)
+    assert history.pop(-1)[0] == 9
+    assert len(history) == 9
+
+    # Scalars are restored as floats
+    energies = History("energies", window=1, store=store)
+    energies.extend([1.0, 2.0])
+    assert energies[0] == 1.0
+    assert isinstance(energies[0], float)
+
+    # The file can be closed and is reopened on access
+    store.close()
+    np.testing.assert_allclose(history[2], ref[2])
+
+
+def get_ar_cluster():
+    geom = geom_loader("lib:ar14cluster.xyz")
+    geom.set_calculator(LennardJones())
+    return geom
+
+
+@pytest.mark.parametrize(
+    "get_geom, opt_cls, opt_kwargs", [
+        (lambda: AnaPot.get_geom((0.667, 1.609, 0.)), LBFGS, {}),
+        (get_ar_cluster, RFOptimizer, {"gdiis": True, "thresh": "gau_tight"}),
+    ]
+)
+def test_bounded_opt_history(get_geom, opt_cls, opt_kwargs, tmp_path):
+    def run(history_window):
+        geom = get_geom()
+        opt = opt_cls(geom, max_cycles=150, dump=True,
+                      h5_fn=tmp_path / f"opt_{history_window}.h5",
+                      history_window=history_window, **opt_kwargs)
+        opt.run()
+        return opt
+
+    ref_opt = run(None)
+    opt = run(5)
+
+    assert opt.is_converged
+    assert opt.cur_cycle == ref_opt.cur_cycle
+    assert opt.forces.spilled > 0
+    assert len(opt.forces._items) == 5
+    np.testing.assert_allclose(np.array(opt.coords), np.array(ref_opt.coords))
+    np.testing.assert_allclose(opt.energies, ref_opt.energies)
@@ -1,6 +1,11 @@
+import itertools as it
+
+import numpy as np
 import pytest
 
-from pysisyphus.helpers import geom_from_library
+from pysisyphus.helpers import geom_from_library, geom_loader
+from pysisyphus.intcoords.derivatives import dq_a, dq_b
+from pysisyphus.optimizers.precon import get_lindh_k, precon_getter
 from pysisyphus.optimizers.PreconSteepestDescent import PreconSteepestDescent
 from pysisyphus.optimizers.PreconLBFGS import PreconLBFGS
 from pysisyphus.calculators.PySCF import PySCF
@@ -57,3 +62,35 @@ def test_menthone(opt_cls, precon, ref_cycles):
 
     assert opt.is_converged
     assert opt.cur_cycle == ref_cycles
+
+
+def test_sparse_lindh_precon():
+    geom = geom_loader("lib:h2o2_hf_321g_opt.xyz")
+    c_stab = 0.0103
+    get_precon = precon_getter(geom, c_stab=c_stab, rebuild_thresh=0.05)
+    P, P_solve = get_precon(geom.cart_coords)
+
+    # Dense reference
+    internal = geom.copy(coord_type="redund").internal
+    bonds = internal.bond_indices
+    bends = internal.bending_indices
+    c3d = geom.coords3d
+    ks = get_lindh_k(geom.atoms, c3d, bonds, bends)
+    dim = geom.cart_coords.size
+    ref_P = c_stab * np.eye(dim)
+    for inds, k in zip(it.chain(bonds, bends), ks):
+        grad_func = dq_b if len(inds) == 2 else dq_a
+        row = np.zeros(dim)
+        cart_inds = list(it.chain(*[range(3*i, 3*i+3) for i in inds]))
+        row[cart_inds] = grad_func(*c3d[inds].flatten())
+        ref_P += abs(k) * np.outer(row, row)
+    np.testing.assert_allclose(P.toarray(), ref_P, atol=1e-14)
+
+    forces = np.random.rand(dim)
+    np.testing.assert_allclose(P.dot(P_solve(forces)), forces)
+
+    # Small displacements reuse P and its factorization
+    P_small, _ = get_precon(geom.cart_coords + 0.01)
+    assert P_small is P
+    P_big, _ = get_precon(geom.cart_coords + 0.1)
+    assert P_big is not P
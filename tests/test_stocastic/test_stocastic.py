@@ -137,6 +137,36 @@ def test_rastrigin():
     # plt.show()
 
 
+def get_rastrigin(calc_number):
+    calc = Rastrigin()
+    calc.calc_number = calc_number
+    return calc
+
+
+@pytest.mark.parametrize(
+    "executor", ["serial", "thread", "process"]
+)
+def test_rastrigin_executor(executor):
+    geom = Rastrigin().get_minima()[0]
+    stoc_kwargs = {
+        "seed": 20180325,
+        "calc_getter": get_rastrigin,
+        "cycle_size": 25,
+        "max_cycles": 10,
+        "radius": 4,
+        "executor": executor,
+        "max_workers": 2,
+    }
+    stoc = Kick(geom, **stoc_kwargs)
+    stoc.run()
+
+    # Same results as the serial run in test_rastrigin
+    assert stoc.cur_cycle == 9
+    assert len(stoc.new_geoms) == 14
+    assert stoc.calc_counter == 250
+    assert min(stoc.new_energies) == pytest.approx(0., abs=1.5e-8)
+
+
 @using("pyscf")
 def test_pyscf_stocastic():
     geom = geom_loader("lib:benzene_and_no.xyz")